@@ -1,10 +1,25 @@
 import os
+import sys
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.column_profile import profile_dataset
+from utils.parquet_reader import compare_memory, iter_frames, list_parquet_files
+from utils.instrumentation import stage, write_report
+
 
 folder_path = '/mnt/bit/zmx/data/data_mining/10G_data_new' 
+# 是否输出全数据集的列画像，以及频繁取值展示个数
+profile_columns = True
+top_n = 10
+# 并行进程数，None 表示使用全部 CPU
+n_workers = None
+# 是否对比默认加载与紧凑加载（Categorical / Arrow 字符串 / 数值降位 / 时间戳）的逐列内存
+memory_report = True
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/data_analysis.json'
 
-parquet_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith('.parquet')]
+parquet_files = list_parquet_files(folder_path)
 
 if not parquet_files:
     print("未找到任何 parquet 文件。")
@@ -12,13 +27,34 @@ else:
     print(f"找到 {len(parquet_files)} 个 parquet 文件，开始分析...\n")
 
 # 读取前几个文件进行展示
-for idx, file in enumerate(parquet_files[:3]): 
-    print(f"📁 文件 {idx+1}: {os.path.basename(file)}")
-    try:
-        df = pd.read_parquet(file)
-        print("🔹 数据类型：\n", df.dtypes)
-        print("🔹 前5行数据：\n", df.head())
-        print("🔹 第一行数据：\n", df.iloc[0])
-    except Exception as e:
-        print(f"读取失败：{e}")
+with stage('preview'):
+    for idx, file in enumerate(parquet_files[:3]):
+        print(f"📁 文件 {idx+1}: {os.path.basename(file)}")
+        try:
+            # 只读取第一个数据块用于展示
+            df = next(iter_frames(file, memory_budget_mb=16))
+            print("🔹 数据类型：\n", df.dtypes)
+            print("🔹 前5行数据：\n", df.head())
+            print("🔹 第一行数据：\n", df.iloc[0])
+        except Exception as e:
+            print(f"读取失败：{e}")
+        print("\n" + "-"*80 + "\n")
+
+# 紧凑加载节省的内存：展示文件各取第一个数据块，逐列对比
+if memory_report and parquet_files:
+    with stage('memory_report'):
+        savings = compare_memory(parquet_files[:3])
+    with pd.option_context('display.max_columns', None, 'display.width', 200, 'display.float_format', '{:.3f}'.format):
+        print("🧮 紧凑加载各列内存（MB）：\n", savings)
     print("\n" + "-"*80 + "\n")
+
+# 列画像：一次并行扫描所有文件，逐列统计缺失、最值、去重数、分位数和频繁项
+if profile_columns and parquet_files:
+    with stage('profile'):
+        profile = profile_dataset(folder_path, n_workers=n_workers)
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print("📊 列画像（去重数、分位数为近似值）：\n", profile.to_frame())
+    for column, top in profile.frequent_items(top_n).items():
+        print(f"\n🏷️ {column} 频繁取值（计数为下界）：\n", top.to_string())
+
+write_report(report_path)
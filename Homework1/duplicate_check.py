@@ -0,0 +1,54 @@
+import os
+import sys
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.dedup import find_duplicates, read_rows
+from utils.instrumentation import stage, write_report
+
+# 检查全局唯一性的列
+key_columns = ['id', 'email', 'user_name']
+# 内存预算（MB）：读取数据块、溢写缓冲和逐桶比对都不超过该值
+memory_budget_mb = 256
+# 每列展示的重复取值个数
+sample_size = 5
+# 展示重复行时读取的列
+display_columns = ['id', 'user_name', 'fullname', 'email', 'registration_date']
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/duplicate_check.json'
+
+def check_global_duplicates(folder_path, name):
+    reports = find_duplicates(folder_path, columns=key_columns, memory_budget_mb=memory_budget_mb,
+                              sample_size=sample_size)
+
+    print(f"\n📂 数据集【{name}】跨文件重复检查：")
+    for column, report in reports.items():
+        print(f"\n🔑 {column} - 非空: {report.non_null}，重复取值: {report.duplicate_values}，"
+              f"多余行: {report.duplicate_rows}，跨文件重复取值: {report.cross_file_values}")
+        if report.samples.empty:
+            continue
+
+        # 按文件读取样例所在的行，再按重复取值排列
+        details = []
+        for fname, locations in report.samples.groupby('file', sort=True):
+            rows = read_rows(os.path.join(folder_path, fname), locations['row'], columns=display_columns)
+            details.append(rows.assign(file=fname))
+        details = pd.concat(details, ignore_index=True).sort_values([column, 'file', 'row'])
+        print(f"🔍 部分重复的 {column} 及其所在行：")
+        print(details[['file', 'row'] + display_columns].to_string(index=False))
+    return reports
+
+
+if __name__ == '__main__':
+    path_10g = './10G_data_new'
+    path_30g = './30G_data_new'
+
+    with stage('10G') as timer:
+        check_global_duplicates(path_10g, name='10G')
+    print(f"10G 重复检查耗时：{timer.seconds:.2f} 秒")
+
+    with stage('30G') as timer:
+        check_global_duplicates(path_30g, name='30G')
+    print(f"30G 重复检查耗时：{timer.seconds:.2f} 秒")
+
+    write_report(report_path)
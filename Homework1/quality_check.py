@@ -1,81 +1,90 @@
 import os
+import sys
 import pandas as pd
-import re
-import time
-
-def is_all_chinese(text):
-    return isinstance(text, str) and all('\u4e00' <= ch <= '\u9fff' for ch in text)
-
-def is_valid_email(email):
-    return isinstance(email, str) and bool(re.match(r"[^@]+@[^@]+\.[^@]+", email))
-
-def is_valid_username(username):
-    return isinstance(username, str) and bool(re.match(r"^[A-Za-z0-9_]+$", username))
-
-def load_dataset(folder_path):
-    all_dfs = []
-    for fname in os.listdir(folder_path):
-        if fname.endswith('.parquet'):
-            file_path = os.path.join(folder_path, fname)
-            try:
-                df = pd.read_parquet(file_path)
-                all_dfs.append(df)
-            except Exception as e:
-                print(f"❌ Error reading {fname}: {e}")
-    if all_dfs:
-        return pd.concat(all_dfs, ignore_index=True)
-    else:
-        print(f"⚠️ No valid parquet files found in {folder_path}")
-        return pd.DataFrame()
-
-def check_id_unique_in_parquet(folder_path):
-    results = []
-    for fname in os.listdir(folder_path):
-        if fname.endswith('.parquet'):
-            file_path = os.path.join(folder_path, fname)
-            try:
-                df = pd.read_parquet(file_path)
-                is_int = pd.api.types.is_integer_dtype(df['id'])
-                is_unique = df['id'].is_unique
-                results.append((fname, is_int, is_unique))
-            except Exception as e:
-                results.append((fname, False, False))
-    return results
-
-def data_quality_check(df, dataset_name):
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.parquet_reader import iter_frames, list_parquet_files
+from utils.instrumentation import stage, write_report
+
+# 字段合法性规则，与逐行 re.match 的判定相同（$ 允许结尾有一个换行符，非字符串一律不合法）
+USERNAME_PATTERN = r"[A-Za-z0-9_]+\n?"  # fullmatch，等价于 re.match(r"^[A-Za-z0-9_]+$")
+FULLNAME_PATTERN = "[\u4e00-\u9fff]*"   # fullmatch，全部为中文字符（空串视为合法）
+EMAIL_PATTERN = r"[^@]+@[^@]+\.[^@]+"    # match，从开头匹配
+
+def count_mismatches(series, pattern, full=False):
+    # 整列正则匹配，缺失值和非字符串视为不合法
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return len(series)
+    matched = series.str.fullmatch(pattern, na=False) if full else series.str.match(pattern, na=False)
+    return int((~matched.astype(bool)).sum())
+
+def chunk_quality_report(df):
     report = {}
 
     # 字段存在性检查
     report['missing_values'] = df.isnull().sum()
 
     # user_name 合法性
-    report['invalid_user_name'] = df[~df['user_name'].apply(is_valid_username)].shape[0]
+    report['invalid_user_name'] = count_mismatches(df['user_name'], USERNAME_PATTERN, full=True)
 
     # fullname 合法性（中文）
-    report['invalid_fullname'] = df[~df['fullname'].apply(is_all_chinese)].shape[0]
+    report['invalid_fullname'] = count_mismatches(df['fullname'], FULLNAME_PATTERN, full=True)
 
     # email 合法性
-    report['invalid_email'] = df[~df['email'].apply(is_valid_email)].shape[0]
-
-    # 汇总打印
-    print(f"\n📋 数据集【{dataset_name}】字段合法性检查：")
-    print("缺失值统计：")
-    print(report['missing_values'])
-    print(f"user_name 非法数量：{report['invalid_user_name']}")
-    print(f"fullname 非中文数量：{report['invalid_fullname']}")
-    print(f"email 非法数量：{report['invalid_email']}")
+    report['invalid_email'] = count_mismatches(df['email'], EMAIL_PATTERN)
 
     return report
 
-def check_dataset_quality(folder_path, df, name):
+def merge_quality_reports(reports):
+    merged = {
+        'missing_values': pd.concat([r['missing_values'] for r in reports], axis=1).sum(axis=1),
+    }
+    for key in ['invalid_user_name', 'invalid_fullname', 'invalid_email']:
+        merged[key] = sum(r[key] for r in reports)
+    return merged
+
+def scan_file_quality(file_path, compact=False):
+    """只读一遍文件：逐块做字段检查，同时收集 id 检查该文件的 id 类型和唯一性（compact 时以紧凑类型读取）
+
+    时间戳列不解析：无法解析的日期若转为 NaT 会被误计为缺失值。
+    """
+    reports, ids, is_int = [], [], True
+    for df in iter_frames(file_path, compact=compact, parse_timestamps=False):
+        reports.append(chunk_quality_report(df))
+        ids.append(df['id'])
+        is_int = is_int and pd.api.types.is_integer_dtype(df['id'])
+    if not ids:
+        # 文件无法读取或没有数据
+        return (os.path.basename(file_path), False, False), reports
+    return (os.path.basename(file_path), is_int, pd.concat(ids, ignore_index=True).is_unique), reports
+
+def check_dataset_quality(folder_path, name, compact=False):
+    id_check, reports = [], []
+    for file_path in list_parquet_files(folder_path):
+        file_id_check, file_reports = scan_file_quality(file_path, compact)
+        id_check.append(file_id_check)
+        reports.extend(file_reports)
+
     # 检查 id 在每个 parquet 文件中是否唯一
-    id_check = check_id_unique_in_parquet(folder_path)
     print(f"\n📂 数据集【{name}】的每个 parquet 文件中 id 唯一性检查：")
     for fname, is_int, is_unique in id_check:
         print(f"{fname} - id 类型整数: {is_int}，唯一性: {is_unique}")
 
     # 其他字段检查
-    _ = data_quality_check(df, dataset_name=name)
+    if not reports:
+        print(f"⚠️ No valid parquet files found in {folder_path}")
+        return {}
+    report = merge_quality_reports(reports)
+
+    # 汇总打印
+    print(f"\n📋 数据集【{name}】字段合法性检查：")
+    print("缺失值统计：")
+    print(report['missing_values'])
+    print(f"user_name 非法数量：{report['invalid_user_name']}")
+    print(f"fullname 非中文数量：{report['invalid_fullname']}")
+    print(f"email 非法数量：{report['invalid_email']}")
+
+    return report
 
 def filter_gender_other(df, dataset_name):
     total = len(df)
@@ -93,18 +102,20 @@ def filter_gender_other(df, dataset_name):
 
     return df_filtered
 
-path_10g = './10G_data_new'
-path_30g = './30G_data_new'
+if __name__ == '__main__':
+    path_10g = './10G_data_new'
+    path_30g = './30G_data_new'
+    # JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+    report_path = './run_reports/quality_check.json'
+    # 紧凑加载：类别列为 Categorical、字符串为 Arrow 存储、数值降位，检测结果不变
+    compact_loading = True
 
-df_10g = load_dataset(path_10g)
-df_30g = load_dataset(path_30g)
+    with stage('10G') as timer:
+        check_dataset_quality(path_10g, name='10G', compact=compact_loading)
+    print(f"10G 数据质量检测耗时：{timer.seconds:.2f} 秒")
 
-start_10g = time.time()
-check_dataset_quality(path_10g, df_10g, name='10G')
-vis_time_10g = time.time() - start_10g
-print(f"10G 数据质量检测耗时：{vis_time_10g:.2f} 秒")
+    with stage('30G') as timer:
+        check_dataset_quality(path_30g, name='30G', compact=compact_loading)
+    print(f"30G 数据质量检测耗时：{timer.seconds:.2f} 秒")
 
-start_30g = time.time()
-check_dataset_quality(path_30g, df_30g, name='30G')
-vis_time_30g = time.time() - start_30g
-print(f"30G 数据质量检测耗时：{vis_time_30g:.2f} 秒")
\ No newline at end of file
+    write_report(report_path)
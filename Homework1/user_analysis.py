@@ -1,25 +1,17 @@
 import os
+import sys
 import pandas as pd
+import numpy as np
 import re
-import time
 import json
 from datetime import datetime, timedelta
+import pyarrow.dataset as ds
 
-def load_dataset(folder_path):
-    all_dfs = []
-    for fname in os.listdir(folder_path):
-        if fname.endswith('.parquet'):
-            file_path = os.path.join(folder_path, fname)
-            try:
-                df = pd.read_parquet(file_path)
-                all_dfs.append(df)
-            except Exception as e:
-                print(f"❌ Error reading {fname}: {e}")
-    if all_dfs:
-        return pd.concat(all_dfs, ignore_index=True)
-    else:
-        print(f"⚠️ No valid parquet files found in {folder_path}")
-        return pd.DataFrame()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.parquet_reader import iter_filtered_batches, iter_frames
+from utils.instrumentation import stage, write_report
+from utils.purchase_decoder import decode_purchase_history
+from utils.sketches import exact_quantile
 
 def filter_gender_other(df, dataset_name):
     total = len(df)
@@ -32,78 +24,91 @@ def filter_gender_other(df, dataset_name):
 
     return df_filtered
 
-def extract_purchase_metrics(row):
-    try:
-        data = json.loads(row)
-        return pd.Series({
-            "avg_price": data.get("avg_price", 0),
-            "payment_status": data.get("payment_status", ""),
-            "category_count": len(set(data.get("categories", "").split(','))) if isinstance(data.get("categories", ""), str) else 0
-        })
-    except Exception:
-        return pd.Series({"avg_price": 0, "payment_status": "", "category_count": 0})
-
-def extract_purchase_metrics(row):
-    try:
-        data = json.loads(row)
-        return pd.Series({
-            "avg_price": data.get("avg_price", 0),
-            "payment_status": data.get("payment_status", ""),
-            "category_count": len(set(data.get("categories", "").split(','))) if isinstance(data.get("categories", ""), str) else 0
-        })
-    except Exception:
-        return pd.Series({"avg_price": 0, "payment_status": "", "category_count": 0})
-
-def identify_high_value_users(df):
-    # 初筛
-    income_threshold = df['income'].quantile(0.75)
-    high_value_mask_1 = (
-        (df['income'] >= income_threshold) &
-        (df['age'].between(25, 55)) &
-        (df['is_active'] == True)
+def extract_purchase_metrics(purchase_history):
+    # 列式解析 JSON，解析失败的记录取默认值
+    purchases = decode_purchase_history(purchase_history)
+    categories = purchases.categories
+    # 每种 categories 取值只计算一次去重后的类别数，末尾的 1 对应缺少该键（按 "" 计为 1 个类别，code 为 -1）
+    count_per_value = np.array([len(set(c.split(','))) for c in categories.categories] + [1], dtype=np.int64)
+    category_count = np.where(purchases.valid, count_per_value[categories.codes], 0)
+    # 键存在但为 null 或非字符串时为 0：只对文本中出现该键的行逐行确认
+    unknown = np.flatnonzero(purchases.valid & (categories.codes < 0))
+    raw = purchase_history.iloc[unknown]
+    mentioned = raw.str.contains('"categories"', regex=False).to_numpy(dtype=bool)
+    for i, text in zip(unknown[mentioned], raw[mentioned]):
+        if "categories" in json.loads(text):
+            category_count[i] = 0
+    payment_status = purchases.labels('payment_status')
+    payment_status[pd.isnull(payment_status)] = ""
+    return pd.DataFrame({
+        "avg_price": np.nan_to_num(purchases.avg_price, nan=0),
+        "payment_status": payment_status,
+        "category_count": category_count,
+    }, index=purchase_history.index)
+
+def income_threshold_of(folder_path, dataset_name):
+    # 只读 gender / income 两列（gender 为 Categorical），流式计算收入的 75 分位数（与 pandas quantile 结果一致）
+    def incomes():
+        for df in iter_frames(folder_path, columns=['gender', 'income'], compact=True):
+            yield filter_gender_other(df, dataset_name)['income'].to_numpy(dtype=np.float64)
+    return exact_quantile(incomes, 0.75)
+
+def first_pass_filter(income_threshold):
+    # 初筛条件下推到 Arrow：row group 统计不满足的整块跳过，只有通过的行会被转换
+    return (
+        (ds.field('income') >= income_threshold) &
+        (ds.field('age') >= 25) & (ds.field('age') <= 55) &
+        (ds.field('is_active') == True) &
+        (ds.field('gender').is_null() | (ds.field('gender') != '其他'))
     )
-    df_filtered = df[high_value_mask_1].copy()
 
-    df_filtered['last_login'] = pd.to_datetime(df_filtered['last_login'], errors='coerce', utc=True)
-
-    # 对筛选后的数据进行 JSON 字段解析
-    purchase_info = df_filtered['purchase_history'].apply(extract_purchase_metrics)
-    df_filtered = pd.concat([df_filtered, purchase_info], axis=1)
-
-    # 精筛
-    login_2025_mask = df_filtered['last_login'].dt.year == 2025
-    high_value_mask_2 = (
-        (df_filtered['avg_price'] > 5000) &
-        (df_filtered['payment_status'] == '已支付') &
-        (login_2025_mask)
-    )
-
-    high_value_users = df_filtered[high_value_mask_2]
-    print(f"🏆 最终识别的高价值用户数：{len(high_value_users)}")
-
-    return high_value_users
-
-
-path_10g = './10G_data_new'
-path_30g = './30G_data_new'
-
-df_10g = load_dataset(path_10g)
-df_30g = load_dataset(path_30g)
-
-# 处理两个数据集
-df_10g_filtered = filter_gender_other(df_10g, '10G')
-df_30g_filtered = filter_gender_other(df_30g, '30G')
-
-start_10g = time.time()
-# print(start_10g)
-high_value_users = identify_high_value_users(df_10g_filtered)
-vis_time_10g = time.time() - start_10g
-print(f"10G 数据用户分析耗时：{vis_time_10g:.2f} 秒")
-high_value_users.to_csv("high_value_users_10G.csv", index=False)
-
-start_30g = time.time()
-# print(start_30g)
-high_value_users = identify_high_value_users(df_30g_filtered)
-vis_time_30g = time.time() - start_30g
-print(f"30G 数据用户分析耗时：{vis_time_30g:.2f} 秒")
-high_value_users.to_csv("high_value_users_30G.csv", index=False)
\ No newline at end of file
+def identify_high_value_users(folder_path, dataset_name, output_path):
+    with stage('income_threshold'):
+        income_threshold = income_threshold_of(folder_path, dataset_name)
+
+    # 第二遍只读取通过初筛的行，精筛结果逐块追加写入 output_path
+    n_users = 0
+    with stage('filter'):
+        for batch in iter_filtered_batches(folder_path, first_pass_filter(income_threshold)):
+            df_filtered = batch.to_pandas()
+            df_filtered['last_login'] = pd.to_datetime(df_filtered['last_login'], errors='coerce', utc=True)
+
+            # 只对通过初筛的记录解析 JSON 字段
+            purchase_info = extract_purchase_metrics(df_filtered['purchase_history'])
+            df_filtered = df_filtered.join(purchase_info)
+
+            # 精筛
+            login_2025_mask = df_filtered['last_login'].dt.year == 2025
+            high_value_mask_2 = (
+                (df_filtered['avg_price'] > 5000) &
+                (df_filtered['payment_status'] == '已支付') &
+                (login_2025_mask)
+            )
+            high_value_users = df_filtered[high_value_mask_2]
+            if high_value_users.empty:
+                continue
+            high_value_users.to_csv(output_path, index=False, mode='w' if n_users == 0 else 'a', header=n_users == 0)
+            n_users += len(high_value_users)
+
+        if n_users == 0:
+            pd.DataFrame().to_csv(output_path, index=False)
+    print(f"🏆 最终识别的高价值用户数：{n_users}")
+
+    return n_users
+
+
+if __name__ == '__main__':
+    path_10g = './10G_data_new'
+    path_30g = './30G_data_new'
+    # JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+    report_path = './run_reports/user_analysis.json'
+
+    with stage('10G') as timer:
+        identify_high_value_users(path_10g, '10G', "high_value_users_10G.csv")
+    print(f"10G 数据用户分析耗时：{timer.seconds:.2f} 秒")
+
+    with stage('30G') as timer:
+        identify_high_value_users(path_30g, '30G', "high_value_users_30G.csv")
+    print(f"30G 数据用户分析耗时：{timer.seconds:.2f} 秒")
+
+    write_report(report_path)
@@ -3,7 +3,11 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib import font_manager
-import time
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.vis_aggregates import aggregate_dashboard
+from utils.instrumentation import stage, write_report
 
 # 设置 seaborn 风格
 sns.set(style="whitegrid")
@@ -12,60 +16,66 @@ sns.set(style="whitegrid")
 my_font = font_manager.FontProperties(fname='/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc')
 plt.rcParams['font.family'] = my_font.get_name() 
 
-def load_dataset(folder_path):
-    dfs = []
-    for fname in os.listdir(folder_path):
-        if fname.endswith('.parquet'):
-            fpath = os.path.join(folder_path, fname)
-            try:
-                df = pd.read_parquet(fpath)
-                dfs.append(df)
-            except Exception as e:
-                print(f"❌ 读取失败 {fname}: {e}")
-    return pd.concat(dfs, ignore_index=True)
-
-def visualize_dataset(df, title_prefix, save_path):
-    start_time = time.time()
+# 并行进程数，None 表示使用全部 CPU
+n_workers = None
+# 紧凑加载：类别列为 Categorical、数值降位、注册日期预先解析，聚合结果不变
+compact_loading = True
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/vis.json'
 
+def load_dataset(folder_path):
+    # 一次分块扫描，只保留直方图、KDE、箱线图统计和各类计数等小型聚合结果
+    return aggregate_dashboard(folder_path, n_workers=n_workers, compact=compact_loading)
+
+def plot_histogram(summary, color, ax):
+    # 直方图与 KDE 曲线都由预先分好的箱计数绘制
+    centers = (summary.edges[:-1] + summary.edges[1:]) / 2
+    bins = pd.DataFrame({'value': centers, 'count': summary.counts})
+    sns.histplot(bins, x='value', weights='count', bins=summary.edges.tolist(), color=color, ax=ax)
+    grid, density = summary.kde()
+    ax.plot(grid, density, color=color)
+
+def visualize_dataset(agg, title_prefix, save_path):
     fig, axs = plt.subplots(3, 3, figsize=(18, 14))
     fig.suptitle(f'{title_prefix} 数据集可视化', fontproperties=my_font, fontsize=20)
 
     # 年龄分布 - 直方图 & 箱线图
-    sns.histplot(df['age'], bins=30, kde=True, color='skyblue', ax=axs[0, 0])
+    plot_histogram(agg.numeric['age'], 'skyblue', axs[0, 0])
     axs[0, 0].set_title('年龄分布（直方图）', fontproperties=my_font)
     axs[0, 0].set_xlabel('年龄', fontproperties=my_font)
 
-    sns.boxplot(x=df['age'], color='lightgreen', ax=axs[0, 1])
+    axs[0, 1].bxp([agg.numeric['age'].box_stats()], vert=False, patch_artist=True,
+                  boxprops={'facecolor': 'lightgreen'})
+    axs[0, 1].set_yticks([])
     axs[0, 1].set_title('年龄分布（箱线图）', fontproperties=my_font)
     axs[0, 1].set_xlabel('年龄', fontproperties=my_font)
 
     # 收入分布
-    sns.histplot(df['income'], bins=30, kde=True, color='orange', ax=axs[0, 2])
+    plot_histogram(agg.numeric['income'], 'orange', axs[0, 2])
     axs[0, 2].set_title('收入分布', fontproperties=my_font)
     axs[0, 2].set_xlabel('收入', fontproperties=my_font)
 
     # 性别分布（饼图）
-    gender_counts = df['gender'].value_counts()
+    gender_counts = agg.value_counts('gender')
     axs[1, 0].pie(gender_counts, labels=gender_counts.index, autopct='%1.1f%%',
                  textprops={'fontproperties': my_font}, colors=sns.color_palette("pastel"))
     axs[1, 0].set_title('性别分布', fontproperties=my_font)
 
     # 国家分布
-    country_counts = df['country'].value_counts()
+    country_counts = agg.value_counts('country')
     axs[1, 1].pie(country_counts, labels=country_counts.index, autopct='%1.1f%%',
                  textprops={'fontproperties': my_font}, colors=sns.color_palette("muted"))
     axs[1, 1].set_title('国家分布', fontproperties=my_font)
 
     # 活跃用户分布
-    active_counts = df['is_active'].value_counts()
+    active_counts = agg.value_counts('is_active')
     labels = ['活跃用户' if val else '非活跃用户' for val in active_counts.index]
     axs[1, 2].pie(active_counts, labels=labels, autopct='%1.1f%%',
                  textprops={'fontproperties': my_font}, colors=['lightcoral', 'lightblue'])
     axs[1, 2].set_title('用户活跃状态分布', fontproperties=my_font)
 
     # 注册时间分布（按月）
-    df['registration_date'] = pd.to_datetime(df['registration_date'], errors='coerce')
-    reg_counts = df['registration_date'].dt.to_period('M').value_counts().sort_index()
+    reg_counts = agg.registration_counts()
     reg_counts.plot(kind='bar', color='slateblue', ax=axs[2, 0])
     axs[2, 0].set_title('用户注册时间分布（月）', fontproperties=my_font)
     axs[2, 0].set_xlabel('注册月份', fontproperties=my_font)
@@ -84,24 +94,24 @@ def visualize_dataset(df, title_prefix, save_path):
 path_10g = './10G_data_new' 
 path_30g = './30G_data_new'  
 
-# 10G 数据处理
-start_10g = time.time()
-df_10g = load_dataset(path_10g)
-load_time_10g = time.time() - start_10g
-print(f"加载 10G 数据耗时：{load_time_10g:.2f} 秒")
-
-visualize_dataset(df_10g, title_prefix='10G', save_path='visualization_10G.png')
+# 10G 数据处理：加载与绘图分别计时，可视化耗时不再包含加载
+with stage('10G'):
+    with stage('load') as timer:
+        df_10g = load_dataset(path_10g)
+    print(f"加载 10G 数据耗时：{timer.seconds:.2f} 秒")
 
-vis_time_10g = time.time() - start_10g
-print(f"可视化 10G 数据耗时：{vis_time_10g:.2f} 秒")
+    with stage('plot') as timer:
+        visualize_dataset(df_10g, title_prefix='10G', save_path='visualization_10G.png')
+    print(f"可视化 10G 数据耗时：{timer.seconds:.2f} 秒")
 
 # 30G 数据处理
-start_30g = time.time()
-df_30g = load_dataset(path_30g)
-load_time_30g = time.time() - start_30g
-print(f"加载 30G 数据耗时：{load_time_30g:.2f} 秒")
+with stage('30G'):
+    with stage('load') as timer:
+        df_30g = load_dataset(path_30g)
+    print(f"加载 30G 数据耗时：{timer.seconds:.2f} 秒")
 
-visualize_dataset(df_30g, title_prefix='30G', save_path='visualization_30G.png')
+    with stage('plot') as timer:
+        visualize_dataset(df_30g, title_prefix='30G', save_path='visualization_30G.png')
+    print(f"可视化 30G 数据耗时：{timer.seconds:.2f} 秒")
 
-vis_time_30g = time.time() - start_30g
-print(f"可视化 30G 数据耗时：{vis_time_30g:.2f} 秒")
+write_report(report_path)
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.purchase_sidecar import materialize_sidecars
+from utils.instrumentation import stage, write_report
+
+# 需要生成旁路数据的数据集目录
+parquet_folders = ['./10G_data_new', './30G_data', './30G_data_new']
+# 每个数据块的内存预算（MB）
+memory_budget_mb = 256
+# 并行进程数（1 表示串行）
+n_workers = os.cpu_count()
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/build_purchase_sidecars.json'
+
+
+if __name__ == '__main__':
+    for folder in parquet_folders:
+        if not os.path.isdir(folder):
+            print(f"⚠️ 跳过不存在的目录 {folder}")
+            continue
+        with stage(folder) as timer:
+            rebuilt = materialize_sidecars(folder, n_workers=n_workers, memory_budget_mb=memory_budget_mb)
+        print(f"📦 {folder}: 重新生成 {rebuilt} 个文件的旁路数据，耗时 {timer.seconds:.2f} 秒")
+
+    write_report(report_path)
+
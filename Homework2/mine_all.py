@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.scan_pipeline import ScanPipeline
+from utils.mining_consumers import (CategoryBasketConsumer, PaymentBasketConsumer, PurchaseCubeConsumer,
+                                    RefundBasketConsumer, TimeSeriesConsumer)
+from utils.catalog_index import load_catalog_index
+from utils.instrumentation import stage, write_report
+
+from product_category_mining import analyze_category_rules
+from payment_mining import analyze_payment_rules
+from refund_pattern_mining import analyze_refund_rules
+from time_series_mining import build_time_series_tables, mine_sequential_patterns, plot_cube_shares, plot_time_series
+
+# 设置路径
+parquet_folder = './30G_data'
+catalog_path = './product_catalog.json'
+# 每个数据块的内存预算（MB）
+memory_budget_mb = 256
+# 并行进程数（1 表示串行），任务按文件（'file'）或 row group（'row_group'）切分
+n_workers = os.cpu_count()
+partition_by = 'file'
+# 分区检查点目录：再次运行时只扫描新增或修改过的文件（None 表示不使用检查点）
+checkpoint_dir = './checkpoints'
+# 用户购买序列的内存上限（MB），超出后按用户、时间排序溢写到临时目录
+sequence_memory_mb = 256
+# 日 × 大类 × 支付方式 × 支付状态 预聚合立方体的保存路径
+cube_path = './purchase_cube.npz'
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/mine_all.json'
+
+
+if __name__ == '__main__':
+    # 加载商品目录索引（缓存在目录文件旁，目录变化后自动重建）
+    with stage('catalog'):
+        catalog = load_catalog_index(catalog_path)
+
+    # 只扫描一遍数据，同时为四个分析收集交易与计数
+    with stage('scan'):
+        pipeline = ScanPipeline(memory_budget_mb=memory_budget_mb)
+        pipeline.register('category', CategoryBasketConsumer(catalog))
+        pipeline.register('payment', PaymentBasketConsumer(catalog))
+        pipeline.register('refund', RefundBasketConsumer(catalog))
+        pipeline.register('cube', PurchaseCubeConsumer(catalog))
+        pipeline.register('time_series', TimeSeriesConsumer(catalog, sequence_memory_mb))
+        results = pipeline.run(parquet_folder, n_workers=n_workers, partition_by=partition_by,
+                               checkpoint_dir=checkpoint_dir)
+
+    # 商品类别关联规则
+    with stage('category'):
+        analyze_category_rules(results['category'])
+
+    # 支付方式与商品类别的关联分析
+    with stage('payment'):
+        baskets, high_value_methods = results['payment']
+        analyze_payment_rules(baskets, high_value_methods, catalog)
+
+    # 退款模式分析
+    with stage('refund'):
+        analyze_refund_rules(results['refund'])
+
+    # 时间序列模式挖掘
+    with stage('time_series'):
+        results['cube'].save(cube_path)
+        df_orders, df_category_trends, df_seq = build_time_series_tables(results['cube'], results['time_series'])
+        mine_sequential_patterns(results['time_series'])
+        results['time_series'].close()
+        plot_time_series(df_orders, df_category_trends, df_seq)
+        plot_cube_shares(results['cube'])
+
+    write_report(report_path)
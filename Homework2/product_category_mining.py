@@ -1,99 +1,140 @@
 import pandas as pd
 import os
-import json
-from mlxtend.frequent_patterns import apriori, association_rules
-from mlxtend.preprocessing import TransactionEncoder
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.scan_pipeline import ScanPipeline
+from utils.mining_consumers import CategoryBasketConsumer
+from utils.catalog_index import load_catalog_index
+from utils.instrumentation import stage, write_report
+from utils.basket_encoding import encode_baskets
+from utils.itemset_mining import association_rules, mine_frequent_itemsets
+from utils.sampled_mining import ApproximateItemsets, sample_partitions
+from utils.incremental_mining import maintain_frequent_itemsets
 
 # 设置路径
 parquet_dir = './30G_data'
 product_catalog_path = './product_catalog.json'
-
-# 加载商品目录
-with open(product_catalog_path, 'r', encoding='utf-8') as f:
-    product_catalog = json.load(f)
-product_map = {item['id']: item['category'] for item in product_catalog['products']}
-
-# 定义商品子类别与其所属大类的映射
-category_to_group = {
-    # 电子产品
-    '智能手机': '电子产品', '笔记本电脑': '电子产品', '平板电脑': '电子产品',
-    '智能手表': '电子产品', '耳机': '电子产品', '音响': '电子产品',
-    '相机': '电子产品', '摄像机': '电子产品', '游戏机': '电子产品',
-
-    # 服装
-    '上衣': '服装', '裤子': '服装', '裙子': '服装', '内衣': '服装',
-    '鞋子': '服装', '帽子': '服装', '手套': '服装', '围巾': '服装', '外套': '服装',
-
-    # 食品
-    '零食': '食品', '饮料': '食品', '调味品': '食品', '米面': '食品',
-    '水产': '食品', '肉类': '食品', '蛋奶': '食品', '水果': '食品', '蔬菜': '食品',
-
-    # 家居
-    '家具': '家居', '床上用品': '家居', '厨具': '家居', '卫浴用品': '家居',
-
-    # 办公
-    '文具': '办公', '办公用品': '办公',
-
-    # 运动户外
-    '健身器材': '运动户外', '户外装备': '运动户外',
-
-    # 玩具
-    '玩具': '玩具', '模型': '玩具', '益智玩具': '玩具',
-
-    # 母婴
-    '婴儿用品': '母婴', '儿童课外读物': '母婴',
-
-    # 汽车用品
-    '车载电子': '汽车用品', '汽车装饰': '汽车用品'
-}
-
-
-# 收集所有订单的大类组合
-transactions = []
-
-for file in sorted(os.listdir(parquet_dir)):
-    if file.endswith('.parquet') and file.startswith('part-'):
-        df = pd.read_parquet(os.path.join(parquet_dir, file), engine='pyarrow')
-        for record in df['purchase_history'].dropna():
-            try:
-                history = json.loads(record) if isinstance(record, str) else record
-                item_ids = [item['id'] for item in history.get('items', [])]
-                # 获取大类（去重）
-                major_groups = list(set(
-                    category_to_group.get(product_map.get(item_id)) 
-                    for item_id in item_ids 
-                    if item_id in product_map and product_map.get(item_id) in category_to_group
-                ))
-                if major_groups:
-                    transactions.append(major_groups)
-            except Exception as e:
-                continue
-
-# 转换为 one-hot 编码
-te = TransactionEncoder()
-te_array = te.fit(transactions).transform(transactions)
-df_encoded = pd.DataFrame(te_array, columns=te.columns_)
-
-# 频繁项集
-frequent_itemsets = apriori(df_encoded, min_support=0.02, use_colnames=True)
-
-# 生成关联规则
-rules = association_rules(frequent_itemsets, metric="confidence", min_threshold=0.4)
-rules['antecedents'] = rules['antecedents'].apply(set)
-rules['consequents'] = rules['consequents'].apply(set)
-
-# 电子产品相关
-is_electronics = lambda row: '电子产品' in row['antecedents'] or '电子产品' in row['consequents']
-electronics_rules = rules[rules.apply(is_electronics, axis=1)].sort_values(by='support', ascending=False).head(10)
-
-# 非电子产品间典型关联（排除电子产品）
-other_rules = rules[~rules.apply(is_electronics, axis=1)].sort_values(by='support', ascending=False).head(10)
-
-# 合并结果（部分展示）
-combined_rules = pd.concat([electronics_rules, other_rules])
-combined_rules_display = combined_rules[['antecedents', 'consequents', 'support', 'confidence', 'lift']]
-
-# 打印终端输出
-print("\n📊 电子产品相关 & 非电子产品部分关联规则（前10条）：\n")
-print(combined_rules_display.to_string(index=False))
-
+# 每个数据块的内存预算（MB）
+memory_budget_mb = 256
+# 并行进程数（1 表示串行），任务按文件（'file'）或 row group（'row_group'）切分
+n_workers = os.cpu_count()
+partition_by = 'file'
+# 分区检查点目录：再次运行时只扫描新增或修改过的文件（None 表示不使用检查点）
+checkpoint_dir = './checkpoints'
+# 频繁项集算法：'bitset'（位向量 Apriori）、'fpgrowth' 或 'apriori'
+mining_algorithm = 'bitset'
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/product_category_mining.json'
+# 近似挖掘：按 row group 抽样的比例（None 表示只做精确挖掘）、支持度置信区间的置信水平，
+# 以及先给出样本结果后是否再全量扫描精确校验
+sample_fraction = None
+confidence_level = 0.95
+verify_sample = True
+# 增量维护（FUP）：保存频繁项集及其负边界次数的状态文件，再次运行时只扫描新增的分区，
+# 旧数据只在负边界中有项集变为频繁时读取（None 表示每次完整挖掘）
+incremental_state_path = None
+
+
+# 挖掘商品大类之间的关联规则并打印
+def analyze_category_rules(baskets):
+    # 位掩码编码：相同的购物篮只保留一份并记录次数
+    masks, counts, items = encode_baskets(baskets)
+
+    # 频繁项集（在去重购物篮上加权计数）
+    frequent_itemsets = mine_frequent_itemsets(masks, counts, items, min_support=0.02,
+                                               algorithm=mining_algorithm, use_colnames=True)
+    print_category_rules(frequent_itemsets)
+
+
+# 抽样挖掘（Toivonen）：样本上以下调的阈值挖掘候选，先打印带置信区间的近似结果
+def analyze_sampled_category_rules(sample_baskets):
+    approximate = ApproximateItemsets(sample_baskets, min_support=0.02, confidence=confidence_level,
+                                      algorithm=mining_algorithm)
+    frequent_itemsets = approximate.frequent_itemsets()
+    print(f"\n🎲 样本 {approximate.n} 笔交易，下调阈值 {approximate.lowered_support:.4f}，"
+          f"候选 {len(approximate.candidates)} 个，负边界 {len(approximate.border)} 个")
+    print(f"📏 近似频繁项集（{confidence_level:.0%} 置信区间）：\n")
+    print(frequent_itemsets.to_string(index=False))
+    print_category_rules(frequent_itemsets)
+    return approximate
+
+
+# 用全量购物篮校验抽样结果
+def verify_sampled_category_rules(approximate, baskets):
+    verified = approximate.verify(baskets)
+    if approximate.missed:
+        print(f"\n⚠️ 负边界中有 {len(approximate.missed)} 个项集在全量数据中频繁，样本结果不完整，已改为精确挖掘")
+    else:
+        print(f"\n✅ 负边界均不频繁，样本结果完整；{verified['within_bounds'].mean():.1%} 的精确支持度落在置信区间内")
+    print(verified.to_string(index=False))
+
+
+# 增量维护频繁项集（新增分区到达时不必重新完整挖掘），再由当前的频繁项集生成规则
+def analyze_incremental_category_rules(pipeline):
+    itemsets, summary = maintain_frequent_itemsets(
+        pipeline, 'category', parquet_dir, incremental_state_path, min_support=0.02, algorithm=mining_algorithm,
+        n_workers=n_workers, partition_by=partition_by, checkpoint_dir=checkpoint_dir)
+    if summary is not None:
+        print(f"📈 新增 {summary.delta_rows} 笔交易：{summary.promoted} 个负边界项集变为频繁，"
+              f"{summary.demoted} 个频繁项集变为不频繁，新候选 {summary.new_candidates} 个"
+              f"（{'已' if summary.old_data_scanned else '未'}读取旧数据）")
+    print(f"📦 共 {itemsets.n} 笔交易，负边界 {len(itemsets.border())} 个项集")
+    print_category_rules(itemsets.frequent_itemsets())
+    return itemsets
+
+
+# 由频繁项集生成关联规则并打印
+def print_category_rules(frequent_itemsets):
+    # 生成关联规则
+    rules = association_rules(frequent_itemsets, metric="confidence", min_threshold=0.4)
+    rules['antecedents'] = rules['antecedents'].apply(set)
+    rules['consequents'] = rules['consequents'].apply(set)
+
+    # 电子产品相关
+    is_electronics = lambda row: '电子产品' in row['antecedents'] or '电子产品' in row['consequents']
+    electronics_rules = rules[rules.apply(is_electronics, axis=1)].sort_values(by='support', ascending=False).head(10)
+
+    # 非电子产品间典型关联（排除电子产品）
+    other_rules = rules[~rules.apply(is_electronics, axis=1)].sort_values(by='support', ascending=False).head(10)
+
+    # 合并结果（部分展示）
+    combined_rules = pd.concat([electronics_rules, other_rules])
+    combined_rules_display = combined_rules[['antecedents', 'consequents', 'support', 'confidence', 'lift']]
+
+    # 打印终端输出
+    print("\n📊 电子产品相关 & 非电子产品部分关联规则（前10条）：\n")
+    print(combined_rules_display.to_string(index=False))
+
+
+if __name__ == '__main__':
+    # 加载商品目录索引（缓存在目录文件旁，目录变化后自动重建）
+    with stage('catalog'):
+        catalog = load_catalog_index(product_catalog_path)
+
+    # 收集所有订单的大类组合，折叠为 {购物篮: 次数}
+    pipeline = ScanPipeline(memory_budget_mb=memory_budget_mb)
+    pipeline.register('category', CategoryBasketConsumer(catalog))
+
+    # 近似模式：只扫描抽中的 row group，立即给出近似结果
+    if sample_fraction is not None:
+        with stage('sample'):
+            partitions, sampled_rows, total_rows = sample_partitions(parquet_dir, sample_fraction)
+            print(f"🎲 抽样 {len(partitions)} 个 row group，共 {sampled_rows} / {total_rows} 行")
+            sample_baskets = pipeline.run(parquet_dir, n_workers=n_workers, partitions=partitions)['category']
+            approximate = analyze_sampled_category_rules(sample_baskets)
+
+    if incremental_state_path is not None:
+        with stage('incremental'):
+            analyze_incremental_category_rules(pipeline)
+    elif sample_fraction is None or verify_sample:
+        with stage('scan'):
+            baskets = pipeline.run(parquet_dir, n_workers=n_workers, partition_by=partition_by,
+                                   checkpoint_dir=checkpoint_dir)['category']
+
+        with stage('rules'):
+            if sample_fraction is not None:
+                verify_sampled_category_rules(approximate, baskets)
+            analyze_category_rules(baskets)
+
+    write_report(report_path)
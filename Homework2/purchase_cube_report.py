@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.mining_consumers import REFUND_STATUSES
+from utils.purchase_cube import PurchaseCube
+
+# 立方体路径（由 time_series_mining.py 或 mine_all.py 扫描后保存）
+cube_path = './purchase_cube.npz'
+# 汇总粒度：'day' / 'week' / 'month' / 'quarter' / 'year'
+report_freqs = ['week', 'month', 'quarter']
+# Top-N 查询的条数
+top_n = 5
+# 切片查询：商品大类与日期范围（None 表示不限）
+slice_category = '电子产品'
+slice_start = None
+slice_end = None
+
+
+def timed(title, query):
+    start = time.perf_counter()
+    result = query()
+    print(f"\n{title}（查询耗时 {(time.perf_counter() - start) * 1000:.1f} ms）：\n")
+    print(result.to_string())
+    return result
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    cube = PurchaseCube.load(cube_path)
+    print(f"🧊 已加载购买立方体 {cube_path}（耗时 {(time.perf_counter() - start) * 1000:.1f} ms）：{cube.n_days} 天 × "
+          f"{len(cube.categories)} 个大类 × {len(cube.methods)} 种支付方式 × {len(cube.statuses)} 种支付状态")
+
+    # 📅 各粒度的订单量与目录价格合计
+    for freq in report_freqs:
+        timed(f"📅 按 {freq} 汇总的订单数与商品金额",
+              lambda: cube.rollup('orders', freq).to_frame().join(cube.rollup('amount', freq).round(2)))
+
+    # 🏆 Top-N：商品大类（件数）、支付方式（订单数）
+    timed(f"🏆 商品件数 Top {top_n} 大类", lambda: cube.top('items', 'category', top_n))
+    timed(f"🏆 订单数 Top {top_n} 支付方式", lambda: cube.top('orders', 'method', top_n))
+
+    # 🔪 切片：某一大类在各支付状态下的月度订单数
+    sliced = cube.select(category=slice_category, start=slice_start, end=slice_end)
+    timed(f"🔪 {slice_category} 各支付状态的月度订单数", lambda: sliced.rollup('category_orders', 'month', by='status'))
+
+    # 💸 退款率：退款订单数 / 全部订单数
+    def refund_rate():
+        orders = cube.rollup('orders', 'quarter')
+        return (cube.select(status=REFUND_STATUSES).rollup('orders', 'quarter') / orders).rename('refund_rate')
+    timed("💸 各季度退款率", refund_rate)
@@ -1,12 +1,17 @@
-import pandas as pd
-import json
 import os
-from mlxtend.frequent_patterns import apriori, association_rules
-from mlxtend.preprocessing import TransactionEncoder
+import sys
 import matplotlib.pyplot as plt
 import matplotlib.font_manager as fm
 import seaborn as sns
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.scan_pipeline import ScanPipeline
+from utils.mining_consumers import RefundBasketConsumer
+from utils.catalog_index import load_catalog_index
+from utils.instrumentation import stage, write_report
+from utils.basket_encoding import encode_baskets
+from utils.itemset_mining import RuleConstraints, mine_constrained_rules
+
 # 设置中文字体
 font_path = "/mnt/cfs/bit/zmx/data/Microsoft Yahei.ttf"
 my_font = fm.FontProperties(fname=font_path)
@@ -16,93 +21,62 @@ plt.rcParams['axes.unicode_minus'] = False
 # --- 1. 配置路径 ---
 parquet_folder = './30G_data'
 catalog_path = 'product_catalog.json'
+# 每个数据块的内存预算（MB）
+memory_budget_mb = 256
+# 并行进程数（1 表示串行），任务按文件（'file'）或 row group（'row_group'）切分
+n_workers = os.cpu_count()
+partition_by = 'file'
+# 分区检查点目录：再次运行时只扫描新增或修改过的文件（None 表示不使用检查点）
+checkpoint_dir = './checkpoints'
+# 频繁项集算法：'bitset'（位向量 Apriori）、'fpgrowth' 或 'apriori'
+mining_algorithm = 'bitset'
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/refund_pattern_mining.json'
 
-# --- 2. 加载商品目录 + 商品类别映射 ---
-with open(catalog_path, 'r', encoding='utf-8') as f:
-    catalog = json.load(f)
-product_df = pd.DataFrame(catalog['products'])
-product_map = product_df.set_index('id')[['category', 'price']].to_dict('index')
-
-# 商品类别映射表（小类到大类）
-category_mapping = {
-    '电子产品': ['智能手机', '笔记本电脑', '平板电脑', '智能手表', '耳机', '音响', '相机', '摄像机', '游戏机'],
-    '服装': ['上衣', '裤子', '裙子', '内衣', '鞋子', '帽子', '手套', '围巾', '外套'],
-    '食品': ['零食', '饮料', '调味品', '米面', '水产', '肉类', '蛋奶', '水果', '蔬菜'],
-    '家居': ['家具', '床上用品', '厨具', '卫浴用品'],
-    '办公': ['文具', '办公用品'],
-    '运动户外': ['健身器材', '户外装备'],
-    '玩具': ['玩具', '模型', '益智玩具'],
-    '母婴': ['婴儿用品', '儿童课外读物'],
-    '汽车用品': ['车载电子', '汽车装饰'],
-}
-def map_to_main_category(cat):
-    for main_cat, sub_cats in category_mapping.items():
-        if cat in sub_cats:
-            return main_cat
-    return '其他'
-
-# --- 3. 提取退款分析所需的交易数据 ---
-def extract_refund_transactions(df):
-    transactions = []
-    for record in df['purchase_history'].dropna():
-        try:
-            purchase = json.loads(record)
-            payment_status = purchase.get('payment_status', '')
-            if payment_status in ['已退款', '部分退款']:
-                items = purchase.get('items', [])
-                categories = set()
-                for item in items:
-                    item_info = product_map.get(item['id'])
-                    if item_info:
-                        main_cat = map_to_main_category(item_info['category'])
-                        categories.add(main_cat)
-
-                if categories:
-                    # 交易项：商品类别 + 状态标签
-                    transaction = list(categories) + [f'状态:{payment_status}']
-                    transactions.append(transaction)
 
-        except Exception as e:
-            continue
-    return transactions
+# 挖掘商品类别 → 退款状态的关联规则
+def analyze_refund_rules(baskets):
+    # --- 5. 位掩码编码：相同的购物篮只保留一份并记录次数 ---
+    masks, counts, items = encode_baskets(baskets)
 
-# --- 4. 遍历读取所有 parquet 数据 ---
-all_transactions = []
-for file in os.listdir(parquet_folder):
-    if file.endswith(".parquet"):
-        df = pd.read_parquet(os.path.join(parquet_folder, file), engine='pyarrow')
-        transactions = extract_refund_transactions(df)
-        all_transactions.extend(transactions)
+    # --- 6/7. 挖掘频繁项集与关联规则：状态标签只能作后件，且后件必须包含状态标签 ---
+    # 每个订单只有一个支付状态，含两个状态标签的候选项集不生成
+    status_labels = frozenset(item for item in items if item.startswith('状态:'))
+    constraints = RuleConstraints(consequent_only=status_labels, require_consequent_only=True,
+                                  exclusive=(status_labels,))
+    _, refund_rules = mine_constrained_rules(masks, counts, items, constraints, min_support=0.005,
+                                             metric='confidence', min_threshold=0.4,
+                                             algorithm=mining_algorithm)
 
-# --- 5. One-hot 编码 ---
-te = TransactionEncoder()
-te_ary = te.fit(all_transactions).transform(all_transactions)
-df_trans = pd.DataFrame(te_ary, columns=te.columns_)
+    # 打印前几条规则
+    print(refund_rules[['antecedents', 'consequents', 'support', 'confidence', 'lift']].sort_values(by='lift', ascending=False).head(10))
 
-# --- 6. 挖掘频繁项集 ---
-frequent_itemsets = apriori(df_trans, min_support=0.005, use_colnames=True)
+    # 可视化前10条 Lift 最大的规则
+    plt.figure(figsize=(10, 6))
+    top_rules = refund_rules.sort_values(by='lift', ascending=False).head(10)
+    labels = top_rules['antecedents'].astype(str) + ' → ' + top_rules['consequents'].astype(str)
+    sns.barplot(x=top_rules['lift'], y=labels)
+    plt.title('导致退款的高影响商品组合（Top 10 by Lift）')
+    plt.xlabel('Lift')
+    plt.ylabel('规则')
+    plt.tight_layout()
+    plt.savefig('refund_category.png', dpi=300)
+    plt.close()
 
-# --- 7. 挖掘关联规则（支付状态为后件）---
-rules = association_rules(frequent_itemsets, metric='confidence', min_threshold=0.4)
-# refund_rules = rules[rules['consequents'].apply(lambda x: any('状态:已退款' in x or '状态:部分退款' in x))]
-# 筛选包含退款状态的关联规则
-refund_rules = rules[rules['consequents'].apply(
-    lambda x: '状态:已退款' in x or '状态:部分退款' in x
-)]
 
+if __name__ == '__main__':
+    # --- 2. 加载商品目录索引（缓存在目录文件旁，目录变化后自动重建）---
+    with stage('catalog'):
+        catalog = load_catalog_index(catalog_path)
 
-# 打印前几条规则
-print(refund_rules[['antecedents', 'consequents', 'support', 'confidence', 'lift']].sort_values(by='lift', ascending=False).head(10))
+    # --- 3/4. 遍历读取所有 parquet 数据，提取退款交易（按分区顺序合并，结果与串行一致）---
+    with stage('scan'):
+        pipeline = ScanPipeline(memory_budget_mb=memory_budget_mb)
+        pipeline.register('refund', RefundBasketConsumer(catalog))
+        baskets = pipeline.run(parquet_folder, n_workers=n_workers, partition_by=partition_by,
+                               checkpoint_dir=checkpoint_dir)['refund']
 
-# 可视化前10条 Lift 最大的规则
-plt.figure(figsize=(10, 6))
-top_rules = refund_rules.sort_values(by='lift', ascending=False).head(10)
-labels = top_rules['antecedents'].astype(str) + ' → ' + top_rules['consequents'].astype(str)
-sns.barplot(x=top_rules['lift'], y=labels)
-plt.title('导致退款的高影响商品组合（Top 10 by Lift）')
-plt.xlabel('Lift')
-plt.ylabel('规则')
-plt.tight_layout()
-plt.savefig('refund_category.png', dpi=300)
-plt.close()
+    with stage('rules'):
+        analyze_refund_rules(baskets)
 
+    write_report(report_path)
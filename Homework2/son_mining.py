@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.scan_pipeline import ScanPipeline
+from utils.mining_consumers import CategoryBasketConsumer
+from utils.catalog_index import load_catalog_index
+from utils.instrumentation import stage, write_report
+from utils.basket_encoding import encode_baskets
+from utils.itemset_mining import mine_frequent_itemsets
+from utils.son_mining import make_shards, make_transport, son_frequent_itemsets
+
+from product_category_mining import print_category_rules
+
+# 设置路径（分区路径需在各工作进程所在机器上可以访问，如共享存储或相同的目录结构）
+parquet_dir = './30G_data'
+product_catalog_path = './product_catalog.json'
+# 每个数据块的内存预算（MB）
+memory_budget_mb = 256
+# 分片数与切分方式（'file' 或 'row_group'），分片越多单个任务越小、可分给越多的工作进程
+n_shards = 8
+partition_by = 'file'
+# 传输方式：'local'（本机进程池）、'file'（共享目录队列）或 'socket'（TCP 工作进程），
+# 后两者需先在各机器上启动 son_worker.py
+son_transport = 'local'
+n_workers = os.cpu_count()
+queue_dir = './son_queue'
+worker_addresses = [('127.0.0.1', 8765)]
+# 等待工作进程的超时时间（秒，None 表示一直等待）
+worker_timeout = None
+# 工作进程上的检查点目录（每个分片一个子目录 shard-<序号>）：阶段 2 直接读取阶段 1 的扫描结果（None 表示阶段 2 重新扫描）
+checkpoint_dir = './checkpoints'
+# 频繁项集算法：'bitset'（位向量 Apriori）、'fpgrowth' 或 'apriori'
+mining_algorithm = 'bitset'
+# 是否再做一次单机挖掘，校验 SON 结果与之完全一致
+verify_single_node = False
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/son_mining.json'
+
+
+if __name__ == '__main__':
+    with stage('shards'):
+        shards = make_shards(parquet_dir, n_shards, partition_by=partition_by,
+                             prefix=CategoryBasketConsumer.prefix)
+    print(f"🧩 {len(shards)} 个分片，传输方式 {son_transport}")
+
+    # 阶段 1 挖掘各分片的局部频繁项集，阶段 2 统计候选的全局次数
+    with stage('son'):
+        transport = make_transport(son_transport, n_workers=n_workers, queue_dir=queue_dir,
+                                   addresses=worker_addresses, timeout=worker_timeout)
+        frequent_itemsets = son_frequent_itemsets(shards, min_support=0.02, transport=transport, miner='category',
+                                                  catalog_path=product_catalog_path, algorithm=mining_algorithm,
+                                                  memory_budget_mb=memory_budget_mb, checkpoint_dir=checkpoint_dir)
+
+    with stage('rules'):
+        print_category_rules(frequent_itemsets)
+
+    if verify_single_node:
+        with stage('verify'):
+            catalog = load_catalog_index(product_catalog_path)
+            pipeline = ScanPipeline(memory_budget_mb=memory_budget_mb)
+            pipeline.register('category', CategoryBasketConsumer(catalog))
+            baskets = pipeline.run(parquet_dir, n_workers=n_workers, partition_by=partition_by)['category']
+            expected = mine_frequent_itemsets(*encode_baskets(baskets), min_support=0.02,
+                                              algorithm=mining_algorithm, use_colnames=True)
+            if expected.equals(frequent_itemsets):
+                print(f"✅ SON 结果与单机挖掘一致（{len(expected)} 个频繁项集）")
+            else:
+                print("❌ SON 结果与单机挖掘不一致")
+
+    write_report(report_path)
@@ -0,0 +1,23 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.son_mining import file_worker, serve
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SON 分片挖掘的工作进程（在数据所在的机器上运行）')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--serve', metavar='HOST:PORT', help='监听 TCP 端口，接收 son_mining.py 发来的任务')
+    mode.add_argument('--queue', metavar='DIR', help='轮询共享目录中的任务队列')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='扫描一个分片时的并行进程数')
+    parser.add_argument('--max-idle', type=float, default=None, help='文件队列空闲超过该秒数后退出')
+    args = parser.parse_args()
+
+    if args.serve:
+        host, port = args.serve.rsplit(':', 1)
+        serve(host, int(port), n_workers=args.workers)
+    else:
+        print(f"📂 SON 工作进程轮询 {args.queue}")
+        file_worker(args.queue, n_workers=args.workers, max_idle=args.max_idle)
@@ -1,12 +1,20 @@
 import pandas as pd
-import json
+import numpy as np
 import os
-from collections import defaultdict
+import sys
 import matplotlib.pyplot as plt
 import matplotlib.font_manager as fm
 import seaborn as sns
 from itertools import combinations
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.scan_pipeline import ScanPipeline
+from utils.mining_consumers import REFUND_STATUSES, PurchaseCubeConsumer, TimeSeriesConsumer
+from utils.catalog_index import MAIN_CATEGORIES, load_catalog_index
+from utils.instrumentation import stage, write_report
+from utils.sequence_store import count_transitions
+from utils.sequential_patterns import SequenceDatabase, prefixspan
+
 # 设置中文字体
 font_path = "/mnt/cfs/bit/zmx/data/Microsoft Yahei.ttf"
 my_font = fm.FontProperties(fname=font_path)
@@ -16,115 +24,165 @@ plt.rcParams['axes.unicode_minus'] = False
 # 设置路径
 parquet_folder = './30G_data'
 catalog_path = 'product_catalog.json'
+# 每个数据块的内存预算（MB）
+memory_budget_mb = 256
+# 并行进程数（1 表示串行），任务按文件（'file'）或 row group（'row_group'）切分
+n_workers = os.cpu_count()
+partition_by = 'file'
+# 分区检查点目录：再次运行时只扫描新增或修改过的文件（None 表示不使用检查点）
+checkpoint_dir = './checkpoints'
+# 用户购买序列的内存上限（MB），超出后按用户、时间排序溢写到临时目录
+sequence_memory_mb = 256
+# 多步购买顺序模式（PrefixSpan）：最小支持度（用户比例）、最大模式长度、
+# 相邻两步的最大时间间隔（如 '30D'，None 表示不限），以及输出的模式数
+sequence_min_support = 0.01
+sequence_max_len = 3
+sequence_max_gap = None
+sequence_top_k = 20
+# 日 × 大类 × 支付方式 × 支付状态 预聚合立方体的保存路径（purchase_cube_report.py 直接读取，不再扫描数据）
+cube_path = './purchase_cube.npz'
+# JSON 运行报告（各阶段耗时、行数、内存与解析失败计数）
+report_path = './run_reports/time_series_mining.json'
+
+
+# 统计每个用户相邻两次购买的大类转移 {(A, B): 次数}（序列存储按用户、时间归并后逐块比较）
+def count_category_transitions(user_purchase_sequences):
+    matrix = count_transitions(user_purchase_sequences, len(MAIN_CATEGORIES))
+    return {(MAIN_CATEGORIES[a], MAIN_CATEGORIES[b]): int(matrix[a, b]) for a, b in zip(*np.nonzero(matrix))}
+
+
+# 由立方体汇总月度订单量、月度类别趋势，并由购买序列统计 A → B 购买顺序
+def build_time_series_tables(cube, user_purchase_sequences):
+    # 构建月度订单量 DataFrame（只保留有订单的月份）
+    monthly_orders = cube.rollup('orders', 'month')
+    monthly_orders = monthly_orders[monthly_orders > 0]
+    df_orders = pd.DataFrame({'month': monthly_orders.index.astype(str), 'order_count': monthly_orders.to_numpy()})
+
+    # 构建月度商品类别趋势 DataFrame（商品件数）
+    monthly_items = cube.rollup('items', 'month', by='category').stack()
+    monthly_items = monthly_items[monthly_items > 0]
+    df_category_trends = pd.DataFrame({
+        'month': monthly_items.index.get_level_values('month').astype(str),
+        'category': monthly_items.index.get_level_values('category'),
+        'count': monthly_items.to_numpy(),
+    })
+
+    # ⏱️ 分析时间顺序模式：先买 A 再买 B
+    transitions = count_category_transitions(user_purchase_sequences)
+    df_seq = pd.DataFrame(
+        [(a, b, c) for (a, b), c in transitions.items() if a != b],
+        columns=['Category_A', 'Category_B', 'Count']
+    ).sort_values('Count', ascending=False)
+
+    return df_orders, df_category_trends, df_seq
+
+
+# 🧭 多步购买顺序模式：如 电子产品 → 服装 → 食品（不要求相邻，每一步的购买时间严格更晚）
+def mine_sequential_patterns(user_purchase_sequences):
+    database = SequenceDatabase.from_store(user_purchase_sequences, MAIN_CATEGORIES)
+    patterns = prefixspan(database, sequence_min_support, max_len=sequence_max_len, max_gap=sequence_max_gap,
+                          top_k=sequence_top_k, min_len=2, n_workers=n_workers)
+    print(f"\n🧭 {len(database)} 个用户的购买序列中，Top {sequence_top_k} 多步购买顺序模式：\n")
+    print(patterns.assign(pattern=patterns['pattern'].map(' → '.join)).to_string(index=False))
+    return patterns
 
-# 加载商品目录
-with open(catalog_path, 'r', encoding='utf-8') as f:
-    catalog = json.load(f)
-product_df = pd.DataFrame(catalog['products'])
-product_map = product_df.set_index('id')[['category', 'price']].to_dict('index')
-
-# 商品类别映射
-category_mapping = {
-    '电子产品': ['智能手机', '笔记本电脑', '平板电脑', '智能手表', '耳机', '音响', '相机', '摄像机', '游戏机'],
-    '服装': ['上衣', '裤子', '裙子', '内衣', '鞋子', '帽子', '手套', '围巾', '外套'],
-    '食品': ['零食', '饮料', '调味品', '米面', '水产', '肉类', '蛋奶', '水果', '蔬菜'],
-    '家居': ['家具', '床上用品', '厨具', '卫浴用品'],
-    '办公': ['文具', '办公用品'],
-    '运动户外': ['健身器材', '户外装备'],
-    '玩具': ['玩具', '模型', '益智玩具'],
-    '母婴': ['婴儿用品', '儿童课外读物'],
-    '汽车用品': ['车载电子', '汽车装饰'],
-}
-def map_to_main_category(cat):
-    for main_cat, sub_cats in category_mapping.items():
-        if cat in sub_cats:
-            return main_cat
-    return '其他'
-
-# 数据收集容器
-monthly_order_counts = defaultdict(int)
-monthly_category_counts = defaultdict(lambda: defaultdict(int))  # {month: {category: count}}
-user_purchase_sequences = defaultdict(list)  # {user_id: [(timestamp, category)]}
-
-# 遍历数据文件
-for file in os.listdir(parquet_folder):
-    if file.endswith(".parquet"):
-        df = pd.read_parquet(os.path.join(parquet_folder, file), engine='pyarrow')
-        for _, row in df.iterrows():
-            try:
-                uid = row['id']
-                purchase = json.loads(row['purchase_history'])
-                purchase_date = pd.to_datetime(purchase['purchase_date'])
-                month_str = purchase_date.strftime('%Y-%m')
-                items = purchase.get('items', [])
-
-                monthly_order_counts[month_str] += 1
-
-                for item in items:
-                    product_info = product_map.get(item['id'])
-                    if product_info:
-                        main_cat = map_to_main_category(product_info['category'])
-                        monthly_category_counts[month_str][main_cat] += 1
-                        user_purchase_sequences[uid].append((purchase_date, main_cat))
-            except Exception:
-                continue
-
-# 构建月度订单量 DataFrame
-df_orders = pd.DataFrame(list(monthly_order_counts.items()), columns=['month', 'order_count']).sort_values('month')
-
-# 构建月度商品类别趋势 DataFrame
-category_data = []
-for month, cats in monthly_category_counts.items():
-    for cat, count in cats.items():
-        category_data.append((month, cat, count))
-df_category_trends = pd.DataFrame(category_data, columns=['month', 'category', 'count'])
-
-# ⏱️ 分析时间顺序模式：先买 A 再买 B
-sequence_counts = defaultdict(int)
-for seq in user_purchase_sequences.values():
-    sorted_seq = sorted(seq, key=lambda x: x[0])
-    categories_only = [cat for _, cat in sorted_seq]
-    for i in range(len(categories_only) - 1):
-        pair = (categories_only[i], categories_only[i + 1])
-        sequence_counts[pair] += 1
-
-df_seq = pd.DataFrame(
-    [(a, b, c) for (a, b), c in sequence_counts.items() if a != b],
-    columns=['Category_A', 'Category_B', 'Count']
-).sort_values('Count', ascending=False)
 
 # -----------------------------------
 # 📊 可视化部分
 # -----------------------------------
-
-# 1. 月度订单量
-plt.figure(figsize=(10, 5))
-sns.lineplot(data=df_orders, x='month', y='order_count', marker='o')
-plt.title('月度订单数量')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig('monthly_order_quantity.png', dpi=300)
-plt.close()
-
-# 2. 类别购买趋势
-plt.figure(figsize=(14, 7))
-pivot_trend = df_category_trends.pivot_table(index='month', columns='category', values='count', fill_value=0)
-pivot_trend.plot(figsize=(14, 7), marker='o')
-plt.title('各商品类别月度购买趋势')
-plt.xlabel('月份')
-plt.ylabel('购买次数')
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig('product_category_monthly_purchasing.png', dpi=300)
-plt.close()
-
-# 3. Top 时序模式
-plt.figure(figsize=(10, 6))
-top_seq = df_seq.head(10)
-sns.barplot(data=top_seq, y=top_seq['Category_A'] + ' → ' + top_seq['Category_B'], x='Count')
-plt.title('Top 10 商品类别购买顺序模式')
-plt.xlabel('次数')
-plt.ylabel('购买顺序')
-plt.tight_layout()
-plt.savefig('product_category_purchase_order.png', dpi=300)
-plt.close()
+def plot_time_series(df_orders, df_category_trends, df_seq):
+    # 1. 月度订单量
+    plt.figure(figsize=(10, 5))
+    sns.lineplot(data=df_orders, x='month', y='order_count', marker='o')
+    plt.title('月度订单数量')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig('monthly_order_quantity.png', dpi=300)
+    plt.close()
+
+    # 2. 类别购买趋势
+    plt.figure(figsize=(14, 7))
+    pivot_trend = df_category_trends.pivot_table(index='month', columns='category', values='count', fill_value=0)
+    pivot_trend.plot(figsize=(14, 7), marker='o')
+    plt.title('各商品类别月度购买趋势')
+    plt.xlabel('月份')
+    plt.ylabel('购买次数')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig('product_category_monthly_purchasing.png', dpi=300)
+    plt.close()
+
+    # 3. Top 时序模式
+    plt.figure(figsize=(10, 6))
+    top_seq = df_seq.head(10)
+    sns.barplot(data=top_seq, y=top_seq['Category_A'] + ' → ' + top_seq['Category_B'], x='Count')
+    plt.title('Top 10 商品类别购买顺序模式')
+    plt.xlabel('次数')
+    plt.ylabel('购买顺序')
+    plt.tight_layout()
+    plt.savefig('product_category_purchase_order.png', dpi=300)
+    plt.close()
+
+
+# 退款率与支付方式占比：直接在立方体上切片、汇总
+def plot_cube_shares(cube):
+    monthly_orders = cube.rollup('orders', 'month')
+    monthly_orders = monthly_orders[monthly_orders > 0]
+    months = monthly_orders.index.astype(str)
+
+    # 4. 月度退款率
+    refunds = cube.select(status=REFUND_STATUSES).rollup('orders', 'month').reindex(monthly_orders.index, fill_value=0)
+    plt.figure(figsize=(10, 5))
+    plt.plot(months, (refunds / monthly_orders).to_numpy(), marker='o')
+    plt.title('月度退款率（已退款 + 部分退款）')
+    plt.xlabel('月份')
+    plt.ylabel('退款订单占比')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig('monthly_refund_rate.png', dpi=300)
+    plt.close()
+
+    # 5. 各支付方式月度订单占比
+    methods = cube.rollup('orders', 'month', by='method').loc[monthly_orders.index]
+    shares = methods.div(monthly_orders, axis=0)
+    shares.index = months
+    shares.plot(kind='bar', stacked=True, figsize=(14, 7), width=0.9)
+    plt.title('各支付方式月度订单占比')
+    plt.xlabel('月份')
+    plt.ylabel('订单占比')
+    plt.legend(title='支付方式', bbox_to_anchor=(1.01, 1), loc='upper left')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig('monthly_payment_method_share.png', dpi=300)
+    plt.close()
+
+
+if __name__ == '__main__':
+    # 加载商品目录索引（缓存在目录文件旁，目录变化后自动重建）
+    with stage('catalog'):
+        catalog = load_catalog_index(catalog_path)
+
+    # 遍历数据文件（按分区顺序合并，结果与串行一致）
+    with stage('scan'):
+        pipeline = ScanPipeline(memory_budget_mb=memory_budget_mb)
+        pipeline.register('cube', PurchaseCubeConsumer(catalog))
+        pipeline.register('time_series', TimeSeriesConsumer(catalog, sequence_memory_mb))
+        results = pipeline.run(parquet_folder, n_workers=n_workers, partition_by=partition_by,
+                               checkpoint_dir=checkpoint_dir)
+        cube, user_purchase_sequences = results['cube'], results['time_series']
+
+    with stage('cube'):
+        cube.save(cube_path)
+        print(f"🧊 购买立方体已保存: {cube_path}（{cube.n_days} 天 × {len(cube.categories)} 个大类 × "
+              f"{len(cube.methods)} 种支付方式 × {len(cube.statuses)} 种支付状态）")
+
+    with stage('patterns'):
+        df_orders, df_category_trends, df_seq = build_time_series_tables(cube, user_purchase_sequences)
+    with stage('sequences'):
+        mine_sequential_patterns(user_purchase_sequences)
+        user_purchase_sequences.close()
+    with stage('plot'):
+        plot_time_series(df_orders, df_category_trends, df_seq)
+        plot_cube_shares(cube)
+
+    write_report(report_path)
@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import apriori
+from mlxtend.frequent_patterns import association_rules as mlxtend_association_rules
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.scan_pipeline import ScanPipeline
+from utils.mining_consumers import CategoryBasketConsumer, PaymentBasketConsumer, RefundBasketConsumer
+from utils.catalog_index import load_catalog_index
+from utils.basket_encoding import encode_baskets
+from utils.itemset_mining import ALGORITHMS, association_rules, mine_frequent_itemsets
+
+# 与 Homework2 各脚本一致的最小支持度
+MIN_SUPPORT = {'category': 0.02, 'payment': 0.01, 'refund': 0.005}
+CONSUMERS = {'category': CategoryBasketConsumer, 'payment': PaymentBasketConsumer,
+             'refund': RefundBasketConsumer}
+
+
+def load_baskets(folder, catalog_path, kind, n_workers):
+    catalog = load_catalog_index(catalog_path)
+    pipeline = ScanPipeline()
+    pipeline.register(kind, CONSUMERS[kind](catalog))
+    baskets = pipeline.run(folder, n_workers=n_workers)[kind]
+    return baskets[0] if kind == 'payment' else baskets
+
+
+def one_hot(masks, counts, items):
+    """把加权的去重购物篮展开为 mlxtend 需要的逐订单布尔矩阵"""
+    rows = np.repeat(masks, counts)
+    bits = (rows[:, None] >> np.arange(len(items), dtype=np.uint64)) & np.uint64(1)
+    return pd.DataFrame(bits.astype(bool), columns=items)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark(name, baskets, min_support, min_confidence, skip_mlxtend):
+    masks, counts, items = encode_baskets(baskets)
+    print(f"\n📦 {name}: {int(counts.sum())} 个订单，{len(masks)} 个不同购物篮，{len(items)} 个项，"
+          f"min_support={min_support}")
+
+    reference = None
+    if not skip_mlxtend:
+        df, encode_time = timed(one_hot, masks, counts, items)
+        reference, mine_time = timed(apriori, df, min_support=min_support, use_colnames=True)
+        rules, rule_time = timed(mlxtend_association_rules, reference, metric='confidence',
+                                 min_threshold=min_confidence)
+        print(f"  mlxtend apriori   : 编码 {encode_time:.3f}s  项集 {mine_time:.3f}s  规则 {rule_time:.3f}s  "
+              f"({len(reference)} 个项集, {len(rules)} 条规则)")
+        del df
+
+    for algorithm in ALGORITHMS:
+        frequent, mine_time = timed(mine_frequent_itemsets, masks, counts, items, min_support=min_support,
+                                    algorithm=algorithm, use_colnames=True)
+        rules, rule_time = timed(association_rules, frequent, metric='confidence', min_threshold=min_confidence)
+        check = ''
+        if reference is not None:
+            check = '  ✅ 与 mlxtend 一致' if frequent.equals(reference) else '  ❌ 与 mlxtend 不一致'
+        print(f"  {algorithm:<18}: 项集 {mine_time:.3f}s  规则 {rule_time:.3f}s  "
+              f"({len(frequent)} 个项集, {len(rules)} 条规则){check}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='频繁项集引擎与 mlxtend 的耗时对比')
+    parser.add_argument('folders', nargs='*', default=['./10G_data_new', './30G_data'],
+                        help='parquet 数据目录（默认 10G 与 30G 数据集）')
+    parser.add_argument('--catalog', default='./product_catalog.json')
+    parser.add_argument('--kind', choices=sorted(CONSUMERS), nargs='+', default=sorted(CONSUMERS))
+    parser.add_argument('--min-confidence', type=float, default=0.4)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--skip-mlxtend', action='store_true', help='不运行 mlxtend（订单数过多时展开矩阵会占用大量内存）')
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        for kind in args.kind:
+            baskets = load_baskets(folder, args.catalog, kind, args.workers)
+            benchmark(f'{folder} / {kind}', baskets, MIN_SUPPORT[kind], args.min_confidence, args.skip_mlxtend)
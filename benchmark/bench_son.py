@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.scan_pipeline import ScanPipeline
+from utils.catalog_index import load_catalog_index
+from utils.basket_encoding import encode_baskets
+from utils.itemset_mining import mine_frequent_itemsets
+from utils.son_mining import MINERS, LocalTransport, make_shards, son_frequent_itemsets
+
+# 与 Homework2 各脚本一致的最小支持度
+MIN_SUPPORT = {'category': 0.02, 'payment': 0.01, 'refund': 0.005}
+
+
+def single_node(folder, catalog_path, kind, n_workers):
+    pipeline = ScanPipeline().register(kind, MINERS[kind](load_catalog_index(catalog_path)))
+    baskets = pipeline.run(folder, n_workers=n_workers)[kind]
+    baskets = baskets[0] if kind == 'payment' else baskets
+    return mine_frequent_itemsets(*encode_baskets(baskets), min_support=MIN_SUPPORT[kind], use_colnames=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SON 分片挖掘随分片数的耗时，并校验与单机挖掘结果一致')
+    parser.add_argument('folder')
+    parser.add_argument('--catalog', default='./product_catalog.json')
+    parser.add_argument('--kind', choices=sorted(MINERS), default='category')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--partition-by', choices=['file', 'row_group'], default='row_group')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    expected = single_node(args.folder, args.catalog, args.kind, args.workers)
+    print(f"🖥️ 单机: {time.perf_counter() - start:.3f}s（{len(expected)} 个频繁项集）")
+
+    prefix = MINERS[args.kind].prefix
+    for n_shards in args.shards:
+        shards = make_shards(args.folder, n_shards, partition_by=args.partition_by, prefix=prefix)
+        start = time.perf_counter()
+        frequent = son_frequent_itemsets(shards, MIN_SUPPORT[args.kind], LocalTransport(args.workers),
+                                         miner=args.kind, catalog_path=args.catalog)
+        check = '✅ 一致' if frequent.equals(expected) else '❌ 不一致'
+        print(f"🧩 {len(shards):>3} 个分片: {time.perf_counter() - start:.3f}s  {check}")
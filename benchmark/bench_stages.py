@@ -0,0 +1,167 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow.parquet as pq
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'Homework1'))
+from utils.parquet_reader import iter_frames, list_parquet_files
+from utils.scan_pipeline import ScanPipeline
+from utils.mining_consumers import (CategoryBasketConsumer, PaymentBasketConsumer, RefundBasketConsumer,
+                                    TimeSeriesConsumer)
+from utils.catalog_index import MAIN_CATEGORIES, load_catalog_index
+from utils.basket_encoding import encode_baskets
+from utils.itemset_mining import association_rules, mine_frequent_itemsets
+from utils.sequence_store import count_transitions
+
+from generate_dataset import generate_dataset
+
+# 与 Homework2 商品类别挖掘一致的参数
+MIN_SUPPORT = 0.02
+MIN_CONFIDENCE = 0.4
+
+
+def count_rows(folder):
+    return sum(pq.ParquetFile(f).metadata.num_rows for f in list_parquet_files(folder))
+
+
+# 每个阶段：prepare 在父进程中执行、不计时，结果传给 run；run 在独立子进程中计时，返回处理的行数
+
+def run_load(folder, catalog_path, n_workers, context):
+    return sum(len(df) for df in iter_frames(folder))
+
+
+def run_quality(folder, catalog_path, n_workers, context):
+    from quality_check import merge_quality_reports, scan_file_quality
+    reports = []
+    for file_path in list_parquet_files(folder):
+        _, file_reports = scan_file_quality(file_path)
+        reports.extend(file_reports)
+    merge_quality_reports(reports)
+    return count_rows(folder)
+
+
+def run_high_value(folder, catalog_path, n_workers, context):
+    from user_analysis import identify_high_value_users
+    with tempfile.TemporaryDirectory() as tmp:
+        identify_high_value_users(folder, 'bench', os.path.join(tmp, 'high_value_users.csv'))
+    return count_rows(folder)
+
+
+def run_encoding(folder, catalog_path, n_workers, context):
+    catalog = load_catalog_index(catalog_path)
+    pipeline = ScanPipeline()
+    pipeline.register('category', CategoryBasketConsumer(catalog))
+    pipeline.register('payment', PaymentBasketConsumer(catalog))
+    pipeline.register('refund', RefundBasketConsumer(catalog))
+    results = pipeline.run(folder, n_workers=n_workers)
+    encode_baskets(results['category'])
+    encode_baskets(results['payment'][0])
+    encode_baskets(results['refund'])
+    return count_rows(folder)
+
+
+def prepare_mining(folder, catalog_path, n_workers):
+    catalog = load_catalog_index(catalog_path)
+    pipeline = ScanPipeline().register('category', CategoryBasketConsumer(catalog))
+    return encode_baskets(pipeline.run(folder, n_workers=n_workers)['category'])
+
+
+def run_mining(folder, catalog_path, n_workers, context):
+    masks, counts, items = context
+    frequent = mine_frequent_itemsets(masks, counts, items, min_support=MIN_SUPPORT, use_colnames=True)
+    association_rules(frequent, metric='confidence', min_threshold=MIN_CONFIDENCE)
+    # 行数为订单数
+    return int(counts.sum())
+
+
+def run_time_series(folder, catalog_path, n_workers, context):
+    catalog = load_catalog_index(catalog_path)
+    pipeline = ScanPipeline().register('time_series', TimeSeriesConsumer(catalog))
+    sequences = pipeline.run(folder, n_workers=n_workers)['time_series']
+    count_transitions(sequences, len(MAIN_CATEGORIES))
+    sequences.close()
+    return count_rows(folder)
+
+
+STAGES = {
+    'load': (None, run_load),
+    'quality': (None, run_quality),
+    'high_value': (None, run_high_value),
+    'encoding': (None, run_encoding),
+    'mining': (prepare_mining, run_mining),
+    'time_series': (None, run_time_series),
+}
+
+
+def _peak_rss_mb(who):
+    # Linux 上 ru_maxrss 的单位为 KB
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def _measure(stage, folder, catalog_path, n_workers, context):
+    # 在全新的子进程中执行，峰值内存只包含该阶段本身
+    start = time.perf_counter()
+    rows = STAGES[stage][1](folder, catalog_path, n_workers, context)
+    seconds = time.perf_counter() - start
+    return rows, seconds, _peak_rss_mb(resource.RUSAGE_SELF), _peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+
+def benchmark_stage(stage, folder, catalog_path, n_workers):
+    prepare = STAGES[stage][0]
+    context = prepare(folder, catalog_path, n_workers) if prepare else None
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        rows, seconds, rss, worker_rss = executor.submit(_measure, stage, folder, catalog_path, n_workers,
+                                                         context).result()
+    return {'stage': stage, 'rows': rows, 'seconds': round(seconds, 4),
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_mb': round(rss, 1), 'worker_peak_rss_mb': round(worker_rss, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='各处理阶段的吞吐量（行/秒）与峰值内存')
+    parser.add_argument('--data', default=None, help='已有的 parquet 目录；不指定时在临时目录生成合成数据')
+    parser.add_argument('--catalog', default=None, help='商品目录（默认与数据目录同级的 product_catalog.json）')
+    parser.add_argument('--rows', type=int, default=200_000, help='生成合成数据的行数')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', choices=list(STAGES), nargs='+', default=list(STAGES))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--json', default=None, help='把结果写入该 JSON 文件，便于比较不同版本')
+    args = parser.parse_args()
+
+    work_dir = None
+    folder, catalog_path = args.data, args.catalog
+    if folder is None:
+        work_dir = tempfile.mkdtemp(prefix='bench_stages_')
+        folder = os.path.join(work_dir, 'data')
+        start = time.perf_counter()
+        catalog_path = generate_dataset(folder, args.rows, args.files, seed=args.seed)
+        print(f"🧪 已生成 {args.rows} 行合成数据（{time.perf_counter() - start:.1f}s）")
+    elif catalog_path is None:
+        catalog_path = os.path.join(os.path.dirname(os.path.abspath(folder)), 'product_catalog.json')
+
+    try:
+        results = []
+        print(f"{'阶段':<12}{'行数':>12}{'耗时(s)':>10}{'行/秒':>14}{'峰值RSS(MB)':>14}{'子进程峰值(MB)':>16}")
+        for stage in args.stages:
+            result = benchmark_stage(stage, folder, catalog_path, args.workers)
+            results.append(result)
+            print(f"{stage:<12}{result['rows']:>12}{result['seconds']:>10.3f}{result['rows_per_sec'] or 0:>14.0f}"
+                  f"{result['peak_rss_mb']:>14.1f}{result['worker_peak_rss_mb']:>16.1f}")
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump({'data': folder, 'workers': args.workers, 'stages': results}, f,
+                          ensure_ascii=False, indent=1)
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
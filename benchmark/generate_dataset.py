@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.catalog_index import category_mapping, map_to_main_category
+
+# 目录中不在映射表里的小类（归为“其他”）
+EXTRA_SUB_CATEGORIES = ['宠物用品', '园艺工具']
+PAYMENT_METHODS = ['信用卡', '支付宝', '微信支付', '现金', '银联', '储蓄卡']
+PAYMENT_STATUSES = ['已支付', '已退款', '部分退款', '待支付']
+PAYMENT_STATUS_WEIGHTS = [0.7, 0.1, 0.1, 0.1]
+GENDERS = ['男', '女', '其他']
+GENDER_WEIGHTS = [0.48, 0.48, 0.04]
+COUNTRIES = ['中国', '美国', '日本', '英国', '德国', '法国', '印度', '巴西', '澳大利亚', '俄罗斯']
+SURNAMES = list('王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗')
+GIVEN_NAMES = list('伟芳娜敏静丽强磊军洋勇艳杰涛明超秀霞平刚桂')
+
+
+def generate_catalog(n_products, seed=0):
+    """商品目录：id 从 1 开始，小类取自映射表（另有少量映射表外的小类）"""
+    rng = np.random.default_rng(seed)
+    sub_categories = [c for subs in category_mapping.values() for c in subs] + EXTRA_SUB_CATEGORIES
+    categories = rng.choice(sub_categories, n_products)
+    prices = np.round(rng.uniform(5, 10000, n_products), 2)
+    return pd.DataFrame({'id': np.arange(1, n_products + 1), 'category': categories, 'price': prices})
+
+
+def _dates(rng, n, start, end):
+    # [start, end) 内均匀分布的日期（datetime64[D]）
+    start, end = np.datetime64(start, 'D'), np.datetime64(end, 'D')
+    return start + rng.integers(0, (end - start).astype(int), n).astype('timedelta64[D]')
+
+
+def _purchase_history(rng, n, catalog, dirty_ratio):
+    # 逐行拼接 JSON 字符串（字段顺序固定），少量行写成无法解析的内容
+    n_items = rng.integers(1, 6, n)
+    offsets = np.concatenate([[0], np.cumsum(n_items)])
+    # 约 1% 的商品 id 不在目录中
+    item_ids = rng.integers(1, int(len(catalog) * 1.01) + 2, offsets[-1])
+    prices = catalog['price'].to_numpy()
+    main_of = np.array([map_to_main_category(c) for c in catalog['category']], dtype=object)
+    known = item_ids <= len(catalog)
+    item_prices = np.where(known, prices[np.minimum(item_ids, len(catalog)) - 1], 0.0)
+    item_mains = np.where(known, main_of[np.minimum(item_ids, len(catalog)) - 1], '其他')
+    sums = np.add.reduceat(item_prices, offsets[:-1])
+    avg_prices = np.round(sums / n_items, 2)
+
+    methods = rng.choice(PAYMENT_METHODS, n)
+    statuses = rng.choice(PAYMENT_STATUSES, n, p=PAYMENT_STATUS_WEIGHTS)
+    dates = _dates(rng, n, '2023-01-01', '2026-01-01').astype(str)
+    dirty = rng.random(n) < dirty_ratio
+
+    histories = []
+    for i in range(n):
+        if dirty[i]:
+            histories.append('{"items": [' if i % 2 else None)
+            continue
+        lo, hi = offsets[i], offsets[i + 1]
+        items = ', '.join(f'{{"id": {item_id}}}' for item_id in item_ids[lo:hi])
+        categories = ','.join(item_mains[lo:hi])
+        histories.append(f'{{"avg_price": {avg_prices[i]}, "categories": "{categories}", "items": [{items}], '
+                         f'"payment_method": "{methods[i]}", "payment_status": "{statuses[i]}", '
+                         f'"purchase_date": "{dates[i]}"}}')
+    return histories
+
+
+def generate_users(n, first_id, catalog, seed, dirty_ratio=0.01):
+    """生成 n 行用户数据，列与原始数据集相同；dirty_ratio 比例的值为缺失或非法"""
+    rng = np.random.default_rng(seed)
+    ids = np.arange(first_id, first_id + n, dtype=np.int64)
+    # 少量重复 id
+    duplicated = rng.random(n) < dirty_ratio / 2
+    ids[duplicated] = rng.integers(first_id, first_id + n, int(duplicated.sum()))
+
+    user_names = np.array([f'user_{i}' for i in ids], dtype=object)
+    fullnames = np.char.add(rng.choice(SURNAMES, n), rng.choice(GIVEN_NAMES, n)).astype(object)
+    emails = np.array([f'{u}@example.com' for u in user_names], dtype=object)
+    ages = rng.integers(18, 80, n).astype(np.float64)
+    incomes = np.round(rng.lognormal(11.5, 0.8, n), 2)
+
+    def dirty(values, replacement):
+        mask = rng.random(n) < dirty_ratio
+        values[mask] = replacement
+        return values
+
+    df = pd.DataFrame({
+        'id': ids,
+        'user_name': dirty(dirty(user_names, 'bad name!'), None),
+        'fullname': dirty(fullnames, 'Tom'),
+        'email': dirty(dirty(emails, 'invalid-email'), None),
+        'age': dirty(ages, np.nan),
+        'income': incomes,
+        'gender': rng.choice(GENDERS, n, p=GENDER_WEIGHTS),
+        'country': rng.choice(COUNTRIES, n),
+        'purchase_history': _purchase_history(rng, n, catalog, dirty_ratio),
+        'is_active': rng.random(n) < 0.6,
+        'registration_date': _dates(rng, n, '2015-01-01', '2025-01-01').astype(str),
+        'last_login': np.char.add(_dates(rng, n, '2023-01-01', '2026-01-01').astype(str), 'T08:00:00+00:00'),
+    })
+    return df
+
+
+def generate_dataset(output_dir, n_rows, n_files=4, seed=0, row_group_size=100_000, n_products=1000,
+                     catalog_path=None, dirty_ratio=0.01):
+    """在 output_dir 写出 n_files 个 parquet 文件（共 n_rows 行），并写出对应的商品目录
+
+    同样的参数总是生成完全相同的数据；每个文件使用独立的随机种子，可以单独重新生成。
+    catalog_path 默认为 output_dir 同级的 product_catalog.json（与原始数据集的目录结构一致）。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if catalog_path is None:
+        catalog_path = os.path.join(os.path.dirname(os.path.abspath(output_dir)), 'product_catalog.json')
+    catalog = generate_catalog(n_products, seed)
+    with open(catalog_path, 'w', encoding='utf-8') as f:
+        json.dump({'products': catalog.to_dict(orient='records')}, f, ensure_ascii=False)
+
+    sizes = [n_rows // n_files + (i < n_rows % n_files) for i in range(n_files)]
+    first_id = 1
+    for i, size in enumerate(sizes):
+        df = generate_users(size, first_id, catalog, seed=(seed, i), dirty_ratio=dirty_ratio)
+        df.to_parquet(os.path.join(output_dir, f'part-{i:05d}.parquet'), index=False, row_group_size=row_group_size)
+        first_id += size
+    return catalog_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成与原始数据集结构相同的合成 parquet 数据')
+    parser.add_argument('output_dir', help='parquet 输出目录，例如 ./bench_data/1M_data')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--row-group-size', type=int, default=100_000)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--catalog', default=None, help='商品目录路径（默认与输出目录同级的 product_catalog.json）')
+    parser.add_argument('--dirty-ratio', type=float, default=0.01, help='缺失 / 非法值的比例')
+    args = parser.parse_args()
+
+    catalog_path = generate_dataset(args.output_dir, args.rows, args.files, args.seed, args.row_group_size,
+                                    args.products, args.catalog, args.dirty_ratio)
+    print(f"✅ 已生成 {args.rows} 行数据到 {args.output_dir}，商品目录 {catalog_path}")
@@ -0,0 +1 @@
+# Homework1 / Homework2 共用的数据读取与挖掘工具
@@ -0,0 +1,111 @@
+from collections import Counter
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+# 每个项占 uint64 中的一位
+MAX_ITEMS = 64
+
+
+def count_baskets(transactions, baskets=None):
+    """把交易折叠为 {排序后的项元组: 出现次数}，相同的购物篮只保留一份"""
+    if baskets is None:
+        baskets = Counter()
+    baskets.update(tuple(sorted(set(t))) for t in transactions)
+    return baskets
+
+
+def encode_baskets(baskets, items=None):
+    """把折叠后的购物篮编码为 (位掩码, 次数, 项列表)
+
+    项按名称排序（与 TransactionEncoder.columns_ 一致），第 i 项对应第 i 位。
+    相同位掩码的购物篮会再合并一次，返回的掩码互不相同。
+    """
+    if items is None:
+        items = sorted({item for basket in baskets for item in basket})
+    if len(items) > MAX_ITEMS:
+        raise ValueError(f"项数 {len(items)} 超过位掩码上限 {MAX_ITEMS}")
+    bit_of = {item: np.uint64(1) << np.uint64(i) for i, item in enumerate(items)}
+
+    masks = np.zeros(len(baskets), dtype=np.uint64)
+    counts = np.zeros(len(baskets), dtype=np.int64)
+    for row, (basket, count) in enumerate(baskets.items()):
+        mask = np.uint64(0)
+        for item in basket:
+            mask |= bit_of[item]
+        masks[row] = mask
+        counts[row] = count
+
+    masks, inverse = np.unique(masks, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(masks)).astype(np.int64)
+    return masks, counts, items
+
+
+def itemset_mask(indices):
+    mask = np.uint64(0)
+    for i in indices:
+        mask |= np.uint64(1) << np.uint64(i)
+    return mask
+
+
+def support_counts(masks, counts, candidate_masks):
+    """在加权的去重购物篮上统计每个候选项集的出现次数"""
+    return np.array([counts[(masks & c) == c].sum() for c in candidate_masks], dtype=np.int64)
+
+
+def index_limits(items, item_limits):
+    """把 [(项名称集合, 上限)] 转为 [(项序号位掩码, 上限)]，不在 items 中的名称忽略"""
+    if not item_limits:
+        return []
+    index_of = {item: i for i, item in enumerate(items)}
+    return [(itemset_mask(index_of[item] for item in group if item in index_of), limit)
+            for group, limit in item_limits]
+
+
+def within_limits(itemset, limits):
+    """项集（项序号元组）在每个限制组中的项数都不超过上限；这类约束是反单调的，可在候选生成时剪枝"""
+    mask = itemset_mask(itemset)
+    return all(bin(int(mask & group)).count('1') <= limit for group, limit in limits)
+
+
+def _next_candidates(frequent):
+    # 与 mlxtend 相同：对字典序排列的频繁 k 项集，用更大的项扩展为 k+1 项集
+    items_in_level = sorted({i for itemset in frequent for i in itemset})
+    candidates = []
+    for itemset in frequent:
+        candidates.extend(itemset + (item,) for item in items_in_level if item > itemset[-1])
+    # 所有 k 子集都频繁的候选才需要计数
+    frequent_set = set(frequent)
+    return [c for c in candidates
+            if all(sub in frequent_set for sub in combinations(c, len(c) - 1))]
+
+
+def basket_apriori(masks, counts, items, min_support=0.5, use_colnames=False, max_len=None, item_limits=None):
+    """在 (位掩码, 次数) 表示的购物篮上运行 Apriori
+
+    输出与 mlxtend.frequent_patterns.apriori 相同：support / itemsets 两列，
+    按项集长度、再按列序号的字典序排列，support = 次数 / 交易总数。
+    item_limits 为 [(项名称集合, 上限)]，超出上限的候选不生成也不计数。
+    """
+    n_rows = counts.sum()
+    limits = index_limits(items, item_limits)
+    level = [(i,) for i in range(len(items)) if within_limits((i,), limits)]
+    supports, itemsets = [], []
+    k = 1
+    while level and (max_len is None or k <= max_len):
+        level_counts = support_counts(masks, counts, [itemset_mask(c) for c in level])
+        level_support = level_counts / n_rows
+        keep = level_support >= min_support
+        frequent = [c for c, ok in zip(level, keep) if ok]
+        supports.extend(level_support[keep])
+        itemsets.extend(frequent)
+        level = [c for c in _next_candidates(frequent) if within_limits(c, limits)]
+        k += 1
+
+    if use_colnames:
+        itemsets = [frozenset(items[i] for i in c) for c in itemsets]
+    else:
+        itemsets = [frozenset(c) for c in itemsets]
+    return pd.DataFrame({'support': np.array(supports, dtype=np.float64),
+                         'itemsets': pd.Series(itemsets, dtype=object)})
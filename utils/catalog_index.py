@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# 商品类别映射表（小类到大类）
+category_mapping = {
+    '电子产品': ['智能手机', '笔记本电脑', '平板电脑', '智能手表', '耳机', '音响', '相机', '摄像机', '游戏机'],
+    '服装': ['上衣', '裤子', '裙子', '内衣', '鞋子', '帽子', '手套', '围巾', '外套'],
+    '食品': ['零食', '饮料', '调味品', '米面', '水产', '肉类', '蛋奶', '水果', '蔬菜'],
+    '家居': ['家具', '床上用品', '厨具', '卫浴用品'],
+    '办公': ['文具', '办公用品'],
+    '运动户外': ['健身器材', '户外装备'],
+    '玩具': ['玩具', '模型', '益智玩具'],
+    '母婴': ['婴儿用品', '儿童课外读物'],
+    '汽车用品': ['车载电子', '汽车装饰'],
+}
+
+# 不在映射表中的小类统一归为“其他”
+OTHER_CATEGORY = '其他'
+
+# 大类编码：category_mapping 的顺序，最后一个为“其他”
+MAIN_CATEGORIES = list(category_mapping) + [OTHER_CATEGORY]
+OTHER_CODE = len(MAIN_CATEGORIES) - 1
+MISSING = -1
+
+# 商品 id 不超过该值（相对商品数）时使用稠密查找表，否则用二分查找
+DENSE_TABLE_FACTOR = 8
+DENSE_TABLE_MIN = 1 << 16
+
+# 缓存格式变化时递增，旧缓存随之失效
+INDEX_VERSION = 1
+
+
+def map_to_main_category(cat):
+    for main_cat, sub_cats in category_mapping.items():
+        if cat in sub_cats:
+            return main_cat
+    return OTHER_CATEGORY
+
+
+def catalog_fingerprint(catalog_path):
+    """商品目录文件的 (大小, 修改时间)，任一变化都视为目录已更新"""
+    stat = os.stat(catalog_path)
+    return np.array([INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _mapping_signature():
+    return json.dumps(category_mapping, ensure_ascii=False, sort_keys=True)
+
+
+def index_cache_path(catalog_path):
+    return os.path.splitext(catalog_path)[0] + '.index.npz'
+
+
+class CatalogIndex:
+    """商品目录的数组索引：商品 id → 稠密编码 → 小类 / 大类编码、价格
+
+    所有查找都接受整个 item id 数组，一次 gather 完成；目录中不存在的商品
+    得到编码 MISSING（-1）、价格 NaN。
+    """
+
+    def __init__(self, product_ids, sub_codes, prices, sub_categories):
+        order = np.argsort(product_ids, kind='stable')
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)[order]
+        if len(self.product_ids) and np.any(self.product_ids[1:] == self.product_ids[:-1]):
+            raise ValueError("商品目录中存在重复的商品 id")
+        self.sub_codes = np.asarray(sub_codes, dtype=np.int64)[order]
+        self.prices = np.asarray(prices, dtype=np.float64)[order]
+        self.sub_categories = np.asarray(sub_categories, dtype=str)
+        # 由 load_catalog_index 设置为目录文件指纹，用于判断基于该目录的检查点是否有效
+        self.version = None
+        sub_to_main = np.array([MAIN_CATEGORIES.index(map_to_main_category(c)) for c in self.sub_categories],
+                               dtype=np.int64)
+        self.main_codes = sub_to_main[self.sub_codes] if len(self.sub_codes) else np.zeros(0, dtype=np.int64)
+
+        # 末尾追加一个哨兵，编码为 -1 的商品直接落在哨兵上
+        self._main_codes = np.append(self.main_codes, MISSING)
+        self._sub_codes = np.append(self.sub_codes, MISSING)
+        self._prices = np.append(self.prices, np.nan)
+
+        self._table = None
+        if len(self.product_ids) and self.product_ids[0] >= 0 and \
+                self.product_ids[-1] < max(DENSE_TABLE_FACTOR * len(self.product_ids), DENSE_TABLE_MIN):
+            self._table = np.full(self.product_ids[-1] + 1, MISSING, dtype=np.int64)
+            self._table[self.product_ids] = np.arange(len(self.product_ids))
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def codes(self, item_ids):
+        """商品 id 数组 → 稠密编码数组（0..len-1），不存在的商品为 -1"""
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        if self._table is not None:
+            in_range = (item_ids >= 0) & (item_ids < len(self._table))
+            return np.where(in_range, self._table[np.where(in_range, item_ids, 0)], MISSING)
+
+        if not len(self.product_ids):
+            return np.full(item_ids.shape, MISSING, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.product_ids, item_ids), len(self.product_ids) - 1)
+        return np.where(self.product_ids[pos] == item_ids, pos, MISSING)
+
+    def main_codes_of(self, item_ids):
+        return self._main_codes[self.codes(item_ids)]
+
+    def sub_codes_of(self, item_ids):
+        return self._sub_codes[self.codes(item_ids)]
+
+    def prices_of(self, item_ids):
+        return self._prices[self.codes(item_ids)]
+
+    def main_categories(self):
+        """目录中出现过的大类名称"""
+        return {MAIN_CATEGORIES[c] for c in np.unique(self.main_codes)}
+
+    def save(self, path, fingerprint):
+        # 先写临时文件再替换，避免并发读到半个缓存
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, fingerprint=fingerprint, mapping=np.array(_mapping_signature()),
+                     product_ids=self.product_ids, sub_codes=self.sub_codes, prices=self.prices,
+                     sub_categories=self.sub_categories)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_catalog(cls, catalog_path):
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        product_df = pd.DataFrame(catalog['products'])
+        sub_codes, sub_categories = pd.factorize(product_df['category'].astype(str))
+        return cls(product_df['id'].to_numpy(), sub_codes, product_df['price'].to_numpy(dtype=np.float64),
+                   np.asarray(sub_categories))
+
+    @classmethod
+    def from_cache(cls, path, fingerprint):
+        """读取缓存；缓存不存在、目录已变化或映射表已修改时返回 None"""
+        try:
+            with np.load(path) as cached:
+                if not np.array_equal(cached['fingerprint'], fingerprint) or \
+                        str(cached['mapping']) != _mapping_signature():
+                    return None
+                return cls(cached['product_ids'], cached['sub_codes'], cached['prices'], cached['sub_categories'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def load_catalog_index(catalog_path, use_cache=True):
+    """加载商品目录索引，优先使用目录旁的 .index.npz 缓存，目录文件变化后自动重建"""
+    fingerprint = catalog_fingerprint(catalog_path)
+    cache_path = index_cache_path(catalog_path)
+    index = CatalogIndex.from_cache(cache_path, fingerprint) if use_cache else None
+    if index is None:
+        index = CatalogIndex.from_catalog(catalog_path)
+        if use_cache:
+            try:
+                index.save(cache_path, fingerprint)
+            except OSError as e:
+                print(f"⚠️ 无法写入商品目录索引缓存 {cache_path}: {e}")
+    mapping_digest = hashlib.sha1(_mapping_signature().encode('utf-8')).hexdigest()[:8]
+    index.version = '-'.join(str(v) for v in fingerprint) + f'-{mapping_digest}'
+    return index
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import pickle
+
+MANIFEST_NAME = 'manifest.json'
+# 检查点格式变化时递增，旧检查点随之失效
+CHECKPOINT_VERSION = 3
+
+
+def partition_key(partition):
+    """分区在清单中的键：文件绝对路径，按 row group 切分时附加 row group 序号"""
+    file_path, row_groups = partition
+    key = os.path.abspath(file_path)
+    if row_groups is not None:
+        key += '#' + ','.join(str(rg) for rg in row_groups)
+    return key
+
+
+def file_fingerprint(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _atomic_write(path, write):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class CheckpointManifest:
+    """按分区保存各消费者的部分结果
+
+    清单 manifest.json 记录每个分区对应文件的 (大小, 修改时间) 和各消费者的检查点文件；
+    文件未变化且消费者的 checkpoint_key 相同的分区直接读取检查点，无需重新扫描。
+    清单只由主进程写入，检查点文件由处理该分区的进程写入。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('version') == CHECKPOINT_VERSION:
+                self.entries = manifest['partitions']
+
+    def file_prefix(self, partition, name):
+        """分区 + 消费者对应的检查点文件路径前缀（不含扩展名）"""
+        digest = hashlib.sha1(partition_key(partition).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f'{digest}.{name}')
+
+    def is_current(self, partition, keys):
+        """keys 为 {消费者名: checkpoint_key}，全部检查点都存在且有效时返回 True"""
+        entry = self.entries.get(partition_key(partition))
+        if entry is None or entry['file'] != file_fingerprint(partition[0]):
+            return False
+        checkpoints = entry['checkpoints']
+        return all(name in checkpoints and checkpoints[name]['key'] == key and
+                   os.path.exists(checkpoints[name]['path']) for name, key in keys.items())
+
+    def save_states(self, partition, states):
+        """把分区的各消费者状态写入检查点文件，返回 {消费者名: 文件路径}"""
+        paths = {}
+        for name, state in states.items():
+            paths[name] = self.file_prefix(partition, name) + '.pkl'
+            _atomic_write(paths[name], lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL))
+        return paths
+
+    def load_states(self, partition, names):
+        checkpoints = self.entries[partition_key(partition)]['checkpoints']
+        states = {}
+        for name in names:
+            with open(checkpoints[name]['path'], 'rb') as f:
+                states[name] = pickle.load(f)
+        return states
+
+    def record(self, partition, fingerprint, keys, paths):
+        """登记分区的检查点并立即写回清单，中途中断时已完成的分区不会丢失
+
+        fingerprint 应在扫描前取得，扫描期间文件被修改时下次运行会重新扫描。
+        文件未变化时保留其他消费者（如其他脚本）在该分区上的检查点，文件变化后旧检查点全部作废。
+        """
+        key = partition_key(partition)
+        entry = self.entries.get(key)
+        checkpoints = entry['checkpoints'] if entry is not None and entry['file'] == fingerprint else {}
+        checkpoints.update({name: {'key': keys[name], 'path': paths[name]} for name in paths})
+        self.entries[key] = {'file': fingerprint, 'checkpoints': checkpoints}
+        manifest = {'version': CHECKPOINT_VERSION, 'partitions': self.entries}
+        _atomic_write(self.path, lambda f: f.write(json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')))
@@ -0,0 +1,177 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from utils.parallel import list_partitions, map_partitions
+from utils.parquet_reader import DEFAULT_MEMORY_BUDGET_MB
+from utils.purchase_sidecar import iter_decoded
+from utils.sketches import HyperLogLog, KLLSketch, MisraGries
+
+# 默认统计频繁项的列（purchase_history 中的字段以 "purchase_history." 为前缀）
+DEFAULT_TOPK_COLUMNS = ('country', 'gender', 'purchase_history.payment_method')
+# 输出的分位数
+PROFILE_QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+
+def _comparable(values):
+    # min/max 只在可比较的取值上计算：数值、时间或字符串
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values) or \
+            pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    # 每块只推断一次类型，只有混合类型的 object 列才逐行筛选字符串
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind == 'string':
+        return values
+    if not kind.startswith('mixed'):
+        return values.iloc[:0]
+    return values[values.map(lambda v: isinstance(v, str))]
+
+
+class ColumnProfile:
+    """单列的可合并摘要：行数、缺失数、最小/最大值、HLL 去重数、KLL 分位数、Misra-Gries 频繁项"""
+
+    def __init__(self, name, topk=None, hll_p=14, kll_k=200):
+        self.name = name
+        self.dtype = None
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog(hll_p)
+        self.quantiles = None  # 数值（含时间）列才建立 KLL
+        self.kll_k = kll_k
+        self.frequent = MisraGries(topk) if topk else None
+
+    def update(self, series):
+        self.count += len(series)
+        present = series.dropna()
+        self.nulls += len(series) - len(present)
+        if self.dtype is None:
+            self.dtype = str(series.dtype)
+        if present.empty:
+            return self
+
+        comparable = _comparable(present)
+        if len(comparable):
+            lo, hi = comparable.min(), comparable.max()
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+
+        values = present.to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        self.distinct.update(values)
+
+        if pd.api.types.is_datetime64_any_dtype(present):
+            numeric = present.to_numpy(dtype='datetime64[ns]').view(np.int64).astype(np.float64)
+        elif pd.api.types.is_numeric_dtype(present) and not pd.api.types.is_bool_dtype(present):
+            numeric = present.to_numpy(dtype=np.float64)
+        else:
+            numeric = None
+        if numeric is not None:
+            if self.quantiles is None:
+                self.quantiles = KLLSketch(self.kll_k)
+            self.quantiles.update(numeric)
+
+        if self.frequent is not None:
+            self.frequent.update(present.to_numpy())
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.nulls += other.nulls
+        self.dtype = self.dtype or other.dtype
+        for bound, pick in (('min', min), ('max', max)):
+            mine, theirs = getattr(self, bound), getattr(other, bound)
+            if theirs is not None:
+                setattr(self, bound, theirs if mine is None else pick(mine, theirs))
+        self.distinct.merge(other.distinct)
+        if other.quantiles is not None:
+            self.quantiles = other.quantiles if self.quantiles is None else self.quantiles.merge(other.quantiles)
+        if self.frequent is not None and other.frequent is not None:
+            self.frequent.merge(other.frequent)
+        return self
+
+    def summary(self, qs=PROFILE_QUANTILES):
+        row = {'column': self.name, 'dtype': self.dtype, 'count': self.count, 'nulls': self.nulls,
+               'null_ratio': self.nulls / self.count if self.count else 0.0,
+               'min': self.min, 'max': self.max, 'distinct≈': int(round(self.distinct.estimate()))}
+        values = self.quantiles.quantiles(qs) if self.quantiles is not None else np.full(len(qs), np.nan)
+        if self.dtype is not None and self.dtype.startswith('datetime64'):
+            values = pd.to_datetime(values.astype(np.int64), unit='ns')
+        for q, value in zip(qs, values):
+            row[f'p{int(q * 100):02d}'] = value
+        return row
+
+
+class DatasetProfile:
+    """逐列 ColumnProfile 的集合，新出现的列自动加入"""
+
+    def __init__(self, topk_columns=DEFAULT_TOPK_COLUMNS, topk=20):
+        self.topk_columns = tuple(topk_columns)
+        self.topk = topk
+        self.columns = {}
+
+    def _column(self, name):
+        if name not in self.columns:
+            self.columns[name] = ColumnProfile(name, self.topk if name in self.topk_columns else None)
+        return self.columns[name]
+
+    def update(self, df):
+        for name in df.columns:
+            self._column(name).update(df[name])
+        return self
+
+    def merge(self, other):
+        for name, profile in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(profile)
+            else:
+                self.columns[name] = profile
+        return self
+
+    def to_frame(self):
+        return pd.DataFrame([profile.summary() for profile in self.columns.values()]).set_index('column')
+
+    def frequent_items(self, n=10):
+        """{列名: 频繁项 Series}，计数为下界"""
+        return {name: profile.frequent.top(n) for name, profile in self.columns.items()
+                if profile.frequent is not None}
+
+
+def purchase_fields(purchases, index):
+    """把 purchase_history 解析出的标量字段展开为列，便于与顶层列一起画像"""
+    return pd.DataFrame({
+        'purchase_history.payment_method': purchases.labels('payment_method'),
+        'purchase_history.payment_status': purchases.labels('payment_status'),
+        'purchase_history.categories': purchases.labels('categories'),
+        'purchase_history.avg_price': purchases.avg_price,
+        'purchase_history.purchase_date': purchases.purchase_date,
+        'purchase_history.item_count': np.where(purchases.valid, purchases.item_counts(), np.nan),
+    }, index=index)
+
+
+def profile_partition(partition, topk_columns=DEFAULT_TOPK_COLUMNS, topk=20,
+                      memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    file_path, row_groups = partition
+    profile = DatasetProfile(topk_columns, topk)
+    for df, purchases in iter_decoded(file_path, memory_budget_mb=memory_budget_mb, row_groups=row_groups):
+        # 原始 JSON 字符串本身没有画像意义，替换为解析出的字段
+        df = pd.concat([df.drop(columns='purchase_history', errors='ignore'), purchase_fields(purchases, df.index)],
+                       axis=1)
+        profile.update(df)
+    return profile
+
+
+def profile_dataset(source, topk_columns=DEFAULT_TOPK_COLUMNS, topk=20, n_workers=None, partition_by='file',
+                    memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """一次并行扫描为所有列建立摘要：每个分区各自建立 DatasetProfile，再按分区顺序合并
+
+    内存占用与列数、草图大小有关，与行数无关。
+    """
+    worker = partial(profile_partition, topk_columns=topk_columns, topk=topk, memory_budget_mb=memory_budget_mb)
+    total = DatasetProfile(topk_columns, topk)
+    for partial_profile in map_partitions(worker, list_partitions(source, by=partition_by), n_workers):
+        total.merge(partial_profile)
+    return total
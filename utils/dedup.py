@@ -0,0 +1,181 @@
+import math
+import os
+import shutil
+import tempfile
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.parquet_reader import (DEFAULT_MEMORY_BUDGET_MB, PANDAS_EXPANSION, estimate_row_bytes, iter_frames,
+                                  resolve_sources)
+
+# 默认检查全局唯一性的列
+DEFAULT_KEY_COLUMNS = ('id', 'email', 'user_name')
+
+# 每条溢写记录除取值外的开销：文件序号 int32 + 行号 int64
+RECORD_OVERHEAD = 12
+
+
+class DuplicateReport(NamedTuple):
+    """一列在整个数据集上的重复情况"""
+    column: str
+    non_null: int           # 非空值个数
+    duplicate_values: int   # 出现不止一次的取值个数
+    duplicate_rows: int     # 多余的行数（每个重复取值保留一行）
+    cross_file_values: int  # 出现在不止一个文件中的重复取值个数
+    samples: pd.DataFrame   # 至多 sample_size 个重复取值，各取至多 sample_size 处出现位置：取值 / file / row
+
+
+def suggest_buckets(files, columns, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """按 parquet 元数据估算每列溢写数据量，使单个桶读回内存后不超过预算"""
+    largest = 0
+    for column in columns:
+        total = 0
+        for file_path in files:
+            try:
+                parquet_file = pq.ParquetFile(file_path)
+            except Exception:
+                continue
+            row_bytes = estimate_row_bytes(parquet_file, [column]) * PANDAS_EXPANSION + RECORD_OVERHEAD
+            total += parquet_file.metadata.num_rows * row_bytes
+        largest = max(largest, total)
+    return max(1, math.ceil(largest / (memory_budget_mb * 1024 * 1024)))
+
+
+def _normalize(values):
+    # 含缺失值的整数列在部分数据块中会变成 float，去掉缺失值后转回整数，保证同一取值哈希一致
+    if values.dtype.kind == 'f' and len(values) and np.all(np.mod(values, 1) == 0):
+        return values.astype(np.int64)
+    return values
+
+
+class _BucketSpill:
+    """按键的哈希把 (取值, 文件序号, 行号) 分到 n_buckets 个磁盘桶，缓冲超过预算时写出"""
+
+    def __init__(self, directory, columns, n_buckets, memory_budget_mb):
+        self.directory = directory
+        self.columns = columns
+        self.n_buckets = n_buckets
+        self.budget_bytes = memory_budget_mb * 1024 * 1024
+        self.buffers = {(c, b): [] for c in columns for b in range(n_buckets)}
+        self.buffered_bytes = 0
+        self.n_flushes = 0
+
+    def bucket_dir(self, column, bucket):
+        return os.path.join(self.directory, f'{self.columns.index(column)}', f'{bucket:05d}')
+
+    def add(self, file_index, row_offset, df):
+        for column in self.columns:
+            series = df[column]
+            present = series.notna().to_numpy()
+            values = _normalize(series.to_numpy()[present])
+            rows = row_offset + np.flatnonzero(present)
+            buckets = pd.util.hash_array(values) % np.uint64(self.n_buckets)
+            order = np.argsort(buckets, kind='stable')
+            bounds = np.searchsorted(buckets[order], np.arange(self.n_buckets + 1))
+            for bucket in range(self.n_buckets):
+                idx = order[bounds[bucket]:bounds[bucket + 1]]
+                if len(idx):
+                    self.buffers[(column, bucket)].append((values[idx], file_index, rows[idx]))
+            self.buffered_bytes += int(series.memory_usage(index=False, deep=True)) + RECORD_OVERHEAD * len(rows)
+        if self.buffered_bytes > self.budget_bytes:
+            self.flush()
+
+    def flush(self):
+        for (column, bucket), parts in self.buffers.items():
+            if not parts:
+                continue
+            table = pa.table({
+                'value': pa.array(np.concatenate([values for values, _, _ in parts])),
+                'file': pa.array(np.concatenate([np.full(len(rows), f, dtype=np.int32) for _, f, rows in parts])),
+                'row': pa.array(np.concatenate([rows for _, _, rows in parts]).astype(np.int64)),
+            })
+            directory = self.bucket_dir(column, bucket)
+            os.makedirs(directory, exist_ok=True)
+            pq.write_table(table, os.path.join(directory, f'part-{self.n_flushes:05d}.parquet'))
+            parts.clear()
+        self.buffered_bytes = 0
+        self.n_flushes += 1
+
+    def read_bucket(self, column, bucket):
+        directory = self.bucket_dir(column, bucket)
+        if not os.path.isdir(directory):
+            return None
+        tables = [pq.read_table(os.path.join(directory, f)) for f in sorted(os.listdir(directory))]
+        return pa.concat_tables(tables, promote_options='default').to_pandas()
+
+
+def _confirm_column(spill, column, files, sample_size):
+    """逐桶精确比对取值：每个桶单独读回内存，同一取值一定落在同一个桶"""
+    non_null = duplicate_values = duplicate_rows = cross_file_values = 0
+    samples = []
+    for bucket in range(spill.n_buckets):
+        records = spill.read_bucket(column, bucket)
+        if records is None:
+            continue
+        non_null += len(records)
+        duplicated = records[records['value'].duplicated(keep=False)]
+        if duplicated.empty:
+            continue
+        groups = duplicated.groupby('value', sort=True)
+        sizes = groups.size()
+        duplicate_values += len(sizes)
+        duplicate_rows += int(sizes.sum() - len(sizes))
+        cross_file_values += int((groups['file'].nunique() > 1).sum())
+        wanted = sample_size - sum(s['value'].nunique() for s in samples)
+        if wanted > 0:
+            chosen = sizes.index[:wanted]
+            rows = duplicated[duplicated['value'].isin(chosen)].sort_values(['value', 'file', 'row'])
+            samples.append(rows.groupby('value', sort=False).head(sample_size))
+
+    sample_df = pd.concat(samples, ignore_index=True) if samples else pd.DataFrame(columns=['value', 'file', 'row'])
+    sample_df['file'] = [os.path.basename(files[i]) for i in sample_df['file']]
+    sample_df = sample_df.rename(columns={'value': column})
+    return DuplicateReport(column, non_null, duplicate_values, duplicate_rows, cross_file_values, sample_df)
+
+
+def find_duplicates(source, columns=DEFAULT_KEY_COLUMNS, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                    n_buckets=None, spill_dir=None, sample_size=5, prefix=None):
+    """在整个数据集上查找 columns 中各列的重复取值，返回 {列名: DuplicateReport}
+
+    第一遍流式读取各键列，按取值哈希分到磁盘桶（同一取值必然在同一个桶）；
+    第二遍逐桶读回做精确比对。内存占用只取决于 memory_budget_mb，与数据集大小无关。
+    n_buckets 默认由 parquet 元数据估算；溢写目录默认在系统临时目录下，结束后删除。
+    """
+    columns = list(columns)
+    files = resolve_sources(source, prefix)
+    if n_buckets is None:
+        n_buckets = suggest_buckets(files, columns, memory_budget_mb)
+
+    work_dir = tempfile.mkdtemp(prefix='dedup_', dir=spill_dir)
+    try:
+        spill = _BucketSpill(work_dir, columns, n_buckets, memory_budget_mb)
+        for file_index, file_path in enumerate(files):
+            row_offset = 0
+            for df in iter_frames(file_path, columns=columns, memory_budget_mb=memory_budget_mb):
+                spill.add(file_index, row_offset, df)
+                row_offset += len(df)
+        spill.flush()
+        return {column: _confirm_column(spill, column, files, sample_size) for column in columns}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def read_rows(file_path, rows, columns=None):
+    """按文件内行号读取若干行，只读取这些行所在的 row group"""
+    parquet_file = pq.ParquetFile(file_path)
+    starts = np.cumsum([0] + [parquet_file.metadata.row_group(rg).num_rows
+                              for rg in range(parquet_file.metadata.num_row_groups)])
+    rows = np.asarray(rows, dtype=np.int64)
+    row_groups = np.searchsorted(starts, rows, side='right') - 1
+    parts = []
+    for rg in np.unique(row_groups):
+        table = parquet_file.read_row_group(int(rg), columns=columns)
+        local = rows[row_groups == rg] - starts[rg]
+        parts.append(table.take(pa.array(local)).to_pandas().assign(row=rows[row_groups == rg]))
+    if not parts:
+        return pd.DataFrame(columns=(columns or []) + ['row'])
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,205 @@
+import json
+import os
+from typing import NamedTuple
+
+from utils.basket_encoding import encode_baskets, itemset_mask, support_counts
+from utils.checkpoint import _atomic_write, file_fingerprint, partition_key
+from utils.itemset_mining import _to_frame, mine_frequent_itemsets, min_support_count
+from utils.parallel import list_partitions
+from utils.sampled_mining import negative_border
+
+# 状态文件格式变化时递增，旧状态文件随之失效（改为完整挖掘）
+STATE_VERSION = 2
+
+
+class UpdateSummary(NamedTuple):
+    """一次增量更新的情况"""
+    delta_rows: int       # 新增交易数
+    promoted: int         # 原负边界中变为频繁的项集数
+    demoted: int          # 原频繁项集中变为不频繁的项集数
+    new_candidates: int   # 负边界扩展后需要重新计数的项集数
+    old_data_scanned: bool  # 是否为新候选扫描了旧数据
+
+
+class IncrementalItemsets:
+    """FUP 增量维护：保存全部频繁项集及其负边界的绝对次数
+
+    新分区到达时只在增量数据上统计已保存项集的次数并按新的交易总数重新判定；负边界中没有项集
+    变为频繁时结果即为完整的频繁项集。否则负边界向外扩展，只有扩展出的新候选（全部子集都频繁、
+    且只含旧数据中出现过的项）才需要在旧数据上计数。只支持新增分区，旧分区被修改或删除时需完整重算。
+    """
+
+    def __init__(self, min_support, max_len=None, source_key=None):
+        self.min_support = min_support
+        self.max_len = max_len
+        self.source_key = source_key  # 购物篮消费者的 checkpoint_key（含商品目录版本），变化后次数不能累加
+        self.n = 0
+        self.items = []     # 出现过的全部项（按名称排序），第 i 项对应位掩码第 i 位
+        self.counts = {}    # {项名称元组: 次数}，频繁项集 + 负边界
+        self.partitions = {}  # {分区键: 文件指纹}，已纳入的分区
+
+    @property
+    def min_count(self):
+        # 没有交易时任何项集都不频繁
+        return min_support_count(self.min_support, self.n) if self.n else 1
+
+    def _keep(self, items, totals):
+        # 只保留频繁项集与负边界，返回 (频繁项集, 负边界)（项序号元组）
+        min_count = self.min_count
+        frequent = [c for c, n in totals.items() if n >= min_count]
+        border = negative_border(frequent, len(items), self.max_len)
+        self.items = list(items)
+        self.counts = {tuple(items[i] for i in c): totals[c] for c in frequent + border}
+        return frequent, border
+
+    def build(self, baskets, algorithm='bitset'):
+        """在全部购物篮 {购物篮: 次数} 上完整挖掘，建立初始状态"""
+        masks, counts, items = encode_baskets(baskets)
+        self.n = int(counts.sum())
+        if not self.n:
+            return self
+        frequent = mine_frequent_itemsets(masks, counts, items, min_support=self.min_support, algorithm=algorithm,
+                                          max_len=self.max_len)
+        itemsets = [tuple(sorted(c)) for c in frequent['itemsets']]
+        border = negative_border(itemsets, len(items), self.max_len)
+        totals = support_counts(masks, counts, [itemset_mask(c) for c in itemsets + border])
+        self._keep(items, dict(zip(itemsets + border, totals.tolist())))
+        return self
+
+    def update(self, delta_baskets, old_baskets):
+        """纳入新增交易 delta_baskets（{购物篮: 次数}），返回 UpdateSummary
+
+        old_baskets 为返回旧数据 {购物篮: 次数} 的函数，只在负边界扩展出的新候选需要旧次数时调用一次。
+        """
+        old_items = set(self.items)
+        items = sorted(old_items | {item for basket in delta_baskets for item in basket})
+        index_of = {item: i for i, item in enumerate(items)}
+        masks, counts, _ = encode_baskets(delta_baskets, items)
+
+        # 已保存的项集：旧次数 + 增量次数
+        known = [tuple(index_of[item] for item in c) for c in self.counts]
+        min_count = self.min_count
+        was_frequent = {c for c, n in zip(known, self.counts.values()) if n >= min_count}
+        delta = support_counts(masks, counts, [itemset_mask(c) for c in known])
+        totals = {c: n + int(d) for c, n, d in zip(known, self.counts.values(), delta)}
+        self.n += int(counts.sum())
+        min_count = self.min_count
+        promoted = sum(1 for c in known if c not in was_frequent and totals[c] >= min_count)
+
+        # 负边界中有项集变为频繁时逐层扩展，直到新的负边界全部已计数
+        old_data, new_candidates = None, 0
+        while True:
+            frequent = [c for c, n in totals.items() if n >= min_count]
+            missing = [c for c in negative_border(frequent, len(items), self.max_len) if c not in totals]
+            if not missing:
+                break
+            new_candidates += len(missing)
+            missing_counts = support_counts(masks, counts, [itemset_mask(c) for c in missing])
+            # 含新项的候选在旧数据中不可能出现，旧次数为 0
+            on_old = [k for k, c in enumerate(missing) if all(items[i] in old_items for i in c)]
+            if on_old:
+                if old_data is None:
+                    old_data = encode_baskets(old_baskets(), items)[:2]
+                missing_counts[on_old] += support_counts(*old_data, [itemset_mask(missing[k]) for k in on_old])
+            totals.update(zip(missing, missing_counts.tolist()))
+
+        frequent, _ = self._keep(items, totals)
+        demoted = len(was_frequent - set(frequent))
+        return UpdateSummary(int(counts.sum()), promoted, demoted, new_candidates, old_data is not None)
+
+    def frequent_itemsets(self):
+        """当前的频繁项集，格式与 mine_frequent_itemsets(use_colnames=True) 相同"""
+        index_of = {item: i for i, item in enumerate(self.items)}
+        min_count = self.min_count
+        return _to_frame({tuple(index_of[item] for item in c): n for c, n in self.counts.items()
+                          if n >= min_count}, self.items, self.n, use_colnames=True)
+
+    def border(self):
+        """当前的负边界 [(项名称元组, 次数)]"""
+        min_count = self.min_count
+        return [(c, n) for c, n in self.counts.items() if n < min_count]
+
+    def stale_partitions(self, partitions):
+        """已纳入、但现在被修改或不存在的分区键；非空时不能增量更新"""
+        current = {partition_key(p): p for p in partitions}
+        return [key for key, fingerprint in self.partitions.items()
+                if key not in current or file_fingerprint(current[key][0]) != fingerprint]
+
+    def new_partitions(self, partitions):
+        return [p for p in partitions if partition_key(p) not in self.partitions]
+
+    def record(self, partitions):
+        for partition in partitions:
+            self.partitions[partition_key(partition)] = file_fingerprint(partition[0])
+
+    def save(self, path):
+        state = {
+            'version': STATE_VERSION,
+            'min_support': self.min_support,
+            'max_len': self.max_len,
+            'source_key': self.source_key,
+            'n': self.n,
+            'items': self.items,
+            'itemsets': [[list(c), n] for c, n in self.counts.items()],
+            'partitions': self.partitions,
+        }
+        _atomic_write(path, lambda f: f.write(json.dumps(state, ensure_ascii=False).encode('utf-8')))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """读取状态文件，文件不存在或版本不匹配时返回 None"""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('version') != STATE_VERSION:
+            return None
+        itemsets = cls(state['min_support'], state['max_len'], state['source_key'])
+        itemsets.n = state['n']
+        itemsets.items = state['items']
+        itemsets.counts = {tuple(c): n for c, n in state['itemsets']}
+        itemsets.partitions = state['partitions']
+        return itemsets
+
+
+def maintain_frequent_itemsets(pipeline, name, source, state_path, min_support, max_len=None, algorithm='bitset',
+                               n_workers=None, partition_by='file', checkpoint_dir=None):
+    """用 pipeline 中名为 name 的购物篮消费者增量维护 source 的频繁项集，返回 (IncrementalItemsets, UpdateSummary)
+
+    状态文件不存在、参数或消费者的 checkpoint_key（如商品目录）变化、已纳入的分区被修改 / 删除时
+    完整挖掘（UpdateSummary 为 None）；
+    否则只扫描新增分区，旧分区只在需要时读取（设置 checkpoint_dir 时直接读取检查点）。
+    """
+    def scan(partitions):
+        return pipeline.run(source, n_workers=n_workers, checkpoint_dir=checkpoint_dir,
+                            partitions=partitions)[name]
+
+    partitions = list_partitions(source, by=partition_by)
+    source_key = pipeline.consumers[name].checkpoint_key()
+    itemsets = IncrementalItemsets.load(state_path)
+    stale = itemsets.stale_partitions(partitions) if itemsets is not None else []
+    reason = None
+    if itemsets is None:
+        reason = "没有可用的状态文件"
+    elif (itemsets.min_support, itemsets.max_len) != (min_support, max_len):
+        reason = "最小支持度或最大长度已变化"
+    elif itemsets.source_key != source_key:
+        reason = "购物篮的生成方式（如商品目录）已变化"
+    elif stale:
+        reason = f"{len(stale)} 个已纳入的分区被修改或删除"
+
+    summary = None
+    if reason is not None:
+        print(f"🔁 {reason}，完整挖掘 {len(partitions)} 个分区")
+        itemsets = IncrementalItemsets(min_support, max_len, source_key).build(scan(partitions), algorithm)
+        itemsets.record(partitions)
+    else:
+        delta = itemsets.new_partitions(partitions)
+        old = [p for p in partitions if partition_key(p) in itemsets.partitions]
+        print(f"➕ 增量更新：新增 {len(delta)} 个分区，已纳入 {len(old)} 个分区")
+        if delta:
+            summary = itemsets.update(scan(delta), lambda: scan(old))
+            itemsets.record(delta)
+    itemsets.save(state_path)
+    return itemsets, summary
@@ -0,0 +1,203 @@
+import cProfile
+import json
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+# 通过环境变量开启的可选功能（无需修改脚本）：
+#   INSTRUMENT_PROFILE=阶段名1,阶段名2 或 *    对这些阶段做性能剖析
+#   INSTRUMENT_PROFILER=cprofile | py-spy      剖析工具，默认 cProfile（输出 .prof，可用 snakeviz / pstats 查看）
+#   INSTRUMENT_PROFILE_DIR=./profiles          剖析结果目录
+#   INSTRUMENT_TRACEMALLOC=1                   用 tracemalloc 统计各阶段的 Python 内存分配（有额外开销）
+REPORT_VERSION = 1
+
+
+def _current_rss_mb():
+    # 当前常驻内存；/proc 不可用时退回到进程峰值
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_mb(resource.RUSAGE_SELF)
+
+
+def _peak_rss_mb(who):
+    # Linux 上 ru_maxrss 的单位为 KB
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def _file_name(stage_path):
+    return re.sub(r'[^\w.-]+', '_', stage_path).strip('_') or 'stage'
+
+
+class StageRecord:
+    """一个阶段的测量结果；rows 未显式设置时取阶段内读取的 parquet 行数"""
+
+    def __init__(self, name, path, rows=None):
+        self.name = name
+        self.path = path
+        self.rows = rows
+        self.started_at = time.time()
+        self.seconds = 0.0
+        self.rss_start_mb = _current_rss_mb()
+        self.rss_end_mb = None
+        self.peak_rss_mb = None
+        self.worker_peak_rss_mb = None
+        self.alloc_delta_mb = None
+        self.alloc_peak_mb = None
+        self.counters = {}
+        self.profile = None
+        self.children = []
+
+    def add_rows(self, n):
+        self.rows = (self.rows or 0) + int(n)
+
+    def to_dict(self):
+        record = {
+            'name': self.name, 'started_at': round(self.started_at, 3), 'seconds': round(self.seconds, 4),
+            'rows': self.rows,
+            'rows_per_sec': round(self.rows / self.seconds, 1) if self.rows and self.seconds > 0 else None,
+            'rss_start_mb': round(self.rss_start_mb, 1), 'rss_end_mb': round(self.rss_end_mb, 1),
+            'peak_rss_mb': round(self.peak_rss_mb, 1), 'worker_peak_rss_mb': round(self.worker_peak_rss_mb, 1),
+            'counters': self.counters,
+        }
+        if self.alloc_delta_mb is not None:
+            record['alloc_delta_mb'] = round(self.alloc_delta_mb, 2)
+            record['alloc_peak_mb'] = round(self.alloc_peak_mb, 2)
+        if self.profile:
+            record['profile'] = self.profile
+        record['children'] = [child.to_dict() for child in self.children]
+        return record
+
+
+class Instrumentation:
+    """嵌套阶段计时、内存高水位和计数器，结束时输出 JSON 运行报告
+
+    计数器（如解析失败的 JSON 记录数）在进程池的子进程中累加后随结果传回主进程，
+    见 utils.parallel.map_partitions。
+    """
+
+    def __init__(self):
+        self.counters = Counter()
+        self.stages = []
+        self._stack = []
+        self.profile_stages = {s for s in os.environ.get('INSTRUMENT_PROFILE', '').split(',') if s}
+        self.profiler = os.environ.get('INSTRUMENT_PROFILER', 'cprofile')
+        self.profile_dir = os.environ.get('INSTRUMENT_PROFILE_DIR', './profiles')
+        self.trace_allocations = os.environ.get('INSTRUMENT_TRACEMALLOC', '') not in ('', '0')
+
+    def count(self, name, n=1):
+        if n:
+            self.counters[name] += int(n)
+
+    def merge_counters(self, counters):
+        for name, n in counters.items():
+            self.count(name, n)
+
+    def _should_profile(self, record):
+        return '*' in self.profile_stages or record.name in self.profile_stages or \
+            record.path in self.profile_stages
+
+    @contextmanager
+    def _profiled(self, record):
+        if not self._should_profile(record):
+            yield
+            return
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, _file_name(record.path))
+        if self.profiler == 'py-spy' and shutil.which('py-spy'):
+            # 以采样方式附加到本进程（含子进程），阶段结束时发送 SIGINT 让 py-spy 写出结果
+            record.profile = base + '.speedscope.json'
+            spy = subprocess.Popen(['py-spy', 'record', '--pid', str(os.getpid()), '--subprocesses',
+                                    '--format', 'speedscope', '--output', record.profile],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                yield
+            finally:
+                spy.send_signal(signal.SIGINT)
+                spy.wait()
+            return
+        profiler = cProfile.Profile()
+        record.profile = base + '.prof'
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(record.profile)
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """计时一个阶段，可以嵌套；返回的记录在 with 结束后可读取 seconds 等结果"""
+        parent = self._stack[-1] if self._stack else None
+        record = StageRecord(name, f'{parent.path}/{name}' if parent else name, rows)
+        (parent.children if parent else self.stages).append(record)
+        counters_before = Counter(self.counters)
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            alloc_start, _ = tracemalloc.get_traced_memory()
+            # 重置峰值前先把已观测到的峰值记到外层阶段
+            for outer in self._stack:
+                outer.alloc_peak_mb = max(outer.alloc_peak_mb or 0, tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.reset_peak()
+
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            with self._profiled(record):
+                yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self._stack.pop()
+            record.rss_end_mb = _current_rss_mb()
+            record.peak_rss_mb = max(_peak_rss_mb(resource.RUSAGE_SELF), record.rss_end_mb)
+            record.worker_peak_rss_mb = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+            record.counters = {k: v - counters_before.get(k, 0) for k, v in self.counters.items()
+                               if v != counters_before.get(k, 0)}
+            if record.rows is None:
+                record.rows = record.counters.get('rows.read')
+            if self.trace_allocations:
+                current, peak = tracemalloc.get_traced_memory()
+                record.alloc_delta_mb = (current - alloc_start) / 2 ** 20
+                record.alloc_peak_mb = max(record.alloc_peak_mb or 0, peak / 2 ** 20)
+                if parent is not None:
+                    parent.alloc_peak_mb = max(parent.alloc_peak_mb or 0, record.alloc_peak_mb)
+
+    def report(self):
+        return {
+            'version': REPORT_VERSION,
+            'pid': os.getpid(),
+            'peak_rss_mb': round(_peak_rss_mb(resource.RUSAGE_SELF), 1),
+            'worker_peak_rss_mb': round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            'counters': dict(self.counters),
+            'stages': [stage.to_dict() for stage in self.stages],
+        }
+
+    def write_report(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=1)
+        return path
+
+
+# 进程内共享的实例，各模块通过下面的函数使用
+instrumentation = Instrumentation()
+stage = instrumentation.stage
+count = instrumentation.count
+
+
+def write_report(path):
+    """写出 JSON 运行报告并打印路径"""
+    instrumentation.write_report(path)
+    print(f"📝 运行报告已写入 {path}")
+    return path
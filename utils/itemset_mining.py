@@ -0,0 +1,363 @@
+from collections import defaultdict
+from itertools import combinations
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from utils.basket_encoding import MAX_ITEMS, basket_apriori, index_limits, itemset_mask, within_limits
+
+# 与 mlxtend.frequent_patterns.association_rules 相同的输出列
+RULE_METRICS = ['antecedent support', 'consequent support', 'support', 'confidence', 'lift',
+                'representativity', 'leverage', 'conviction', 'zhangs_metric', 'jaccard',
+                'certainty', 'kulczynski']
+
+# 位向量 Apriori 每次同时计数的候选数
+CANDIDATE_BATCH = 256
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(packed, axis=None):
+        return np.bitwise_count(packed).sum(axis=axis, dtype=np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.int64)
+
+    def _popcount(packed, axis=None):
+        return _POPCOUNT_TABLE[packed].sum(axis=axis)
+
+
+class RuleConstraints(NamedTuple):
+    """允许的规则形状：项的角色与前件 / 后件长度
+
+    antecedent_only 中的项只能出现在前件，consequent_only 中的项只能出现在后件；
+    require_* 为 True 时前件（后件）必须至少包含一个对应角色的项；
+    exclusive 中每组项互斥（如同一订单只有一种支付方式），同一项集最多包含其中一个。
+    """
+    antecedent_only: frozenset = frozenset()
+    consequent_only: frozenset = frozenset()
+    max_antecedent_len: int = None
+    max_consequent_len: int = None
+    require_antecedent_only: bool = False
+    require_consequent_only: bool = False
+    exclusive: tuple = ()
+
+    def item_limits(self):
+        """可下推到候选生成的反单调约束 [(项名称集合, 上限)]"""
+        limits = [(frozenset(group), 1) for group in self.exclusive]
+        if self.antecedent_only and self.max_antecedent_len is not None:
+            limits.append((frozenset(self.antecedent_only), self.max_antecedent_len))
+        if self.consequent_only and self.max_consequent_len is not None:
+            limits.append((frozenset(self.consequent_only), self.max_consequent_len))
+        return limits
+
+
+def _mask_popcount(masks):
+    return _popcount(np.ascontiguousarray(masks, dtype=np.uint64).view(np.uint8).reshape(-1, 8), axis=1)
+
+
+def _allowed_splits(constraints, index_of, antecedent_masks, consequent_masks):
+    # 对一批 (前件, 后件) 位掩码整体判断是否符合规则形状
+    antecedent_role = itemset_mask(index_of[item] for item in constraints.antecedent_only if item in index_of)
+    consequent_role = itemset_mask(index_of[item] for item in constraints.consequent_only if item in index_of)
+    allowed = ((antecedent_masks & consequent_role) == 0) & ((consequent_masks & antecedent_role) == 0)
+    if constraints.require_antecedent_only:
+        allowed &= (antecedent_masks & antecedent_role) != 0
+    if constraints.require_consequent_only:
+        allowed &= (consequent_masks & consequent_role) != 0
+    if constraints.max_antecedent_len is not None:
+        allowed &= _mask_popcount(antecedent_masks) <= constraints.max_antecedent_len
+    if constraints.max_consequent_len is not None:
+        allowed &= _mask_popcount(consequent_masks) <= constraints.max_consequent_len
+    return allowed
+
+
+def min_support_count(min_support, n_rows):
+    """满足 次数 / n_rows >= min_support 的最小次数，与 mlxtend 的浮点比较结果一致"""
+    count = max(int(np.ceil(min_support * n_rows)), 0)
+    while count > 0 and (count - 1) / n_rows >= min_support:
+        count -= 1
+    while count / n_rows < min_support:
+        count += 1
+    return count
+
+
+def _to_frame(itemset_counts, items, n_rows, use_colnames):
+    # 按项集长度、再按列序号字典序排列，与 mlxtend 的 apriori 输出顺序一致
+    ordered = sorted(itemset_counts, key=lambda c: (len(c), c))
+    supports = np.array([itemset_counts[c] for c in ordered], dtype=np.int64) / n_rows
+    if use_colnames:
+        itemsets = [frozenset(items[i] for i in c) for c in ordered]
+    else:
+        itemsets = [frozenset(c) for c in ordered]
+    return pd.DataFrame({'support': supports.astype(np.float64),
+                         'itemsets': pd.Series(itemsets, dtype=object)})
+
+
+def bitset_apriori(masks, counts, items, min_support=0.5, use_colnames=False, max_len=None, item_limits=None):
+    """垂直位向量 Apriori
+
+    每个项是一列按位打包的向量（第 j 位表示第 j 个去重购物篮是否包含该项），
+    项集的覆盖向量由两个父项集按位与得到。购物篮次数拆成二进制位平面，
+    加权支持度 = Σ 2^b · popcount(覆盖向量 & 第 b 个位平面)。
+    """
+    n_rows = int(counts.sum())
+    limits = index_limits(items, item_limits)
+    min_count = min_support_count(min_support, n_rows)
+    planes = np.stack([np.packbits(((counts >> b) & 1).astype(bool))
+                       for b in range(max(int(counts.max()).bit_length(), 1))]) if len(counts) else None
+    weights = np.int64(1) << np.arange(len(planes) if planes is not None else 0, dtype=np.int64)
+
+    def weighted_counts(vectors):
+        out = []
+        for start in range(0, len(vectors), CANDIDATE_BATCH):
+            batch = vectors[start:start + CANDIDATE_BATCH]
+            out.append(_popcount(batch[:, None, :] & planes[None, :, :], axis=2) @ weights)
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+    if planes is None:
+        return _to_frame({}, items, max(n_rows, 1), use_colnames)
+
+    columns = np.stack([np.packbits(((masks >> np.uint64(i)) & np.uint64(1)).astype(bool))
+                        for i in range(len(items))]) if items else np.zeros((0, planes.shape[1]), np.uint8)
+    level = [(i,) for i in range(len(items)) if within_limits((i,), limits)]
+    vectors = columns[[c[0] for c in level]] if level else columns[:0]
+    itemset_counts = {}
+    k = 1
+    while level and (max_len is None or k <= max_len):
+        level_counts = weighted_counts(vectors)
+        keep = level_counts >= min_count
+        frequent = [c for c, ok in zip(level, keep) if ok]
+        frequent_vectors = vectors[keep]
+        itemset_counts.update((c, int(n)) for c, n in zip(frequent, level_counts[keep]))
+
+        # 前缀相同的两个频繁 k 项集合并为 k+1 项候选，并剪掉含非频繁子集的候选
+        frequent_set = set(frequent)
+        by_prefix = defaultdict(list)
+        for idx, c in enumerate(frequent):
+            by_prefix[c[:-1]].append(idx)
+        next_level, parents = [], []
+        for idx, c in enumerate(frequent):
+            for other in by_prefix[c[:-1]]:
+                last = frequent[other][-1]
+                if last <= c[-1]:
+                    continue
+                candidate = c + (last,)
+                if all(sub in frequent_set for sub in combinations(candidate, k)) and \
+                        within_limits(candidate, limits):
+                    next_level.append(candidate)
+                    parents.append((idx, other))
+        order = sorted(range(len(next_level)), key=lambda i: next_level[i])
+        level = [next_level[i] for i in order]
+        if level:
+            left = np.array([parents[i][0] for i in order])
+            right = np.array([parents[i][1] for i in order])
+            vectors = frequent_vectors[left] & frequent_vectors[right]
+        k += 1
+
+    return _to_frame(itemset_counts, items, n_rows, use_colnames)
+
+
+class _FPNode:
+    __slots__ = ('item', 'count', 'parent', 'children')
+
+    def __init__(self, item, parent):
+        self.item = item
+        self.count = 0
+        self.parent = parent
+        self.children = {}
+
+
+def _fp_tree(paths, min_count):
+    # paths: [(项序号元组, 次数)]，按全局频次降序插入 FP 树
+    item_counts = defaultdict(int)
+    for path, count in paths:
+        for item in path:
+            item_counts[item] += count
+    item_counts = {item: c for item, c in item_counts.items() if c >= min_count}
+    root = _FPNode(None, None)
+    header = defaultdict(list)
+    for path, count in paths:
+        node = root
+        for item in sorted((i for i in path if i in item_counts), key=lambda i: (-item_counts[i], i)):
+            child = node.children.get(item)
+            if child is None:
+                child = _FPNode(item, node)
+                node.children[item] = child
+                header[item].append(child)
+            child.count += count
+            node = child
+    return item_counts, header
+
+
+def _fp_mine(paths, min_count, suffix, itemset_counts, max_len, limits=()):
+    item_counts, header = _fp_tree(paths, min_count)
+    for item, count in item_counts.items():
+        itemset = suffix + (item,)
+        # 限制是反单调的：超出上限的项集及其超集都不需要统计
+        if limits and not within_limits(itemset, limits):
+            continue
+        itemset_counts[tuple(sorted(itemset))] = count
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+        # 条件模式基：item 所在各节点到根的路径
+        conditional = []
+        for node in header[item]:
+            path = []
+            parent = node.parent
+            while parent.item is not None:
+                path.append(parent.item)
+                parent = parent.parent
+            if path:
+                conditional.append((tuple(path), node.count))
+        if conditional:
+            _fp_mine(conditional, min_count, itemset, itemset_counts, max_len, limits)
+
+
+def fpgrowth(masks, counts, items, min_support=0.5, use_colnames=False, max_len=None, item_limits=None):
+    """在加权的去重购物篮上运行 FP-Growth"""
+    n_rows = int(counts.sum())
+    limits = index_limits(items, item_limits)
+    min_count = min_support_count(min_support, n_rows)
+    paths = [(tuple(i for i in range(len(items)) if int(mask) >> i & 1), int(count))
+             for mask, count in zip(masks, counts)]
+    itemset_counts = {}
+    if n_rows:
+        _fp_mine(paths, min_count, (), itemset_counts, max_len, limits)
+    return _to_frame(itemset_counts, items, max(n_rows, 1), use_colnames)
+
+
+ALGORITHMS = {
+    'apriori': basket_apriori,
+    'bitset': bitset_apriori,
+    'fpgrowth': fpgrowth,
+}
+
+
+def mine_frequent_itemsets(masks, counts, items, min_support=0.5, algorithm='bitset',
+                           use_colnames=False, max_len=None, item_limits=None):
+    """在 (位掩码, 次数) 表示的购物篮上挖掘频繁项集
+
+    algorithm 可选 'bitset'（垂直位向量 Apriori）、'fpgrowth' 或 'apriori'（逐候选掩码计数），
+    三者输出相同，均与 mlxtend.frequent_patterns.apriori 的结果一致。
+    item_limits 为 [(项名称集合, 上限)]：项集中属于该组的项不超过上限，超出的候选在生成时剪掉。
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"未知的挖掘算法: {algorithm}，可选 {sorted(ALGORITHMS)}")
+    return ALGORITHMS[algorithm](masks, counts, items, min_support=min_support,
+                                 use_colnames=use_colnames, max_len=max_len, item_limits=item_limits)
+
+
+def association_rules(frequent_itemsets, metric='confidence', min_threshold=0.8, constraints=None):
+    """由频繁项集生成关联规则，各项指标按数组整体计算
+
+    输入、输出与 mlxtend.frequent_patterns.association_rules 相同（数据无缺失值时）。
+    规则按项集顺序、再按前件从大到小、项集内组合的枚举顺序排列。
+    constraints（RuleConstraints）在枚举划分时就剔除不符合形状的规则，不再计算它们的支持度与指标。
+    """
+    if not frequent_itemsets.shape[0]:
+        raise ValueError("The input DataFrame `df` containing the frequent itemsets is empty.")
+    if metric not in RULE_METRICS:
+        raise ValueError(f"Metric must be one of {RULE_METRICS}, got '{metric}'")
+
+    # 项集编码为位掩码，支持度用排序数组 + 二分查找
+    itemsets = list(frequent_itemsets['itemsets'])
+    vocabulary = sorted({item for itemset in itemsets for item in itemset}, key=lambda x: (str(type(x)), x))
+    if len(vocabulary) > MAX_ITEMS:
+        raise ValueError(f"项数 {len(vocabulary)} 超过位掩码上限 {MAX_ITEMS}")
+    index_of = {item: i for i, item in enumerate(vocabulary)}
+    # 划分按项集自身的迭代顺序枚举，规则顺序与 mlxtend 相同
+    keys = [frozenset(item for item in itemset) for itemset in itemsets]
+    members = [[index_of[item] for item in key] for key in keys]
+    itemset_masks = np.array([itemset_mask(m) for m in members], dtype=np.uint64)
+    supports = frequent_itemsets['support'].to_numpy(dtype=np.float64)
+    order = np.argsort(itemset_masks)
+    sorted_masks, sorted_supports = itemset_masks[order], supports[order]
+
+    def lookup(query):
+        pos = np.minimum(np.searchsorted(sorted_masks, query), len(sorted_masks) - 1)
+        if not np.all(sorted_masks[pos] == query):
+            raise KeyError("frequent_itemsets 缺少部分前件或后件的支持度")
+        return sorted_supports[pos]
+
+    # 按项集长度分组，同长度的项集一次性枚举全部 (前件, 后件) 划分
+    rows, splits, antecedent_masks, sAC = [], [], [], []
+    patterns = {}
+    lengths = np.array([len(m) for m in members])
+    for k in np.unique(lengths[lengths >= 2]):
+        idx = np.flatnonzero(lengths == k)
+        bits = np.uint64(1) << np.array([members[i] for i in idx], dtype=np.uint64)  # (n_k, k)
+        patterns[k] = [c for r in range(k - 1, 0, -1) for c in combinations(range(k), r)]
+        for p, positions in enumerate(patterns[k]):
+            split_masks = np.bitwise_or.reduce(bits[:, list(positions)], axis=1)
+            split_rows = idx
+            if constraints is not None:
+                allowed = _allowed_splits(constraints, index_of, split_masks, itemset_masks[idx] & ~split_masks)
+                if not allowed.any():
+                    continue
+                split_masks, split_rows = split_masks[allowed], idx[allowed]
+            antecedent_masks.append(split_masks)
+            rows.append(split_rows)
+            splits.append(np.full(len(split_rows), p))
+            sAC.append(supports[split_rows])
+    if not rows:
+        return pd.DataFrame(columns=['antecedents', 'consequents'] + RULE_METRICS)
+    rows, splits = np.concatenate(rows), np.concatenate(splits)
+    antecedent_masks, sAC = np.concatenate(antecedent_masks), np.concatenate(sAC)
+    consequent_masks = itemset_masks[rows] & ~antecedent_masks
+    sA, sC = lookup(antecedent_masks), lookup(consequent_masks)
+
+    metrics = _rule_metrics(sAC, sA, sC)
+    keep = metrics[metric] >= min_threshold
+    keep_order = np.lexsort((splits[keep], rows[keep]))
+
+    # 只为保留下来的规则构造 frozenset
+    antecedents, consequents = [], []
+    for row, p in zip(rows[keep][keep_order], splits[keep][keep_order]):
+        key = keys[row]
+        ordered = list(key)
+        antecedent = frozenset(ordered[i] for i in patterns[len(ordered)][p])
+        antecedents.append(antecedent)
+        consequents.append(key.difference(antecedent))
+
+    result = pd.DataFrame({'antecedents': antecedents, 'consequents': consequents})
+    for name in RULE_METRICS:
+        result[name] = metrics[name][keep][keep_order]
+    return result
+
+
+def mine_constrained_rules(masks, counts, items, constraints, min_support=0.5, metric='confidence',
+                           min_threshold=0.8, algorithm='bitset'):
+    """按规则形状挖掘关联规则：反单调约束下推到候选生成，其余约束在枚举规则时整体过滤
+
+    返回 (频繁项集, 规则)；频繁项集仍包含规则前件、后件支持度所需的全部子集。
+    """
+    frequent_itemsets = mine_frequent_itemsets(masks, counts, items, min_support=min_support, algorithm=algorithm,
+                                               use_colnames=True, item_limits=constraints.item_limits())
+    if not frequent_itemsets.shape[0]:
+        return frequent_itemsets, pd.DataFrame(columns=['antecedents', 'consequents'] + RULE_METRICS)
+    rules = association_rules(frequent_itemsets, metric=metric, min_threshold=min_threshold,
+                              constraints=constraints)
+    return frequent_itemsets, rules
+
+
+def _rule_metrics(sAC, sA, sC):
+    confidence = sAC / sA
+    leverage = sAC - sA * sC
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conviction = np.where(confidence < 1.0, (1.0 - sC) / (1.0 - confidence), np.inf)
+        denominator = np.maximum(sAC * (1 - sA), sA * (sC - sAC))
+        zhangs_metric = np.where(denominator == 0, 0, leverage / denominator)
+        certainty = np.where(1 - sC == 0, 0, (confidence - sC) / (1 - sC))
+    return {
+        'antecedent support': sA,
+        'consequent support': sC,
+        'support': sAC,
+        'confidence': confidence,
+        'lift': confidence / sC,
+        'representativity': np.ones_like(sAC),
+        'leverage': leverage,
+        'conviction': conviction,
+        'zhangs_metric': zhangs_metric,
+        'jaccard': sAC / (sA + sC - sAC),
+        'certainty': certainty,
+        'kulczynski': (sAC / sA + sAC / sC) / 2,
+    }
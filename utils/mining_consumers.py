@@ -0,0 +1,200 @@
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from utils.catalog_index import MAIN_CATEGORIES, MISSING, OTHER_CODE
+from utils.purchase_cube import PurchaseCube
+from utils.scan_pipeline import Consumer
+from utils.sequence_store import DEFAULT_MEMORY_LIMIT_MB, SequenceStore
+
+# 退款分析关注的支付状态
+REFUND_STATUSES = ['已退款', '部分退款']
+
+
+def _merge_counts(total, partial):
+    for key, count in partial.items():
+        total[key] += count
+    return total
+
+
+@lru_cache(maxsize=None)
+def _category_names(mask):
+    return tuple(name for code, name in enumerate(MAIN_CATEGORIES) if mask >> code & 1)
+
+
+def _row_category_masks(purchases, catalog, rows, exclude_other=False):
+    """每行商品大类的位掩码（第 c 位对应 MAIN_CATEGORIES[c]），只统计 rows 为真的行"""
+    item_rows = purchases.item_rows()
+    main_codes = catalog.main_codes_of(purchases.item_ids)
+    keep = rows[item_rows] & (main_codes != MISSING)
+    if exclude_other:
+        keep &= main_codes != OTHER_CODE
+    # 同一行的同一大类只计一次
+    pairs = np.unique(item_rows[keep] * len(MAIN_CATEGORIES) + main_codes[keep])
+    bits = np.left_shift(1, pairs % len(MAIN_CATEGORIES))
+    return np.bincount(pairs // len(MAIN_CATEGORIES), weights=bits, minlength=len(rows)).astype(np.int64)
+
+
+def _count_labelled_baskets(baskets, masks, label_codes=None, labels=()):
+    """按 (大类掩码, 标签编码) 计数，购物篮为大类名称与标签 labels[code] 的并集（排序后的元组）"""
+    if label_codes is None:
+        label_codes = np.zeros(len(masks), dtype=np.int64)
+    n_labels = max(len(labels), 1)
+    keys, counts = np.unique(masks * n_labels + label_codes, return_counts=True)
+    for key, count in zip(keys, counts):
+        mask, code = divmod(int(key), n_labels)
+        extra = {labels[code]} if len(labels) else set()
+        baskets[tuple(sorted(set(_category_names(mask)) | extra))] += int(count)
+    return baskets
+
+
+class CatalogConsumer(Consumer):
+    """按商品目录索引解析商品的消费者，目录变化后检查点失效"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def checkpoint_key(self):
+        return f'{type(self).__name__}:{self.catalog.version}'
+
+
+class CategoryBasketConsumer(CatalogConsumer):
+    """每个订单的商品大类组合（不含“其他”），折叠为 {购物篮: 次数}，用于商品类别关联规则"""
+    prefix = 'part-'
+
+    def start(self):
+        return Counter()
+
+    def consume(self, baskets, df, purchases):
+        masks = _row_category_masks(purchases, self.catalog, purchases.items_valid, exclude_other=True)
+        return _count_labelled_baskets(baskets, masks[purchases.items_valid & (masks != 0)])
+
+    def merge(self, total, partial):
+        return _merge_counts(total, partial)
+
+
+class PaymentBasketConsumer(CatalogConsumer):
+    """支付方式 + 商品大类组合（折叠为 {购物篮: 次数}），以及高价值商品（单价 > 5000）的支付方式计数"""
+
+    def start(self):
+        return Counter(), Counter()
+
+    def consume(self, state, df, purchases):
+        baskets, high_value_payment_methods = state
+        methods = purchases.payment_method
+
+        # 高价值商品逐件计数，支付方式缺失记为 None
+        item_rows = purchases.item_rows()
+        high_value = purchases.items_valid[item_rows] & (self.catalog.prices_of(purchases.item_ids) > 5000)
+        codes, counts = np.unique(methods.codes[item_rows[high_value]], return_counts=True)
+        for code, count in zip(codes, counts):
+            method = methods.categories[code] if code >= 0 else None
+            high_value_payment_methods[method] += int(count)
+
+        # 支付方式放入购物篮作为先验项（支付方式为空的订单不计入）
+        masks = _row_category_masks(purchases, self.catalog, purchases.items_valid)
+        non_empty = np.append(np.asarray(methods.categories, dtype=object) != '', False)
+        selected = purchases.items_valid & (masks != 0) & non_empty[methods.codes]
+        _count_labelled_baskets(baskets, masks[selected], methods.codes[selected], list(methods.categories))
+        return state
+
+    def merge(self, total, partial):
+        return _merge_counts(total[0], partial[0]), _merge_counts(total[1], partial[1])
+
+
+class RefundBasketConsumer(CatalogConsumer):
+    """退款订单的商品大类组合 + 支付状态标签，折叠为 {购物篮: 次数}"""
+
+    def start(self):
+        return Counter()
+
+    def consume(self, baskets, df, purchases):
+        payment_statuses = purchases.labels('payment_status')
+        # 先按支付状态整列筛选
+        refund_mask = purchases.items_valid & np.isin(payment_statuses, REFUND_STATUSES)
+        masks = _row_category_masks(purchases, self.catalog, refund_mask)
+        selected = refund_mask & (masks != 0)
+        # 交易项：商品类别 + 状态标签
+        status_labels = [f'状态:{s}' for s in purchases.payment_status.categories]
+        return _count_labelled_baskets(baskets, masks[selected], purchases.payment_status.codes[selected],
+                                       status_labels)
+
+    def merge(self, total, partial):
+        return _merge_counts(total, partial)
+
+
+class PurchaseCubeConsumer(CatalogConsumer):
+    """日 × 大类 × 支付方式 × 支付状态 的预聚合立方体：订单数、含该大类的订单数、商品件数与目录价格合计
+
+    与 TimeSeriesConsumer 相同，解析失败或缺少日期的订单被跳过；有 item 缺少 id 时订单仍计数，只计入该 item
+    之前的商品。目录中不存在的商品不计入大类。
+    """
+
+    def start(self):
+        return PurchaseCube()
+
+    def consume(self, cube, df, purchases):
+        purchase_dates = purchases.purchase_date
+        rows = purchases.valid & ~np.isnat(purchase_dates)
+        days = np.where(rows, purchase_dates.astype('datetime64[D]').view(np.int64), 0)
+        methods = cube.label_codes('method', purchases.payment_method)
+        statuses = cube.label_codes('status', purchases.payment_status)
+        cube.add('orders', days[rows], methods[rows], statuses[rows])
+
+        item_rows = purchases.item_rows()
+        main_codes = self.catalog.main_codes_of(purchases.item_ids)
+        keep = rows[item_rows] & (main_codes != MISSING)
+        item_rows, main_codes = item_rows[keep], main_codes[keep]
+        prices = self.catalog.prices_of(purchases.item_ids[keep])
+        cube.add('items', days[item_rows], main_codes, methods[item_rows], statuses[item_rows])
+        cube.add('amount', days[item_rows], main_codes, methods[item_rows], statuses[item_rows],
+                 weights=np.nan_to_num(prices))
+
+        # 同一订单的同一大类只计一次
+        pairs = np.unique(item_rows * len(MAIN_CATEGORIES) + main_codes)
+        order_rows, order_codes = pairs // len(MAIN_CATEGORIES), pairs % len(MAIN_CATEGORIES)
+        cube.add('category_orders', days[order_rows], order_codes, methods[order_rows], statuses[order_rows])
+        return cube
+
+    def merge(self, total, partial):
+        return total.merge(partial)
+
+
+class TimeSeriesConsumer(CatalogConsumer):
+    """每个用户的 (购买时间, 大类) 序列（月度等时间汇总见 PurchaseCubeConsumer）
+
+    序列写入 SequenceStore，超过 sequence_memory_mb 后溢写到 spill_dir（默认系统临时目录），
+    用完后调用序列存储的 close() 删除溢写文件。
+    """
+    columns = ('id', 'purchase_history')
+
+    def __init__(self, catalog, sequence_memory_mb=DEFAULT_MEMORY_LIMIT_MB, spill_dir=None):
+        super().__init__(catalog)
+        self.sequence_memory_mb = sequence_memory_mb
+        self.spill_dir = spill_dir
+
+    def start(self):
+        return SequenceStore(self.sequence_memory_mb, self.spill_dir)  # (uid, 时间, 大类编码) 记录
+
+    def consume(self, sequences, df, purchases):
+        purchase_dates = purchases.purchase_date
+        # 解析失败或缺少日期的订单被跳过；有 item 缺少 id 时只保留该 item 之前的商品
+        rows = purchases.valid & ~np.isnat(purchase_dates)
+
+        item_rows = purchases.item_rows()
+        main_codes = self.catalog.main_codes_of(purchases.item_ids)
+        keep = rows[item_rows] & (main_codes != MISSING)
+        item_rows, main_codes = item_rows[keep], main_codes[keep]
+        return sequences.append(df['id'].to_numpy()[item_rows], purchase_dates[item_rows], main_codes)
+
+    def merge(self, total, partial):
+        return total.extend(partial)
+
+    def checkpoint_key(self):
+        # 状态只含序列记录，与保存 (月度计数, 类别计数, 序列) 的旧检查点区分
+        return f'{super().checkpoint_key()}:sequences'
+
+    def checkpoint(self, sequences, path_prefix):
+        # 序列记录写入检查点目录，检查点只保存文件路径
+        return sequences.save(path_prefix + '.sequences.npy')
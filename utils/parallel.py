@@ -0,0 +1,62 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import pyarrow.parquet as pq
+
+from utils.instrumentation import count, instrumentation
+from utils.parquet_reader import resolve_sources
+
+
+def list_partitions(source, by='file', prefix=None):
+    """把数据切分为任务分区，返回 (文件路径, row_groups) 列表；按文件时 row_groups 为 None"""
+    partitions = []
+    for file_path in resolve_sources(source, prefix):
+        if by == 'row_group':
+            try:
+                num_row_groups = pq.ParquetFile(file_path).metadata.num_row_groups
+            except Exception as e:
+                print(f"❌ Error reading {os.path.basename(file_path)}: {e}")
+                count('files.unreadable')
+                continue
+            partitions.extend((file_path, [rg]) for rg in range(num_row_groups))
+        elif by == 'file':
+            partitions.append((file_path, None))
+        else:
+            raise ValueError(f"未知的分区方式: {by}")
+    return partitions
+
+
+def _pool_context():
+    # 优先使用 fork，子进程直接继承脚本中已加载的商品目录等全局变量
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+def _run_counted(func, partition):
+    # 子进程会被复用，只返回本分区产生的计数器增量
+    before = dict(instrumentation.counters)
+    result = func(partition)
+    counters = {k: v - before.get(k, 0) for k, v in instrumentation.counters.items() if v != before.get(k, 0)}
+    return result, counters
+
+
+def map_partitions(func, partitions, n_workers=None):
+    """在进程池中对每个分区执行 func，按分区顺序逐个产出结果
+
+    结果顺序与串行遍历完全一致，调用方按顺序合并即可得到与串行相同的输出。
+    n_workers 为 1 时不启动进程池，直接串行执行。子进程中累加的计数器（读取行数、
+    解析失败的记录数等）随结果传回并合并到主进程，运行报告与串行执行一致。
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(partitions))
+    if n_workers <= 1:
+        for partition in partitions:
+            yield func(partition)
+        return
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=_pool_context()) as executor:
+        for result, counters in executor.map(partial(_run_counted, func), partitions):
+            instrumentation.merge_counters(counters)
+            yield result
@@ -0,0 +1,228 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from utils.instrumentation import count
+
+# 默认每个数据块的内存预算（MB）
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+# Arrow -> pandas 转换后的内存膨胀系数（object 字符串开销较大）
+PANDAS_EXPANSION = 3
+
+# 紧凑加载（compact=True）的列类型：低基数字符串列字典编码为 Categorical；FLOAT32_COLUMNS 的取值
+# 都是 float32 可精确表示的小整数；时间戳列为 {列名: 是否带时区（统一转换为 UTC）}。
+# 其余字符串列使用 Arrow 存储，整数列按文件的 min/max 统计降为能容纳的最小位宽
+CATEGORY_COLUMNS = ('gender', 'country')
+FLOAT32_COLUMNS = ('age',)
+TIMESTAMP_COLUMNS = {'registration_date': False, 'last_login': True}
+INTEGER_TYPES = (pa.int8(), pa.int16(), pa.int32(), pa.int64())
+
+
+def list_parquet_files(folder_path, prefix=None):
+    """按文件名排序列出目录下的 parquet 文件，保证各脚本的遍历顺序一致"""
+    files = []
+    for fname in sorted(os.listdir(folder_path)):
+        if not fname.endswith('.parquet'):
+            continue
+        if prefix is not None and not fname.startswith(prefix):
+            continue
+        files.append(os.path.join(folder_path, fname))
+    return files
+
+
+def resolve_sources(source, prefix=None):
+    """source 可以是目录、单个 parquet 文件或二者组成的列表"""
+    if isinstance(source, (list, tuple)):
+        paths = []
+        for item in source:
+            paths.extend(resolve_sources(item, prefix))
+        return paths
+    if os.path.isdir(source):
+        return list_parquet_files(source, prefix)
+    return [source]
+
+
+def estimate_row_bytes(parquet_file, columns=None):
+    """根据 parquet 元数据估算所选列每行解压后的字节数"""
+    metadata = parquet_file.metadata
+    if metadata.num_rows == 0:
+        return 1
+    wanted = set(columns) if columns is not None else None
+    total = 0
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        for col in range(row_group.num_columns):
+            chunk = row_group.column(col)
+            name = chunk.path_in_schema.split('.')[0]
+            if wanted is None or name in wanted:
+                total += chunk.total_uncompressed_size
+    return max(1, total // metadata.num_rows)
+
+
+def batch_size_for_budget(parquet_file, columns=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """由内存预算换算每个数据块的行数"""
+    row_bytes = estimate_row_bytes(parquet_file, columns) * PANDAS_EXPANSION
+    return max(1, int(memory_budget_mb * 1024 * 1024 // row_bytes))
+
+
+def statistics_range(parquet_file, column):
+    """从 row group 的 min/max 统计得到列的取值范围，任一 row group 缺少统计时返回 None；全为空值时为 (None, None)"""
+    metadata = parquet_file.metadata
+    lo = hi = None
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        for col in range(row_group.num_columns):
+            chunk = row_group.column(col)
+            if chunk.path_in_schema != column:
+                continue
+            stats = chunk.statistics
+            if stats is None or not stats.has_min_max:
+                if stats is not None and stats.null_count == row_group.num_rows:
+                    continue  # 整个 row group 都是空值
+                return None
+            lo = stats.min if lo is None else min(lo, stats.min)
+            hi = stats.max if hi is None else max(hi, stats.max)
+    return lo, hi
+
+
+def _compact_casts(parquet_file, columns):
+    # {列名: 目标类型}：整数列降位（缺少统计时保持原类型），FLOAT32_COLUMNS 转为 float32
+    casts = {}
+    for field in parquet_file.schema_arrow:
+        if columns is not None and field.name not in columns:
+            continue
+        if field.name in FLOAT32_COLUMNS and pa.types.is_floating(field.type):
+            casts[field.name] = pa.float32()
+        elif pa.types.is_integer(field.type) and pa.types.is_signed_integer(field.type):
+            bounds = statistics_range(parquet_file, field.name)
+            if bounds is None:
+                continue
+            lo, hi = bounds
+            for target in INTEGER_TYPES:
+                info = np.iinfo(target.to_pandas_dtype())
+                if lo is None or (info.min <= lo and hi <= info.max):
+                    if target.bit_width < field.type.bit_width:
+                        casts[field.name] = target
+                    break
+    return casts
+
+
+def open_parquet(file_path, compact=False):
+    """打开 parquet 文件；compact 时以内存映射方式读取，未压缩的列页可零拷贝使用"""
+    return pq.ParquetFile(file_path, memory_map=compact)
+
+
+def _compact_batch(batch, casts):
+    arrays = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if name in casts:
+            column = pc.cast(column, casts[name])
+        elif name in CATEGORY_COLUMNS and _arrow_string_dtype(column.type) is not None:
+            column = pc.dictionary_encode(column)
+        arrays.append(column)
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+
+def iter_batches(source, columns=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                 row_groups=None, prefix=None, compact=False):
+    """逐块读取 parquet，按列裁剪，每次只在内存中保留一个 RecordBatch
+
+    compact 时按 open_parquet 读取，CATEGORY_COLUMNS 字典编码，数值列转换为 _compact_casts
+    给出的较窄类型。不使用 read_dictionary（那样会按 row group 切块），分块与非紧凑读取逐块对应。
+    """
+    for file_path in resolve_sources(source, prefix):
+        try:
+            parquet_file = open_parquet(file_path, compact)
+        except Exception as e:
+            print(f"❌ Error reading {os.path.basename(file_path)}: {e}")
+            count('files.unreadable')
+            continue
+        batch_size = batch_size_for_budget(parquet_file, columns, memory_budget_mb)
+        casts = _compact_casts(parquet_file, columns) if compact else {}
+        for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns):
+            count('rows.read', batch.num_rows)
+            if compact:
+                batch = _compact_batch(batch, casts)
+            yield batch
+
+
+def _arrow_string_dtype(arrow_type):
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype('pyarrow')
+    return None
+
+
+def compact_frame(batch, parse_timestamps=True):
+    """紧凑 RecordBatch → DataFrame：字典列为 Categorical，字符串为 Arrow 存储，解析 TIMESTAMP_COLUMNS
+
+    无法解析的时间戳会变为 NaT；需要区分原始缺失值的场景（如数据质量检测）应设置 parse_timestamps=False，
+    时间戳列保持为字符串。
+    """
+    df = batch.to_pandas(types_mapper=_arrow_string_dtype)
+    if not parse_timestamps:
+        return df
+    for column, utc in TIMESTAMP_COLUMNS.items():
+        if column in df.columns:
+            values = df[column].astype(object).where(df[column].notna(), None)
+            df[column] = pd.to_datetime(values, errors='coerce', format='ISO8601', utc=utc)
+    return df
+
+
+def iter_frames(source, columns=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                row_groups=None, prefix=None, compact=False, parse_timestamps=True):
+    """与 iter_batches 相同，但每块转换为 pandas DataFrame（compact 时见 compact_frame）"""
+    for batch in iter_batches(source, columns, memory_budget_mb, row_groups, prefix, compact):
+        yield compact_frame(batch, parse_timestamps) if compact else batch.to_pandas()
+
+
+def compare_memory(source, columns=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, max_batches=1, prefix=None):
+    """逐列比较默认加载与紧凑加载的内存占用（每个文件取前 max_batches 块，None 为全部）
+
+    返回以列名为索引的 DataFrame：紧凑类型、两种方式的 MB 数、节省的 MB 数与比例，末行为合计。
+    """
+    default, compact, dtypes = {}, {}, {}
+    for file_path in resolve_sources(source, prefix):
+        frames = zip(iter_frames(file_path, columns, memory_budget_mb),
+                     iter_frames(file_path, columns, memory_budget_mb, compact=True))
+        for i, (df, compact_df) in enumerate(frames):
+            if max_batches is not None and i >= max_batches:
+                break
+            for name, usage in df.memory_usage(deep=True, index=False).items():
+                default[name] = default.get(name, 0) + usage
+            for name, usage in compact_df.memory_usage(deep=True, index=False).items():
+                compact[name] = compact.get(name, 0) + usage
+                dtypes[name] = str(compact_df[name].dtype)
+    report = pd.DataFrame({'compact_dtype': pd.Series(dtypes, dtype=object),
+                           'default_mb': pd.Series(default, dtype='float64') / 2 ** 20,
+                           'compact_mb': pd.Series(compact, dtype='float64') / 2 ** 20})
+    report = report.reindex(list(default))
+    report.loc['合计'] = ['', report['default_mb'].sum(), report['compact_mb'].sum()]
+    report['saved_mb'] = report['default_mb'] - report['compact_mb']
+    report['saved_ratio'] = (report['saved_mb'] / report['default_mb']).where(report['default_mb'] > 0)
+    return report
+
+
+def iter_filtered_batches(source, filter, columns=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, prefix=None):
+    """逐块读取满足 filter（pyarrow.dataset 表达式）的行，保持文件内行顺序
+
+    Arrow 先用 row group 的 min/max 统计跳过不可能满足条件的 row group，
+    再按行过滤，只有通过过滤的行会被转换和返回。
+    """
+    for file_path in resolve_sources(source, prefix):
+        try:
+            parquet_file = pq.ParquetFile(file_path)
+        except Exception as e:
+            print(f"❌ Error reading {os.path.basename(file_path)}: {e}")
+            count('files.unreadable')
+            continue
+        batch_size = batch_size_for_budget(parquet_file, columns, memory_budget_mb)
+        dataset = ds.dataset(file_path, format='parquet')
+        for batch in dataset.to_batches(columns=columns, filter=filter, batch_size=batch_size):
+            if batch.num_rows:
+                count('rows.read', batch.num_rows)
+                yield batch
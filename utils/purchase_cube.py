@@ -0,0 +1,190 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils.catalog_index import MAIN_CATEGORIES
+
+# 支付方式 / 支付状态缺失时的标签
+MISSING_LABEL = '(缺失)'
+# 立方体文件格式变化时递增，旧文件随之失效
+CUBE_VERSION = 1
+
+# 各度量的维度：订单数不按大类拆分（一个订单可能包含多个大类），
+# category_orders 为包含该大类商品的订单数，items / amount 为商品件数与目录价格合计
+AXES = {
+    'orders': ('day', 'method', 'status'),
+    'category_orders': ('day', 'category', 'method', 'status'),
+    'items': ('day', 'category', 'method', 'status'),
+    'amount': ('day', 'category', 'method', 'status'),
+}
+DTYPES = {'orders': np.int64, 'category_orders': np.int64, 'items': np.int64, 'amount': np.float64}
+# 日期轴的汇总粒度（pandas Period 频率）
+FREQUENCIES = {'day': 'D', 'week': 'W', 'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) or not np.iterable(value) else list(value)
+
+
+class PurchaseCube:
+    """日 × 商品大类 × 支付方式 × 支付状态 的预聚合立方体
+
+    每个度量是一个稠密的 NumPy 数组，日期轴覆盖第一笔到最后一笔订单之间的每一天（以
+    start 为起点的天数），支付方式与支付状态的取值在扫描中遇到时追加。立方体可以合并、
+    保存为 .npz，汇总（周 / 月 / 季度）、切片和 Top-N 查询只在这些小数组上计算，不再扫描原始数据。
+    """
+
+    def __init__(self, start=None, methods=(), statuses=(), arrays=None):
+        self.start = start  # 第 0 天距 1970-01-01 的天数
+        self.categories = list(MAIN_CATEGORIES)
+        self.methods = list(methods)
+        self.statuses = list(statuses)
+        self.arrays = arrays if arrays is not None else {
+            name: np.zeros(self._shape(name, 0), dtype=DTYPES[name]) for name in AXES}
+
+    def _labels(self, axis):
+        return {'category': self.categories, 'method': self.methods, 'status': self.statuses}[axis]
+
+    def _shape(self, name, n_days):
+        return tuple(n_days if axis == 'day' else len(self._labels(axis)) for axis in AXES[name])
+
+    @property
+    def n_days(self):
+        return self.arrays['orders'].shape[0]
+
+    def days(self):
+        if self.start is None:
+            return np.zeros(0, dtype='datetime64[D]')
+        return (self.start + np.arange(self.n_days)).astype('datetime64[D]')
+
+    def _resize(self, start, n_days):
+        # 日期轴扩展到 [start, start + n_days)，支付方式 / 状态轴扩展到当前的标签数，原数据保持不变
+        offset = 0 if self.start is None else self.start - start
+        for name, array in self.arrays.items():
+            resized = np.zeros(self._shape(name, n_days), dtype=array.dtype)
+            resized[tuple(slice(offset, offset + s) if i == 0 else slice(0, s)
+                          for i, s in enumerate(array.shape))] = array
+            self.arrays[name] = resized
+        self.start = start
+
+    def _reserve(self, days=None, labels=None):
+        """登记新的支付方式 / 状态标签（{轴: 标签列表}），并把日期轴扩展到覆盖 days"""
+        grown = False
+        for axis, values in (labels or {}).items():
+            known = self._labels(axis)
+            new = [v for v in dict.fromkeys(values) if v not in known]
+            known.extend(new)
+            grown |= bool(new)
+        start, stop = self.start, None if self.start is None else self.start + self.n_days
+        if days is not None and len(days):
+            lo, hi = int(days.min()), int(days.max()) + 1
+            start, stop = (lo, hi) if start is None else (min(start, lo), max(stop, hi))
+        if grown or start != self.start or (stop is not None and stop - start != self.n_days):
+            self._resize(start, 0 if start is None else stop - start)
+
+    def label_codes(self, axis, categorical):
+        """把数据块的分类列转为立方体中的标签序号，缺失值与空字符串对应 MISSING_LABEL"""
+        local = [str(c) or MISSING_LABEL for c in categorical.categories] + [MISSING_LABEL]
+        self._reserve(labels={axis: local})
+        index = {label: i for i, label in enumerate(self._labels(axis))}
+        return np.array([index[label] for label in local], dtype=np.int64)[categorical.codes]
+
+    def add(self, name, days, *coords, weights=None):
+        """把一批记录累加到度量 name；days 为距 1970-01-01 的天数，coords 依次为其余各轴的序号"""
+        if not len(days):
+            return self
+        self._reserve(days)
+        array = self.arrays[name]
+        flat = np.ravel_multi_index((days - self.start,) + coords, array.shape)
+        array += np.bincount(flat, weights=weights, minlength=array.size).reshape(array.shape).astype(array.dtype)
+        return self
+
+    def merge(self, other):
+        """把另一个立方体累加进来（日期轴与标签按并集对齐）"""
+        if other.start is None:
+            return self
+        self._reserve(other.start + np.array([0, other.n_days - 1]),
+                      {'method': other.methods, 'status': other.statuses})
+        positions = {
+            'day': np.arange(other.n_days) + (other.start - self.start),
+            'category': np.arange(len(other.categories)),
+            'method': np.array([self.methods.index(m) for m in other.methods], dtype=np.int64),
+            'status': np.array([self.statuses.index(s) for s in other.statuses], dtype=np.int64),
+        }
+        for name, array in other.arrays.items():
+            self.arrays[name][np.ix_(*(positions[axis] for axis in AXES[name]))] += array
+        return self
+
+    def select(self, category=None, method=None, status=None, start=None, end=None):
+        """切片：只保留给定的大类 / 支付方式 / 支付状态（单个值或列表）和日期范围 [start, end]，返回新的立方体"""
+        keep = {}
+        for axis, values in (('category', category), ('method', method), ('status', status)):
+            labels = self._labels(axis)
+            keep[axis] = np.arange(len(labels)) if values is None else \
+                np.array([labels.index(v) for v in _as_list(values) if v in labels], dtype=np.int64)
+        days = self.days()
+        lo = 0 if start is None else int(np.searchsorted(days, np.datetime64(start, 'D')))
+        hi = len(days) if end is None else int(np.searchsorted(days, np.datetime64(end, 'D'), side='right'))
+        keep['day'] = np.arange(lo, hi)
+
+        cube = PurchaseCube(None if self.start is None else self.start + lo,
+                            [self.methods[i] for i in keep['method']], [self.statuses[i] for i in keep['status']],
+                            arrays={})
+        cube.categories = [self.categories[i] for i in keep['category']]
+        for name, array in self.arrays.items():
+            cube.arrays[name] = array[np.ix_(*(keep[axis] for axis in AXES[name]))]
+        return cube
+
+    def rollup(self, measure='orders', freq='month', by=()):
+        """把日期轴汇总到 freq（day / week / month / quarter / year），并按 by 中的维度分组
+
+        by 为空时返回以周期为索引的 Series，否则返回列为各分组取值的 DataFrame。
+        """
+        if measure not in AXES:
+            raise ValueError(f"未知的度量: {measure}，可选 {list(AXES)}")
+        by = tuple(_as_list(by))
+        axes = AXES[measure]
+        if any(axis not in axes[1:] for axis in by):
+            raise ValueError(f"度量 {measure} 只能按 {axes[1:]} 分组")
+        array = self.arrays[measure]
+        summed = array.sum(axis=tuple(i for i, axis in enumerate(axes) if i and axis not in by))
+        # 保持 by 的顺序
+        summed = summed.transpose((0,) + tuple(1 + sorted(by, key=axes.index).index(axis) for axis in by))
+
+        periods = pd.PeriodIndex(self.days(), freq=FREQUENCIES[freq])
+        starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]]) if len(periods) else np.zeros(0, int)
+        totals = np.add.reduceat(summed, starts, axis=0) if len(starts) else summed[:0]
+        index = pd.Index(periods[starts], name=freq)
+        if not by:
+            return pd.Series(totals, index=index, name=measure)
+        labels = [self._labels(axis) for axis in by]
+        columns = pd.MultiIndex.from_product(labels, names=by) if len(by) > 1 else pd.Index(labels[0], name=by[0])
+        return pd.DataFrame(totals.reshape(len(starts), len(columns)), index=index, columns=columns)
+
+    def top(self, measure='items', by='category', n=10):
+        """按度量的合计取 by 维度的前 n 个取值"""
+        totals = self.rollup(measure, 'year', by=by).sum()
+        return totals.sort_values(ascending=False, kind='stable').head(n).rename(measure)
+
+    def save(self, path):
+        # 先写临时文件再替换，避免读到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=CUBE_VERSION, start=np.int64(self.start or 0),
+                     categories=np.array(self.categories, dtype=str), methods=np.array(self.methods, dtype=str),
+                     statuses=np.array(self.statuses, dtype=str), **self.arrays)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['version']) != CUBE_VERSION:
+                raise ValueError(f"立方体文件版本不匹配: {path}")
+            arrays = {name: data[name] for name in AXES}
+            # 空立方体的日期轴长度为 0，没有起点
+            start = int(data['start']) if arrays['orders'].shape[0] else None
+            cube = cls(start, data['methods'].tolist(), data['statuses'].tolist(), arrays=arrays)
+            cube.categories = data['categories'].tolist()
+        return cube
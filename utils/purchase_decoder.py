@@ -0,0 +1,218 @@
+from typing import NamedTuple
+
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+
+from utils.instrumentation import count
+
+# purchase_history JSON 中用到的字段；其余字段在解析时直接忽略
+PURCHASE_SCHEMA = pa.schema([
+    ('items', pa.list_(pa.struct([('id', pa.int64())]))),
+    ('payment_method', pa.string()),
+    ('payment_status', pa.string()),
+    ('purchase_date', pa.string()),
+    ('avg_price', pa.float64()),
+    ('categories', pa.string()),
+])
+
+_PARSE_OPTIONS = pj.ParseOptions(explicit_schema=PURCHASE_SCHEMA, unexpected_field_behavior='ignore')
+
+# 整段解析失败且不超过该行数时改为逐行解析，避免坏行较多时二分的层数过多
+ROW_FALLBACK_ROWS = 128
+# 逐行解析时 items.id 类型不符（如字符串 "7"）的占位 id：不在商品目录中，与按原值查目录的结果相同
+UNKNOWN_ITEM_ID = -1
+
+
+class DecodedPurchases(NamedTuple):
+    """一个数据块 purchase_history 的列式解析结果，每个字段与输入逐行对齐"""
+    valid: np.ndarray           # bool，JSON 解析成功的行
+    items_valid: np.ndarray     # bool，解析成功且每个 item 都带有 id 的行（否则只保留第一个缺少 id 的 item 之前的部分）
+    payment_method: pd.Categorical
+    payment_status: pd.Categorical
+    purchase_date: np.ndarray   # datetime64[ns]，缺失或无法解析为 NaT
+    avg_price: np.ndarray       # float64，缺失为 NaN
+    categories: pd.Categorical
+    item_ids: np.ndarray        # int64，所有订单的 items.id 展开
+    item_offsets: np.ndarray    # int64，第 i 行的 items 为 item_ids[item_offsets[i]:item_offsets[i + 1]]
+
+    def item_counts(self):
+        return np.diff(self.item_offsets)
+
+    def item_rows(self):
+        """item_ids 中每个元素所属的行号"""
+        return np.repeat(np.arange(len(self.valid)), self.item_counts())
+
+    def labels(self, name):
+        """把分类字段转为逐行的 Python 字符串数组，缺失为 None"""
+        cat = getattr(self, name)
+        categories = np.asarray(cat.categories, dtype=object)
+        out = np.full(len(cat), None, dtype=object)
+        present = cat.codes >= 0
+        out[present] = categories[cat.codes[present]]
+        return out
+
+
+def _to_string_array(column):
+    if isinstance(column, pd.Series):
+        column = pa.array(column, type=pa.string(), from_pandas=True)
+    elif isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    if not pa.types.is_string(column.type):
+        column = column.cast(pa.string())
+    return column
+
+
+def _join_lines(lines):
+    """每行末尾加换行后拼接为一个缓冲区，返回 (缓冲区, 各行起点偏移量, 读取选项)；各段解析时直接切片"""
+    joined = pc.binary_join_element_wise(lines, '', '\n')
+    offsets = np.frombuffer(joined.buffers()[1], dtype=np.int32)[joined.offset:joined.offset + len(joined) + 1]
+    longest = pc.max(pc.binary_length(joined)).as_py() or 0
+    return joined.buffers()[2], offsets, pj.ReadOptions(block_size=max(1 << 20, 2 * longest))
+
+
+def _parse_block(joined, start, stop):
+    """用 Arrow 的 JSON 读取器一次性解析第 start 到 stop 行，行数对不上时视为失败（遇到坏行时解析提前终止）"""
+    data, offsets, read_options = joined
+    block = data.slice(int(offsets[start]), int(offsets[stop] - offsets[start]))
+    table = pj.read_json(pa.BufferReader(block), read_options=read_options, parse_options=_PARSE_OPTIONS)
+    if table.num_rows != stop - start:
+        raise ValueError('JSON 行数与输入不一致')
+    return table
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _item_id(item):
+    # 缺少 id、id 不可哈希（无法查目录）或 item 不是对象时为 None（该订单的 items 无效）；整数值的浮点数按整数处理
+    if not isinstance(item, dict) or 'id' not in item or isinstance(item['id'], (list, dict)):
+        return None
+    value = item['id']
+    if _is_number(value) and float(value).is_integer():
+        return int(value)
+    return UNKNOWN_ITEM_ID
+
+
+def _lenient_record(line):
+    """用 json 逐行解析，类型不符的字段单独置空，其余字段照常保留；不是 JSON 对象时返回 None"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+    items = record.get('items')
+    text = {name: record.get(name) if isinstance(record.get(name), str) else None
+            for name in ('payment_method', 'payment_status', 'purchase_date', 'categories')}
+    return dict(text,
+                items=[{'id': _item_id(item)} for item in items] if isinstance(items, list) else None,
+                avg_price=float(record['avg_price']) if _is_number(record.get('avg_price')) else None)
+
+
+def _parse_lenient(lines, start, tables, valid):
+    records = [_lenient_record(line) for line in lines.to_pylist()]
+    for i, record in enumerate(records):
+        valid[start + i] = record is not None
+    tables.append(pa.Table.from_pylist([r or {} for r in records], schema=PURCHASE_SCHEMA))
+
+
+def _parse_rows(lines, joined, start, stop, tables, valid):
+    # 整段解析失败时二分定位坏行，段足够小后逐行解析：JSON 无效的行被标记为无效，
+    # 字段类型不符的行只置空对应字段
+    try:
+        tables.append(_parse_block(joined, start, stop))
+        valid[start:stop] = True
+    except (pa.ArrowInvalid, ValueError):
+        if stop - start <= ROW_FALLBACK_ROWS:
+            _parse_lenient(lines.slice(start, stop - start), start, tables, valid)
+            return
+        mid = (start + stop) // 2
+        _parse_rows(lines, joined, start, mid, tables, valid)
+        _parse_rows(lines, joined, mid, stop, tables, valid)
+
+
+def _categorical(arr):
+    encoded = pc.dictionary_encode(arr)
+    codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int32)
+    return pd.Categorical.from_codes(codes, categories=encoded.dictionary.to_pylist())
+
+
+def _parse_dates(arr):
+    dates = pd.Series(arr.to_numpy(zero_copy_only=False), dtype=object)
+    parsed = pd.to_datetime(dates, errors='coerce', format='ISO8601')
+    retry = parsed.isna() & dates.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(dates[retry], errors='coerce', format='mixed')
+    return parsed.to_numpy(dtype='datetime64[ns]')
+
+
+def decode_purchase_history(column):
+    """把一列 purchase_history JSON 字符串解析为列式结果，不为每行构造 Python dict
+
+    column 可以是 Arrow 数组（推荐，直接取自 RecordBatch）或 pandas Series。空值和非 JSON 对象的行
+    在 valid 中为 False，其各字段为空、items 为空列表；字段类型不符时只有该字段为空。
+    """
+    lines = _to_string_array(column)
+    n = len(lines)
+    null_rows = lines.null_count
+
+    # 只有形如 {...} 的行交给解析器，其余直接视为无效
+    lines = pc.ascii_trim_whitespace(pc.replace_substring_regex(lines, '[\r\n]', ' '))
+    candidate = pc.and_(pc.starts_with(lines, '{'), pc.ends_with(lines, '}')).fill_null(False)
+    candidate = candidate.to_numpy(zero_copy_only=False)
+    lines = pc.if_else(candidate, lines, '{}')
+
+    tables = []
+    valid = np.zeros(n, dtype=bool)
+    if n:
+        _parse_rows(lines, _join_lines(lines), 0, n, tables, valid)
+    table = pa.concat_tables(tables).combine_chunks() if tables else PURCHASE_SCHEMA.empty_table()
+    valid &= candidate
+
+    # items 展开为扁平 id 数组 + 偏移量；无效行的 items 置空
+    items = table.column('items').chunk(0) if table.num_rows else pa.array([], PURCHASE_SCHEMA.field('items').type)
+    counts = pc.list_value_length(items).fill_null(0).to_numpy(zero_copy_only=False).astype(np.int64)
+    flat_ids = pc.struct_field(pc.list_flatten(items), 'id')
+    item_rows = np.repeat(np.arange(n), counts)
+    missing_id = flat_ids.is_null().to_numpy(zero_copy_only=False)
+    items_valid = valid.copy()
+    items_valid[item_rows[missing_id]] = False
+
+    # items 无效的行只保留第一个缺少 id 的 item 之前的部分（与逐个处理 item、遇错停止的结果相同）
+    positions = np.arange(len(item_rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    first_missing = np.full(n, np.iinfo(np.int64).max)
+    np.minimum.at(first_missing, item_rows[missing_id], positions[missing_id])
+    keep = valid[item_rows] & (positions < first_missing[item_rows])
+    item_ids = flat_ids.fill_null(0).to_numpy(zero_copy_only=False)[keep]
+    counts = np.bincount(item_rows[keep], minlength=n).astype(np.int64)
+    item_offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=item_offsets[1:])
+
+    # 跳过的行 = 空值 + 无法解析（malformed）的行；bad_items 为解析成功但有 item 缺少 id 的行
+    skipped = n - int(valid.sum())
+    count('purchase_history.rows', n)
+    count('purchase_history.skipped', skipped)
+    count('purchase_history.malformed', skipped - null_rows)
+    count('purchase_history.bad_items', int((valid & ~items_valid).sum()))
+
+    def field(name):
+        arr = table.column(name).combine_chunks()
+        return pc.if_else(pa.array(valid), arr, pa.scalar(None, arr.type))
+
+    return DecodedPurchases(
+        valid=valid,
+        items_valid=items_valid,
+        payment_method=_categorical(field('payment_method')),
+        payment_status=_categorical(field('payment_status')),
+        purchase_date=_parse_dates(field('purchase_date')),
+        avg_price=field('avg_price').to_numpy(zero_copy_only=False).astype(np.float64),
+        categories=_categorical(field('categories')),
+        item_ids=item_ids.astype(np.int64),
+        item_offsets=item_offsets,
+    )
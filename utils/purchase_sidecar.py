@@ -0,0 +1,237 @@
+import json
+import os
+import shutil
+import tempfile
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.checkpoint import file_fingerprint
+from utils.instrumentation import count
+from utils.parallel import list_partitions, map_partitions
+from utils.parquet_reader import DEFAULT_MEMORY_BUDGET_MB, batch_size_for_budget, iter_batches
+from utils.purchase_decoder import DecodedPurchases, _categorical, decode_purchase_history
+
+# 旁路数据格式变化时递增，旧数据随之视为过期
+SIDECAR_VERSION = 3
+FINGERPRINT_KEY = b'source_fingerprint'
+
+# 订单表：与源文件逐行对齐；商品表：所有订单的 items 展开，row 为订单在源文件中的行号
+ORDERS_SCHEMA = pa.schema([
+    ('valid', pa.bool_()),
+    ('items_valid', pa.bool_()),
+    ('payment_method', pa.dictionary(pa.int32(), pa.string())),
+    ('payment_status', pa.dictionary(pa.int32(), pa.string())),
+    ('purchase_date', pa.timestamp('ns')),
+    ('avg_price', pa.float64()),
+    ('categories', pa.dictionary(pa.int32(), pa.string())),
+    ('item_count', pa.int32()),
+])
+ITEMS_SCHEMA = pa.schema([
+    ('row', pa.int64()),
+    ('item_id', pa.int64()),
+])
+
+
+def sidecar_dir(file_path):
+    """源文件旁的旁路目录：part-00000.parquet → part-00000.purchases/（不以 .parquet 结尾，不会被当作数据文件）"""
+    return os.path.splitext(file_path)[0] + '.purchases'
+
+
+def _fingerprint_metadata(file_path):
+    fingerprint = dict(file_fingerprint(file_path), version=SIDECAR_VERSION)
+    return {FINGERPRINT_KEY: json.dumps(fingerprint, sort_keys=True).encode('utf-8')}
+
+
+def is_fresh(file_path):
+    """旁路数据存在且与源文件当前的 (大小, 修改时间) 一致"""
+    directory = sidecar_dir(file_path)
+    try:
+        expected = _fingerprint_metadata(file_path)[FINGERPRINT_KEY]
+        for name in ('orders.parquet', 'items.parquet'):
+            metadata = pq.read_schema(os.path.join(directory, name)).metadata or {}
+            if metadata.get(FINGERPRINT_KEY) != expected:
+                return False
+        return True
+    except (OSError, pa.ArrowInvalid):
+        return False
+
+
+def _orders_batch(purchases):
+    def dictionary(cat):
+        return pa.DictionaryArray.from_arrays(
+            pa.array(cat.codes, mask=cat.codes < 0, type=pa.int32()),
+            pa.array(np.asarray(cat.categories, dtype=object), type=pa.string()))
+
+    return pa.record_batch([
+        pa.array(purchases.valid),
+        pa.array(purchases.items_valid),
+        dictionary(purchases.payment_method),
+        dictionary(purchases.payment_status),
+        pa.array(purchases.purchase_date, type=pa.timestamp('ns'), from_pandas=True),
+        pa.array(purchases.avg_price, from_pandas=False),
+        dictionary(purchases.categories),
+        pa.array(purchases.item_counts().astype(np.int32)),
+    ], schema=ORDERS_SCHEMA)
+
+
+def materialize(file_path, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """解析源文件的 purchase_history，写出订单表和商品表（字典编码的 parquet）；已是最新时直接返回"""
+    if is_fresh(file_path):
+        return False
+    # 指纹在读取前取得，写出期间源文件被修改时下次会重新生成
+    metadata = _fingerprint_metadata(file_path)
+    directory = sidecar_dir(file_path)
+    work_dir = tempfile.mkdtemp(prefix='.purchases_', dir=os.path.dirname(os.path.abspath(file_path)))
+    try:
+        orders = pq.ParquetWriter(os.path.join(work_dir, 'orders.parquet'),
+                                  ORDERS_SCHEMA.with_metadata(metadata), use_dictionary=True)
+        items = pq.ParquetWriter(os.path.join(work_dir, 'items.parquet'),
+                                 ITEMS_SCHEMA.with_metadata(metadata), use_dictionary=True)
+        row_offset = 0
+        with orders, items:
+            for batch in iter_batches(file_path, columns=['purchase_history'], memory_budget_mb=memory_budget_mb):
+                purchases = decode_purchase_history(batch.column('purchase_history'))
+                orders.write_batch(_orders_batch(purchases))
+                items.write_batch(pa.record_batch([pa.array(row_offset + purchases.item_rows()),
+                                                   pa.array(purchases.item_ids)], schema=ITEMS_SCHEMA))
+                row_offset += batch.num_rows
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(work_dir, directory)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return True
+
+
+def _materialize_partition(partition, memory_budget_mb):
+    return materialize(partition[0], memory_budget_mb)
+
+
+def materialize_sidecars(source, n_workers=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """为 source 下每个文件生成（或更新）旁路数据，返回实际重新生成的文件数"""
+    worker = partial(_materialize_partition, memory_budget_mb=memory_budget_mb)
+    return sum(map_partitions(worker, list_partitions(source), n_workers))
+
+
+class _RowStream:
+    """把 RecordBatch 迭代器按需切成指定行数的表"""
+
+    def __init__(self, batches, schema):
+        self.batches = batches
+        self.schema = schema
+        self.pending = []
+        self.available = 0
+
+    def take(self, n):
+        while self.available < n:
+            batch = next(self.batches)
+            self.pending.append(batch)
+            self.available += batch.num_rows
+        table = pa.Table.from_batches(self.pending, schema=self.schema)
+        head, rest = table.slice(0, n), table.slice(n)
+        self.pending = rest.to_batches()
+        self.available = rest.num_rows
+        return head
+
+
+def _iter_range(path, columns, start, stop, batch_size):
+    # 只读取与 [start, stop) 有交集的 row group，并裁掉范围外的行
+    parquet_file = pq.ParquetFile(path)
+    metadata = parquet_file.metadata
+    bounds = np.cumsum([0] + [metadata.row_group(rg).num_rows for rg in range(metadata.num_row_groups)])
+    row_groups = [rg for rg in range(metadata.num_row_groups) if bounds[rg] < stop and bounds[rg + 1] > start]
+    if not row_groups:
+        return
+    position = int(bounds[row_groups[0]])
+    for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=columns):
+        lo, hi = max(start - position, 0), min(stop - position, batch.num_rows)
+        position += batch.num_rows
+        if lo < hi:
+            yield batch.slice(lo, hi - lo)
+        if position >= stop:
+            return
+
+
+def _decoded_from_tables(orders, item_ids):
+    counts = orders.column('item_count').to_numpy().astype(np.int64)
+    item_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=item_offsets[1:])
+
+    def categorical(name):
+        # 与直接解析相同：类别按在本块中首次出现的顺序编码
+        return _categorical(orders.column(name).cast(pa.string()).combine_chunks())
+
+    return DecodedPurchases(
+        valid=orders.column('valid').to_numpy(),
+        items_valid=orders.column('items_valid').to_numpy(),
+        payment_method=categorical('payment_method'),
+        payment_status=categorical('payment_status'),
+        purchase_date=orders.column('purchase_date').to_pandas().to_numpy(dtype='datetime64[ns]'),
+        avg_price=orders.column('avg_price').to_numpy().astype(np.float64),
+        categories=categorical('categories'),
+        item_ids=item_ids.column('item_id').to_numpy().astype(np.int64),
+        item_offsets=item_offsets,
+    )
+
+
+def iter_decoded(file_path, columns=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, row_groups=None):
+    """逐块产出 (DataFrame, DecodedPurchases)
+
+    旁路数据为最新时不读取 purchase_history 列，解析结果直接取自订单表和商品表；
+    否则读取并解析 JSON。两种方式的分块大小相同，结果完全一致。
+    """
+    try:
+        parquet_file = pq.ParquetFile(file_path)
+    except Exception as e:
+        print(f"❌ Error reading {os.path.basename(file_path)}: {e}")
+        count('files.unreadable')
+        return
+    metadata = parquet_file.metadata
+    if columns is None:
+        columns = parquet_file.schema_arrow.names
+    columns = list(columns) + (['purchase_history'] if 'purchase_history' not in columns else [])
+    bounds = np.cumsum([0] + [metadata.row_group(rg).num_rows for rg in range(metadata.num_row_groups)])
+    selected = list(range(metadata.num_row_groups)) if row_groups is None else sorted(row_groups)
+    # 旁路数据按行号范围对齐，只用于连续的 row group
+    contiguous = selected == list(range(selected[0], selected[-1] + 1)) if selected else False
+
+    if not contiguous or not is_fresh(file_path):
+        # 直接把 Arrow 列交给解析器，不经过 pandas 的 object 列
+        for batch in iter_batches(file_path, columns=columns, memory_budget_mb=memory_budget_mb, row_groups=row_groups):
+            yield batch.to_pandas(), decode_purchase_history(batch.column('purchase_history'))
+        return
+
+    # 分块大小按包含 purchase_history 的列计算，与不使用旁路数据时一致
+    batch_size = batch_size_for_budget(parquet_file, columns, memory_budget_mb)
+    start, stop = int(bounds[selected[0]]), int(bounds[selected[-1] + 1])
+    directory = sidecar_dir(file_path)
+    orders_path, items_path = os.path.join(directory, 'orders.parquet'), os.path.join(directory, 'items.parquet')
+    item_counts = pq.read_table(orders_path, columns=['item_count']).column('item_count').to_numpy()
+    item_offsets = np.concatenate([[0], np.cumsum(item_counts.astype(np.int64))])
+    # 订单表、商品表的 row group 划分与源文件不同，按行号范围对齐读取
+    orders = _RowStream(_iter_range(orders_path, None, start, stop, batch_size), ORDERS_SCHEMA)
+    items = _RowStream(_iter_range(items_path, ['item_id'], int(item_offsets[start]), int(item_offsets[stop]),
+                                   batch_size), ITEMS_SCHEMA.remove(0))
+
+    source_columns = [c for c in columns if c != 'purchase_history']
+    if source_columns:
+        frames = (batch.to_pandas() for batch in
+                  parquet_file.iter_batches(batch_size=batch_size, row_groups=selected, columns=source_columns))
+    else:
+        # 不需要源文件中的任何列：按同样的 batch_size 切分行号范围（不按 row group 切分）
+        frames = (pd.DataFrame(index=pd.RangeIndex(min(batch_size, stop - offset)))
+                  for offset in range(start, stop, batch_size))
+    for df in frames:
+        order_rows = orders.take(len(df))
+        n_items = int(pc.sum(order_rows.column('item_count')).as_py() or 0)
+        purchases = _decoded_from_tables(order_rows, items.take(n_items))
+        # 与直接解析时相同的计数（旁路数据不区分空值和无法解析的行，不计 malformed）
+        count('rows.read', len(df))
+        count('purchase_history.rows', len(df))
+        count('purchase_history.skipped', int((~purchases.valid).sum()))
+        count('purchase_history.bad_items', int((purchases.valid & ~purchases.items_valid).sum()))
+        yield df, purchases
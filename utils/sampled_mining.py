@@ -0,0 +1,176 @@
+import math
+from collections import Counter
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from utils.basket_encoding import _next_candidates, encode_baskets, itemset_mask, support_counts
+from utils.instrumentation import count
+from utils.itemset_mining import mine_frequent_itemsets
+from utils.parquet_reader import resolve_sources
+
+
+def sample_partitions(source, fraction, seed=0, prefix=None):
+    """按 row group 系统抽样：所有文件的 row group 依次排列，随机起点后每隔 1/fraction 个取一个
+
+    抽样在文件之间均匀分布（分层），只需读取被抽中的 row group。返回 (分区列表, 抽样行数, 总行数)，
+    分区格式与 list_partitions(by='row_group') 相同，可直接交给 ScanPipeline.run。
+    注意这是按 row group 整块抽样，数据在文件内按某字段排序时样本的方差会大于独立抽样。
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError(f"抽样比例应在 (0, 1] 内: {fraction}")
+    row_groups = []
+    for file_path in resolve_sources(source, prefix):
+        try:
+            metadata = pq.ParquetFile(file_path).metadata
+        except Exception as e:
+            print(f"❌ Error reading {file_path}: {e}")
+            count('files.unreadable')
+            continue
+        row_groups.extend((file_path, rg, metadata.row_group(rg).num_rows) for rg in range(metadata.num_row_groups))
+    if not row_groups:
+        return [], 0, 0
+
+    step = 1 / fraction
+    start = np.random.default_rng(seed).uniform(0, step)
+    picked = sorted({min(int(start + i * step), len(row_groups) - 1)
+                     for i in range(max(1, round(len(row_groups) * fraction)))})
+    partitions = [(row_groups[i][0], [row_groups[i][1]]) for i in picked]
+    sampled_rows = sum(row_groups[i][2] for i in picked)
+    return partitions, sampled_rows, sum(n for _, _, n in row_groups)
+
+
+def reservoir_sample(baskets, size, seed=0):
+    """从 {购物篮: 次数} 中无放回地等概率抽取 size 笔交易（多元超几何分布，与蓄水池抽样同分布）"""
+    keys = list(baskets)
+    counts = np.array([baskets[k] for k in keys], dtype=np.int64)
+    if size >= counts.sum():
+        return Counter(baskets)
+    drawn = np.random.default_rng(seed).multivariate_hypergeometric(counts, size)
+    return Counter({k: int(n) for k, n in zip(keys, drawn) if n})
+
+
+def wilson_interval(support, n, confidence=0.95):
+    """二项比例的 Wilson 置信区间，support 可以是数组"""
+    support = np.asarray(support, dtype=np.float64)
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+    denominator = 1 + z * z / n
+    center = (support + z * z / (2 * n)) / denominator
+    half = z * np.sqrt(support * (1 - support) / n + z * z / (4 * n * n)) / denominator
+    return np.clip(center - half, 0, 1), np.clip(center + half, 0, 1)
+
+
+def lowered_threshold(min_support, n, confidence=0.95):
+    """Toivonen 下调后的样本阈值：减去 Hoeffding 偏差 sqrt(ln(1/δ) / 2n)，最多下调到 min_support 的一半"""
+    epsilon = math.sqrt(math.log(1 / (1 - confidence)) / (2 * n))
+    return max(min_support - epsilon, min_support / 2)
+
+
+def negative_border(itemsets, n_items, max_len=None):
+    """向下封闭的项集族（升序元组）的负边界：自身不在族中、但所有真子集都在族中的极小项集"""
+    family = set(itemsets)
+    border = [(i,) for i in range(n_items) if (i,) not in family]
+    by_length = {}
+    for itemset in family:
+        by_length.setdefault(len(itemset), []).append(itemset)
+    for k, level in sorted(by_length.items()):
+        if max_len is not None and k >= max_len:
+            break
+        border.extend(c for c in _next_candidates(sorted(level)) if c not in family)
+    return border
+
+
+def _frame(itemsets, supports, n, confidence, items, extra=None):
+    # 按项集长度、再按项序号排列，与 mine_frequent_itemsets 的输出顺序一致
+    order = sorted(range(len(itemsets)), key=lambda i: (len(itemsets[i]), itemsets[i]))
+    supports = np.asarray(supports, dtype=np.float64)[order] if len(order) else np.zeros(0)
+    lower, upper = wilson_interval(supports, n, confidence)
+    frame = pd.DataFrame({
+        'support': supports,
+        'itemsets': pd.Series([frozenset(items[j] for j in itemsets[i]) for i in order], dtype=object),
+        'support_lower': lower,
+        'support_upper': upper,
+    })
+    for name, values in (extra or {}).items():
+        frame[name] = np.asarray(values)[order] if len(order) else values[:0]
+    return frame
+
+
+class ApproximateItemsets:
+    """Toivonen 抽样挖掘：在样本上以下调后的阈值挖掘候选，并计算候选的负边界
+
+    frequent_itemsets() 直接给出样本估计的支持度及置信区间；verify() 在全量购物篮上精确统计
+    候选与负边界的支持度，负边界中没有频繁项集时结果保证完整，否则回退到全量精确挖掘。
+    """
+
+    def __init__(self, sample_baskets, min_support, confidence=0.95, lowered_support=None, algorithm='bitset',
+                 max_len=None):
+        self.masks, self.counts, self.items = encode_baskets(sample_baskets)
+        self.n = int(self.counts.sum())
+        if not self.n:
+            raise ValueError("样本中没有交易")
+        self.min_support = min_support
+        self.confidence = confidence
+        self.max_len = max_len
+        self.algorithm = algorithm
+        self.lowered_support = lowered_threshold(min_support, self.n, confidence) \
+            if lowered_support is None else lowered_support
+
+        candidates = mine_frequent_itemsets(self.masks, self.counts, self.items, min_support=self.lowered_support,
+                                            algorithm=algorithm, max_len=max_len)
+        self.candidates = [tuple(sorted(c)) for c in candidates['itemsets']]
+        self.candidate_supports = candidates['support'].to_numpy(dtype=np.float64)
+        self.border = negative_border(self.candidates, len(self.items), max_len)
+        border_counts = support_counts(self.masks, self.counts, [itemset_mask(c) for c in self.border])
+        self.border_supports = border_counts / self.n
+        self.missed = None
+
+    def frequent_itemsets(self):
+        """样本支持度 >= min_support 的项集：support 为样本估计，support_lower / support_upper 为 Wilson 置信区间"""
+        keep = self.candidate_supports >= self.min_support
+        itemsets = [c for c, ok in zip(self.candidates, keep) if ok]
+        return _frame(itemsets, self.candidate_supports[keep], self.n, self.confidence, self.items)
+
+    def verify(self, baskets):
+        """在全量购物篮上精确校验，返回精确的频繁项集（附样本支持度与置信区间、真实值是否落在区间内）
+
+        全量数据中的项可能比样本多：样本中未出现的单项也属于负边界。负边界中有频繁项集时
+        （self.missed 非空）样本结果可能不完整，改为在全量购物篮上精确挖掘。
+        """
+        masks, counts, items = encode_baskets(baskets, sorted(set(self.items) | {i for b in baskets for i in b}))
+        n_rows = int(counts.sum())
+        index_of = {item: i for i, item in enumerate(items)}
+
+        def remap(itemsets):
+            return [tuple(sorted(index_of[self.items[i]] for i in c)) for c in itemsets]
+
+        candidates, border = remap(self.candidates), remap(self.border)
+        sampled_items = set(self.items)
+        border += [(index_of[item],) for item in items if item not in sampled_items]
+        exact = support_counts(masks, counts, [itemset_mask(c) for c in candidates + border]) / n_rows
+        self.missed = [frozenset(items[i] for i in c) for c, s in zip(border, exact[len(candidates):])
+                       if s >= self.min_support]
+
+        sample_of = dict(zip(candidates, self.candidate_supports))
+        if self.missed:
+            full = mine_frequent_itemsets(masks, counts, items, min_support=self.min_support,
+                                          algorithm=self.algorithm, max_len=self.max_len)
+            itemsets = [tuple(sorted(c)) for c in full['itemsets']]
+            supports = full['support'].to_numpy(dtype=np.float64)
+        else:
+            keep = exact[:len(candidates)] >= self.min_support
+            itemsets = [c for c, ok in zip(candidates, keep) if ok]
+            supports = exact[:len(candidates)][keep]
+
+        sample_supports = np.array([sample_of.get(c, np.nan) for c in itemsets], dtype=np.float64)
+        lower, upper = wilson_interval(np.nan_to_num(sample_supports), self.n, self.confidence)
+        frame = _frame(itemsets, supports, n_rows, self.confidence, items, {
+            'sample_support': sample_supports,
+            'sample_lower': np.where(np.isnan(sample_supports), np.nan, lower),
+            'sample_upper': np.where(np.isnan(sample_supports), np.nan, upper),
+        })
+        frame['within_bounds'] = (frame['support'] >= frame['sample_lower']) & \
+                                 (frame['support'] <= frame['sample_upper'])
+        return frame.drop(columns=['support_lower', 'support_upper'])
@@ -0,0 +1,115 @@
+import os
+from functools import partial
+
+from utils.checkpoint import CheckpointManifest, file_fingerprint
+from utils.parquet_reader import DEFAULT_MEMORY_BUDGET_MB
+from utils.parallel import list_partitions, map_partitions
+from utils.purchase_sidecar import iter_decoded
+
+
+class Consumer:
+    """扫描流水线的消费者
+
+    每个分区从 start() 返回的空状态开始，逐块调用 consume() 更新状态，
+    各分区的状态最后按分区顺序 merge() 成最终结果。状态需要可以 pickle。
+    """
+    # 需要读取的列（purchase_history 总会被解析；有最新的旁路数据时不读取原始 JSON 列）
+    columns = ('purchase_history',)
+    # 只处理文件名以 prefix 开头的文件，None 表示全部
+    prefix = None
+
+    def start(self):
+        raise NotImplementedError
+
+    def consume(self, state, df, purchases):
+        raise NotImplementedError
+
+    def merge(self, total, partial):
+        raise NotImplementedError
+
+    def checkpoint_key(self):
+        """检查点有效性的标识，消费者的配置（如商品目录）变化时应随之变化"""
+        return type(self).__name__
+
+    def checkpoint(self, state, path_prefix):
+        """返回可以写入检查点的状态；引用临时文件的状态需先把数据保存到 path_prefix 开头的文件"""
+        return state
+
+
+class ScanPipeline:
+    """只扫描一遍数据，把每个数据块及其 purchase_history 解析结果分发给所有已注册的消费者"""
+
+    def __init__(self, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+        self.memory_budget_mb = memory_budget_mb
+        self.consumers = {}
+
+    def register(self, name, consumer):
+        self.consumers[name] = consumer
+        return self
+
+    def columns(self):
+        columns = ['purchase_history']
+        for consumer in self.consumers.values():
+            columns.extend(col for col in consumer.columns if col not in columns)
+        return columns
+
+    def active_consumers(self, file_path):
+        fname = os.path.basename(file_path)
+        return {name: consumer for name, consumer in self.consumers.items()
+                if consumer.prefix is None or fname.startswith(consumer.prefix)}
+
+    def scan_partition(self, partition):
+        file_path, row_groups = partition
+        active = self.active_consumers(file_path)
+        states = {name: consumer.start() for name, consumer in active.items()}
+        if not active:
+            return states
+        # 每个数据块只解析一次 JSON；有最新的旁路数据时直接读取解析结果
+        for df, purchases in iter_decoded(file_path, columns=self.columns(), memory_budget_mb=self.memory_budget_mb,
+                                          row_groups=row_groups):
+            for name, consumer in active.items():
+                states[name] = consumer.consume(states[name], df, purchases)
+        return states
+
+    def scan_and_checkpoint(self, manifest, partition):
+        states = self.scan_partition(partition)
+        states = {name: self.consumers[name].checkpoint(state, manifest.file_prefix(partition, name))
+                  for name, state in states.items()}
+        return states, manifest.save_states(partition, states)
+
+    def run(self, source, n_workers=None, partition_by='file', checkpoint_dir=None, partitions=None):
+        """扫描 source 下的全部数据，返回 {消费者名: 最终结果}
+
+        指定 checkpoint_dir 时，每个分区的部分结果保存为检查点；再次运行时只扫描新增或
+        修改过的文件，其余分区直接读取检查点，合并顺序与完整扫描相同。
+        partitions 不为 None 时只扫描给定的分区（如 sampled_mining.sample_partitions 的抽样结果）。
+        """
+        results = {name: consumer.start() for name, consumer in self.consumers.items()}
+        if partitions is None:
+            partitions = list_partitions(source, by=partition_by)
+
+        manifest = CheckpointManifest(checkpoint_dir) if checkpoint_dir else None
+        keys = [{name: consumer.checkpoint_key() for name, consumer in self.active_consumers(p[0]).items()}
+                for p in partitions]
+        if manifest is None:
+            stale = list(range(len(partitions)))
+            computed = map_partitions(self.scan_partition, partitions, n_workers)
+        else:
+            stale = [i for i, p in enumerate(partitions) if not manifest.is_current(p, keys[i])]
+            fingerprints = {i: file_fingerprint(partitions[i][0]) for i in stale}
+            computed = map_partitions(partial(self.scan_and_checkpoint, manifest),
+                                      [partitions[i] for i in stale], n_workers)
+            print(f"♻️ 检查点: 复用 {len(partitions) - len(stale)} 个分区，扫描 {len(stale)} 个分区")
+
+        stale = set(stale)
+        for i, partition in enumerate(partitions):
+            if i not in stale:
+                states = manifest.load_states(partition, keys[i])
+            elif manifest is None:
+                states = next(computed)
+            else:
+                states, paths = next(computed)
+                manifest.record(partition, fingerprints[i], keys[i], paths)
+            for name, state in states.items():
+                results[name] = self.consumers[name].merge(results[name], state)
+        return results
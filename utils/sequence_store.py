@@ -0,0 +1,193 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# 一条购买记录：用户 id、购买时间（纳秒时间戳）、追加序号、大类编码
+RECORD_DTYPE = np.dtype([('uid', '<i8'), ('ts', '<i8'), ('seq', '<i8'), ('cat', 'u1')])
+
+DEFAULT_MEMORY_LIMIT_MB = 256
+# k 路归并时每个有序段每次读入的记录数
+MERGE_BLOCK_ROWS = 1 << 16
+
+
+def _sort_records(records):
+    return records[np.lexsort((records['seq'], records['ts'], records['uid']))]
+
+
+def _le(records, bound):
+    """records 中按 (uid, ts, seq) 字典序不大于 bound 的位置"""
+    uid, ts, seq = bound['uid'], bound['ts'], bound['seq']
+    return (records['uid'] < uid) | ((records['uid'] == uid) &
+                                     ((records['ts'] < ts) | ((records['ts'] == ts) & (records['seq'] <= seq))))
+
+
+class SequenceStore:
+    """用户购买序列的列式存储
+
+    记录按追加顺序编号，内存中的缓冲超过 memory_limit_mb 时按 (uid, ts, seq) 排序
+    写成一个磁盘有序段；读取时对全部有序段做 k 路归并，得到按用户、时间排序的记录流，
+    同一用户同一时间的记录保持追加顺序。数据量大于内存时也只需要常数个数据块的内存。
+
+    状态可以 pickle：磁盘有序段以文件路径保存，合并（extend）时只转移路径，不复制数据。
+    磁盘文件需要调用 close() 删除。
+    """
+
+    def __init__(self, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, spill_dir=None):
+        self.memory_limit_mb = memory_limit_mb
+        self.spill_dir = spill_dir
+        self.count = 0
+        self._buffer = []
+        self._buffer_rows = 0
+        self._runs = []  # [(文件路径, seq 偏移)]
+        self._run_dir = None
+        self._merged_dirs = []  # extend() 接收的其他存储的有序段目录
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, user_ids, timestamps, category_codes):
+        n = len(user_ids)
+        if not n:
+            return self
+        records = np.empty(n, dtype=RECORD_DTYPE)
+        records['uid'] = user_ids
+        records['ts'] = np.asarray(timestamps).astype('datetime64[ns]').view(np.int64)
+        records['seq'] = np.arange(self.count, self.count + n)
+        records['cat'] = category_codes
+        self._buffer.append(records)
+        self._buffer_rows += n
+        self.count += n
+        if self._buffer_rows * RECORD_DTYPE.itemsize > self.memory_limit_mb * 1024 * 1024:
+            self.spill()
+        return self
+
+    def spill(self):
+        """把内存缓冲排序后写成一个磁盘有序段"""
+        if not self._buffer:
+            return
+        if self._run_dir is None:
+            self._run_dir = tempfile.mkdtemp(prefix='sequence_store_', dir=self.spill_dir)
+        path = os.path.join(self._run_dir, f'run-{len(self._runs):05d}.npy')
+        np.save(path, _sort_records(np.concatenate(self._buffer)))
+        self._runs.append((path, 0))
+        self._buffer, self._buffer_rows = [], 0
+
+    def extend(self, other):
+        """把另一个存储的记录接在本存储之后（记录序号整体后移），other 之后不应再使用"""
+        offset = self.count
+        self._runs.extend((path, seq_offset + offset) for path, seq_offset in other._runs)
+        for records in other._buffer:
+            records = records.copy()
+            records['seq'] += offset
+            self._buffer.append(records)
+            self._buffer_rows += len(records)
+        self.count += other.count
+        self._merged_dirs.extend(d for d in [other._run_dir] + other._merged_dirs if d is not None)
+        other._runs, other._buffer, other._run_dir, other._merged_dirs = [], [], None, []
+        if self._buffer_rows * RECORD_DTYPE.itemsize > self.memory_limit_mb * 1024 * 1024:
+            self.spill()
+        return self
+
+    def _sources(self):
+        # 磁盘有序段用内存映射读取，内存缓冲排序后作为最后一段
+        sources = [(np.load(path, mmap_mode='r'), offset) for path, offset in self._runs]
+        if self._buffer:
+            sources.append((_sort_records(np.concatenate(self._buffer)), 0))
+        return sources
+
+    def iter_sorted(self, block_rows=MERGE_BLOCK_ROWS):
+        """按 (uid, ts, 追加顺序) 升序产出记录块（RECORD_DTYPE 结构化数组）"""
+        sources = [s for s in self._sources() if len(s[0])]
+        positions = [0] * len(sources)
+
+        def read(i):
+            run, offset = sources[i]
+            block = np.array(run[positions[i]:positions[i] + block_rows])
+            block['seq'] += offset
+            positions[i] += len(block)
+            return block
+
+        buffers = [read(i) for i in range(len(sources))]
+        while any(len(b) for b in buffers):
+            # 各段当前块末尾的最小键之前的记录都已就绪
+            active = [i for i, b in enumerate(buffers) if len(b)]
+            bound = min((buffers[i][-1] for i in active), key=lambda r: (r['uid'], r['ts'], r['seq']))
+            ready = []
+            for i in active:
+                take = _le(buffers[i], bound)
+                ready.append(buffers[i][take])
+                buffers[i] = buffers[i][~take]
+                if not len(buffers[i]) and positions[i] < len(sources[i][0]):
+                    buffers[i] = read(i)
+            yield _sort_records(np.concatenate(ready))
+
+    def iter_sequences(self, block_rows=MERGE_BLOCK_ROWS):
+        """逐个用户产出 (uid, 时间戳数组, 大类编码数组)，时间升序"""
+        carry = None
+        for block in self.iter_sorted(block_rows):
+            if carry is not None:
+                block = np.concatenate([carry, block])
+            starts = np.flatnonzero(np.r_[True, block['uid'][1:] != block['uid'][:-1]])
+            # 最后一个用户可能延续到下一块
+            for start, stop in zip(starts[:-1], starts[1:]):
+                yield block['uid'][start], block['ts'][start:stop], block['cat'][start:stop]
+            carry = block[starts[-1]:]
+        if carry is not None and len(carry):
+            yield carry['uid'][0], carry['ts'], carry['cat']
+
+    def save(self, path):
+        """把全部记录按 (uid, ts, 追加顺序) 写入一个 .npy 文件并返回引用该文件的新存储
+
+        本存储随后被关闭；新存储的 close() 不会删除该文件，可作为检查点长期保存。
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=RECORD_DTYPE, shape=(self.count,))
+        pos = 0
+        for block in self.iter_sorted():
+            out[pos:pos + len(block)] = block
+            pos += len(block)
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+        self.close()
+        return SequenceStore.load(path, self.memory_limit_mb, self.spill_dir)
+
+    @classmethod
+    def load(cls, path, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, spill_dir=None):
+        """以 save() 写出的文件为唯一有序段构造存储"""
+        store = cls(memory_limit_mb, spill_dir)
+        store.count = len(np.load(path, mmap_mode='r'))
+        store._runs = [(path, 0)]
+        return store
+
+    def close(self):
+        """删除磁盘有序段"""
+        for directory in [self._run_dir] + self._merged_dirs:
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+        self._runs, self._buffer, self._buffer_rows = [], [], 0
+        self._run_dir, self._merged_dirs = None, []
+
+
+def count_transitions(store, n_categories):
+    """统计每个用户相邻两次购买的大类转移次数，返回 n_categories × n_categories 矩阵"""
+    counts = np.zeros(n_categories * n_categories, dtype=np.int64)
+    last = None
+    for block in store.iter_sorted():
+        uids, cats = block['uid'], block['cat'].astype(np.int64)
+        if last is not None:
+            # 与上一块的最后一条记录相接
+            uids, cats = np.r_[last[0], uids], np.r_[last[1], cats]
+        same_user = uids[1:] == uids[:-1]
+        counts += np.bincount(cats[:-1][same_user] * n_categories + cats[1:][same_user],
+                              minlength=n_categories * n_categories)
+        last = (uids[-1], cats[-1])
+    return counts.reshape(n_categories, n_categories)
@@ -0,0 +1,221 @@
+import os
+import shutil
+import tempfile
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from utils.itemset_mining import min_support_count
+from utils.parallel import map_partitions
+
+NS_PER_SECOND = 10 ** 9
+
+
+class SequenceDatabase:
+    """整数编码的序列数据库：全部用户的购买事件按 (用户, 时间) 顺序拼接为连续数组
+
+    items[p] 为第 p 个事件的项编码（大类编码），times[p] 为购买时间（秒），sids[p] 为所属序列号，
+    第 s 个序列占 offsets[s]:offsets[s + 1]。同一用户同一时间的同一大类只保留一个事件，
+    同一订单中的多个大类互相之间没有先后顺序。
+    """
+
+    FILES = ('items', 'times', 'sids', 'offsets')
+
+    def __init__(self, items, times, sids, offsets, labels):
+        self.items = items
+        self.times = times
+        self.sids = sids
+        self.offsets = offsets
+        self.labels = list(labels)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_events(self):
+        return len(self.items)
+
+    @classmethod
+    def from_store(cls, store, labels):
+        """由 SequenceStore 按块构建（同一用户的记录可能跨块，最后一个用户留到下一块处理）"""
+        chunks, carry = [], None
+        for block in store.iter_sorted():
+            if not len(block):
+                continue
+            if carry is not None:
+                block = np.concatenate([carry, block])
+            last = np.searchsorted(block['uid'], block['uid'][-1], side='left')
+            carry = block[last:]
+            if last:
+                chunks.append(_distinct_events(block[:last]))
+        if carry is not None and len(carry):
+            chunks.append(_distinct_events(carry))
+
+        uids = np.concatenate([c[0] for c in chunks]) if chunks else np.zeros(0, dtype=np.int64)
+        times = np.concatenate([c[1] for c in chunks]) if chunks else np.zeros(0, dtype=np.int64)
+        items = np.concatenate([c[2] for c in chunks]) if chunks else np.zeros(0, dtype=np.uint8)
+        starts = np.flatnonzero(np.r_[True, uids[1:] != uids[:-1]]) if len(uids) else np.zeros(0, dtype=np.int64)
+        offsets = np.r_[starts, len(uids)].astype(np.int64)
+        sids = np.repeat(np.arange(len(starts), dtype=np.int32), np.diff(offsets))
+        return cls(items, times, sids, offsets, labels)
+
+    def save(self, directory):
+        """写成 .npy 文件，供进程池中的任务以内存映射方式读取"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.FILES:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        np.save(os.path.join(directory, 'labels.npy'), np.array(self.labels, dtype=object), allow_pickle=True)
+        return directory
+
+    @classmethod
+    def load(cls, directory):
+        arrays = [np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in cls.FILES]
+        labels = np.load(os.path.join(directory, 'labels.npy'), allow_pickle=True)
+        return cls(*arrays, labels=labels)
+
+
+def _distinct_events(records):
+    # 按 (用户, 时间, 大类) 去重，返回 (uid, 秒, 大类) 三列
+    records = records[np.lexsort((records['cat'], records['ts'], records['uid']))]
+    keep = np.r_[True, (records['uid'][1:] != records['uid'][:-1]) | (records['ts'][1:] != records['ts'][:-1]) |
+                 (records['cat'][1:] != records['cat'][:-1])]
+    records = records[keep]
+    return records['uid'], records['ts'] // NS_PER_SECOND, records['cat']
+
+
+def _gap_seconds(max_gap):
+    if max_gap is None:
+        return None
+    if isinstance(max_gap, (int, float, np.integer, np.floating)):
+        return int(max_gap)
+    return int(pd.Timedelta(max_gap).total_seconds())
+
+
+def _time_keys(db, max_gap):
+    """把 (序列号, 时间) 编码为单调递增的整数键：同一序列内 key 之差等于时间差，
+    且任意事件的 key 加上 max_gap 后不会越过下一个序列的起点"""
+    first = np.repeat(np.asarray(db.times)[db.offsets[:-1]], np.diff(db.offsets))
+    relative = np.asarray(db.times) - first
+    stride = int(relative.max(initial=0)) + (max_gap or 0) + 1
+    if len(db) * stride >= 2 ** 62:
+        raise ValueError(f"时间跨度过大，无法编码 {len(db)} 个序列（max_gap={max_gap} 秒）")
+    return np.asarray(db.sids, dtype=np.int64) * stride + relative
+
+
+def _ranges(starts, lengths):
+    # 把若干区间 [start, start + length) 展开为一个位置数组
+    total = int(lengths.sum())
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(total, dtype=np.int64) + shifts
+
+
+def _group_extensions(db, positions, min_count, all_occurrences):
+    """按项分组候选位置，产出 (项, 支持的序列数, 新的投影位置)
+
+    投影只记录前缀最后一个元素的匹配位置（伪投影）。有最大间隔约束时需要保留所有匹配位置，
+    否则每个序列只保留最早的一个。
+    """
+    if not len(positions):
+        return
+    items, sids = np.asarray(db.items[positions]), np.asarray(db.sids[positions])
+    order = np.lexsort((positions, items))
+    positions, items, sids = positions[order], items[order], sids[order]
+    first = np.r_[True, (items[1:] != items[:-1]) | (sids[1:] != sids[:-1])]
+    supports = np.bincount(items[first], minlength=len(db.labels))
+    bounds = np.searchsorted(items, np.arange(len(supports) + 1))
+    for item in np.flatnonzero(supports >= min_count):
+        group = slice(bounds[item], bounds[item + 1])
+        projected = positions[group] if all_occurrences else positions[group][first[group]]
+        yield int(item), int(supports[item]), projected
+
+
+def _next_positions(db, keys, positions, max_gap):
+    # 每个匹配位置之后（时间严格更晚、且不超过最大间隔）的候选位置
+    starts = np.searchsorted(keys, keys[positions], side='right')
+    if max_gap is None:
+        ends = db.offsets[np.asarray(db.sids[positions]) + 1]
+    else:
+        ends = np.searchsorted(keys, keys[positions] + max_gap, side='right')
+    candidates = _ranges(starts, np.maximum(ends - starts, 0))
+    # 有间隔约束时同一序列的多个窗口会重叠
+    return np.unique(candidates) if max_gap is not None else candidates
+
+
+def _grow(db, keys, prefix, positions, count, min_count, max_len, max_gap, patterns):
+    patterns.append((prefix, count))
+    if max_len is not None and len(prefix) >= max_len:
+        return
+    candidates = _next_positions(db, keys, positions, max_gap)
+    for item, n, projected in _group_extensions(db, candidates, min_count, max_gap is not None):
+        _grow(db, keys, prefix + (item,), projected, n, min_count, max_len, max_gap, patterns)
+
+
+def _mine_first_item(source, min_count, max_len, max_gap, first_item):
+    """挖掘以 first_item 开头的全部序列模式；source 为 SequenceDatabase 或其 save() 目录"""
+    if isinstance(source, str):
+        db = SequenceDatabase.load(source)
+        keys = np.load(os.path.join(source, 'keys.npy'), mmap_mode='r')
+    else:
+        db, keys = source
+    positions = np.flatnonzero(np.asarray(db.items) == first_item)
+    sids = np.asarray(db.sids[positions])
+    first = np.r_[True, sids[1:] != sids[:-1]] if len(sids) else np.zeros(0, dtype=bool)
+    if max_gap is None:
+        positions = positions[first]
+    patterns = []
+    _grow(db, keys, (first_item,), positions, int(first.sum()), min_count, max_len, max_gap, patterns)
+    return patterns
+
+
+def prefixspan(db, min_support, max_len=None, max_gap=None, top_k=None, min_len=1, n_workers=1, work_dir=None):
+    """PrefixSpan 序列模式挖掘（伪投影）
+
+    模式是按时间先后出现的项序列（不要求相邻），支持度为包含该模式的序列（用户）比例。
+    max_gap 限制模式中相邻两步的最大时间间隔（秒数或 pandas 可解析的时间长度，如 '30D'）。
+    按首项把搜索树切分为独立的子任务并行执行。返回长度不小于 min_len 的模式，按支持度降序排列，
+    列为 pattern / length / count / support；top_k 不为 None 时只保留前 top_k 个。
+    """
+    max_gap = _gap_seconds(max_gap)
+    n_sequences = len(db)
+    columns = ['pattern', 'length', 'count', 'support']
+    if not n_sequences:
+        return pd.DataFrame(columns=columns)
+    min_count = min_support_count(min_support, n_sequences)
+    keys = _time_keys(db, max_gap)
+
+    # 首项的支持度：每个序列中出现过的不同项
+    pairs = np.unique(np.asarray(db.sids, dtype=np.int64) * len(db.labels) + np.asarray(db.items))
+    first_supports = np.bincount(pairs % len(db.labels), minlength=len(db.labels))
+    first_items = [int(i) for i in np.argsort(-first_supports, kind='stable') if first_supports[i] >= min_count]
+
+    temp_dir = None
+    try:
+        if n_workers is not None and n_workers > 1 and len(first_items) > 1:
+            # 子任务以内存映射方式共享同一份数据库，不随任务复制
+            temp_dir = tempfile.mkdtemp(prefix='prefixspan_', dir=work_dir)
+            db.save(temp_dir)
+            np.save(os.path.join(temp_dir, 'keys.npy'), keys)
+            source = temp_dir
+        else:
+            source = (db, keys)
+        patterns = [p for subtree in map_partitions(partial(_mine_first_item, source, min_count, max_len, max_gap),
+                                                    first_items, n_workers)
+                    for p in subtree]
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    # 支持度降序，相同时短模式在前、再按项编码排列，结果与并行方式无关
+    patterns = [(p, n) for p, n in patterns if len(p) >= min_len]
+    patterns.sort(key=lambda x: (-x[1], len(x[0]), x[0]))
+    if top_k is not None:
+        patterns = patterns[:top_k]
+    return pd.DataFrame({
+        'pattern': pd.Series([tuple(db.labels[i] for i in p) for p, _ in patterns], dtype=object),
+        'length': np.array([len(p) for p, _ in patterns], dtype=np.int64),
+        'count': np.array([n for _, n in patterns], dtype=np.int64),
+        'support': np.array([n for _, n in patterns], dtype=np.int64) / n_sequences,
+    }, columns=columns)
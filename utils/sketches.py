@@ -0,0 +1,202 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# 所有草图都可以逐块 update()、可以 pickle，并且 merge() 满足结合律，
+# 因此可以按文件并行构建后再合并成整个数据集的摘要。
+
+
+def hash_values(values):
+    """稳定的 64 位哈希（与进程、运行无关），缺失值应在调用前去掉"""
+    return pd.util.hash_array(np.asarray(values))
+
+
+def _bit_length(x):
+    # uint64 数组逐元素的二进制位数
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计，2^p 个寄存器，相对误差约 1.04 / sqrt(2^p)"""
+
+    def __init__(self, p=14):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values):
+        if not len(values):
+            return self
+        hashes = hash_values(values)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # 剩余位中第一个 1 的位置（从 1 开始计）
+        rank = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError(f"HyperLogLog 精度不一致: {self.p} != {other.p}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # 小基数时用线性计数
+            return m * math.log(m / zeros)
+        return float(raw)
+
+
+class KLLSketch:
+    """KLL 分位数草图
+
+    第 h 层的每个元素代表 2^h 个原始值；总元素数超过总容量时，把最低的满层排序后
+    隔一个取一个（起点随机）升到上一层。容量自顶层 k 起逐层乘 2/3 递减，秩误差约 O(1/k)。
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.zeros(0, dtype=np.float64)]
+        self.rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        # 总元素数超过总容量时压缩最低的满层，直到回到容量以内
+        while sum(len(items) for items in self.levels) > \
+                sum(self._capacity(level) for level in range(len(self.levels))):
+            level = next(h for h, items in enumerate(self.levels) if len(items) >= self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.zeros(0, dtype=np.float64))
+            items = np.sort(self.levels[level])
+            # 元素个数为奇数时留下一个，保证总权重不变
+            keep = items[-1:] if len(items) % 2 else items[:0]
+            pairs = items[:len(items) - len(keep)]
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1],
+                                                     pairs[int(self.rng.integers(2))::2]])
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0, dtype=np.float64))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        """近似分位数，qs 为 [0, 1] 内的数组；草图为空时返回 NaN"""
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        items = np.concatenate(self.levels)
+        if not len(items):
+            return np.full(len(qs), np.nan)
+        weights = np.concatenate([np.full(len(items), 1 << level, dtype=np.float64)
+                                  for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        ranks = qs * cumulative[-1]
+        return items[np.minimum(np.searchsorted(cumulative, ranks, side='left'), len(items) - 1)]
+
+
+class MisraGries:
+    """Misra-Gries 频繁项：最多保留 k 个计数器，任一取值的计数低估不超过 n / (k + 1)"""
+
+    def __init__(self, k=20):
+        self.k = k
+        self.count = 0
+        self.counters = pd.Series(dtype='int64')
+
+    def _prune(self, counters):
+        if len(counters) > self.k:
+            # 所有计数减去第 k+1 大的计数，只保留仍为正的项（可合并的 Misra-Gries）
+            threshold = counters.nlargest(self.k + 1).iloc[-1]
+            counters = counters - threshold
+            counters = counters[counters > 0]
+        return counters
+
+    def update(self, values):
+        values = pd.Series(values, dtype=object).dropna()
+        if values.empty:
+            return self
+        self.count += len(values)
+        batch = values.value_counts()
+        self.counters = self._prune(self.counters.add(batch, fill_value=0).astype('int64'))
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        self.counters = self._prune(self.counters.add(other.counters, fill_value=0).astype('int64'))
+        return self
+
+    def top(self, n=None):
+        """按计数降序返回 (取值, 计数下界) 的 Series"""
+        top = self.counters.sort_values(ascending=False, kind='stable')
+        return top if n is None else top.head(n)
+
+
+def exact_quantile(chunks, q, k=200):
+    """流式计算精确分位数，结果与 pandas Series.quantile(q)（线性插值）一致
+
+    chunks 为无参可调用对象，每次调用返回一个新的数值数组迭代器（数据会被读取两遍）。
+    第一遍用 KLL 草图估计目标秩附近的取值区间，第二遍只统计区间以下的个数并收集区间内的值，
+    再在区间内精确定位；区间估计落空时放宽到一侧无界后重试。内存只与区间大小有关。
+    """
+    sketch = KLLSketch(k)
+    n = 0
+    for values in chunks():
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        n += len(values)
+        sketch.update(values)
+    if n == 0:
+        return np.nan
+
+    position = (n - 1) * q
+    lower = int(math.floor(position))
+    upper = min(lower + 1, n - 1)
+    # KLL 的秩误差约为 n / k，两侧各留出若干倍余量
+    margin = 4 * n / k + 1
+    lo, hi = sketch.quantiles([max(0.0, (lower - margin) / n), min(1.0, (upper + margin) / n)])
+    while True:
+        below, window = 0, []
+        for values in chunks():
+            values = np.asarray(values, dtype=np.float64)
+            values = values[~np.isnan(values)]
+            below += int(np.count_nonzero(values < lo))
+            window.append(values[(values >= lo) & (values <= hi)])
+        window = np.sort(np.concatenate(window))
+        if below <= lower and below + len(window) > upper:
+            break
+        if below > lower:
+            lo = -np.inf
+        if below + len(window) <= upper:
+            hi = np.inf
+
+    pair = window[[lower - below, upper - below]]
+    # 与 numpy 的线性插值使用同一套浮点运算
+    return float(np.quantile(pair, position - lower))
@@ -0,0 +1,310 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import traceback
+import uuid
+
+import numpy as np
+
+from utils.basket_encoding import encode_baskets, itemset_mask, support_counts
+from utils.catalog_index import load_catalog_index
+from utils.instrumentation import count, stage
+from utils.itemset_mining import _to_frame, mine_frequent_itemsets, min_support_count
+from utils.mining_consumers import CategoryBasketConsumer, PaymentBasketConsumer, RefundBasketConsumer
+from utils.parallel import list_partitions, map_partitions
+from utils.parquet_reader import DEFAULT_MEMORY_BUDGET_MB
+from utils.scan_pipeline import ScanPipeline
+
+# SON 两阶段挖掘（Savasere, Omiecinski, Navathe）：
+#   阶段 1 每个分片以相同的相对阈值挖掘局部频繁项集，全局频繁的项集至少在一个分片中局部频繁；
+#   阶段 2 在每个分片上统计全部候选（各分片局部频繁项集的并集）的次数，求和后按全局阈值筛选。
+# 任务与结果都是 JSON，可以在本机进程池、共享目录（文件队列）或 TCP 连接上传递。
+
+# 分片上收集购物篮的消费者
+MINERS = {
+    'category': CategoryBasketConsumer,
+    'payment': PaymentBasketConsumer,
+    'refund': RefundBasketConsumer,
+}
+
+_catalogs = {}
+
+
+def make_shards(source, n_shards, partition_by='file', prefix=None):
+    """把数据的分区连续地切成 n_shards 个分片，每个分片的分区数尽量相同"""
+    partitions = list_partitions(source, by=partition_by, prefix=prefix)
+    bounds = np.linspace(0, len(partitions), max(n_shards, 1) + 1).round().astype(int)
+    return [partitions[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def _catalog(catalog_path):
+    # 工作进程处理多个任务时只加载一次商品目录
+    if catalog_path not in _catalogs:
+        _catalogs[catalog_path] = load_catalog_index(catalog_path)
+    return _catalogs[catalog_path]
+
+
+def scan_shard(task, n_workers=1):
+    """扫描一个分片，返回 {购物篮: 次数}；指定 checkpoint_dir 时阶段 2 直接读取阶段 1 的检查点
+
+    各分片的任务可能同时在不同进程中执行，每个分片使用 checkpoint_dir 下单独的子目录（shard-<序号>），
+    各自的清单只由处理该分片的进程写入。
+    """
+    consumer = MINERS[task['miner']](_catalog(task['catalog_path']))
+    pipeline = ScanPipeline(memory_budget_mb=task.get('memory_budget_mb', DEFAULT_MEMORY_BUDGET_MB))
+    pipeline.register('baskets', consumer)
+    partitions = [(file_path, row_groups) for file_path, row_groups in task['partitions']]
+    checkpoint_dir = task.get('checkpoint_dir')
+    if checkpoint_dir is not None:
+        checkpoint_dir = os.path.join(checkpoint_dir, f"shard-{task['shard']}")
+    baskets = pipeline.run(None, n_workers=n_workers, checkpoint_dir=checkpoint_dir,
+                           partitions=partitions)['baskets']
+    # PaymentBasketConsumer 的结果为 (购物篮, 高价值商品支付方式)
+    return baskets[0] if isinstance(baskets, tuple) else baskets
+
+
+def run_task(task, n_workers=1):
+    """执行一个 SON 任务：phase 为 'local' 时挖掘分片的局部频繁项集，为 'count' 时统计候选在分片上的次数"""
+    baskets = scan_shard(task, n_workers)
+    masks, counts, items = encode_baskets(baskets)
+    n = int(counts.sum())
+    if task['phase'] == 'local':
+        candidates = []
+        if n:
+            local = mine_frequent_itemsets(masks, counts, items, min_support=task['min_support'],
+                                           algorithm=task.get('algorithm', 'bitset'), use_colnames=True,
+                                           max_len=task.get('max_len'))
+            candidates = [sorted(itemset) for itemset in local['itemsets']]
+        return {'shard': task['shard'], 'n': n, 'candidates': candidates}
+    if task['phase'] == 'count':
+        # 含分片中未出现的项的候选次数为 0
+        index_of = {item: i for i, item in enumerate(items)}
+        present = [all(item in index_of for item in c) for c in task['candidates']]
+        found = support_counts(masks, counts, [itemset_mask(index_of[item] for item in c)
+                                               for c, ok in zip(task['candidates'], present) if ok])
+        candidate_counts = np.zeros(len(present), dtype=np.int64)
+        candidate_counts[np.flatnonzero(present)] = found
+        return {'shard': task['shard'], 'n': n, 'counts': candidate_counts.tolist()}
+    raise ValueError(f"未知的 SON 任务阶段: {task['phase']}")
+
+
+def _error_result(task):
+    return {'shard': task.get('shard'), 'error': traceback.format_exc()}
+
+
+def _check(results):
+    for result in results:
+        if 'error' in result:
+            raise RuntimeError(f"分片 {result['shard']} 的任务失败:\n{result['error']}")
+    return results
+
+
+class LocalTransport:
+    """在本机进程池中执行任务（每个分片一个任务，分片内串行扫描）"""
+
+    def __init__(self, n_workers=None):
+        self.n_workers = n_workers
+
+    def map(self, tasks):
+        return _check(list(map_partitions(run_task, tasks, self.n_workers)))
+
+
+class FileTransport:
+    """通过共享目录传递任务：协调者写入 pending/，工作进程把任务改名到 claimed/ 认领，结果写入 done/
+
+    目录可以位于多台机器共同挂载的文件系统上；改名是原子操作，同一任务只会被一个工作进程认领。
+    """
+
+    def __init__(self, queue_dir, poll_interval=0.5, timeout=None):
+        self.queue_dir = queue_dir
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        for sub in ('pending', 'claimed', 'done'):
+            os.makedirs(os.path.join(queue_dir, sub), exist_ok=True)
+
+    def map(self, tasks):
+        job = uuid.uuid4().hex[:12]
+        names = [f'{job}-{i:05d}.json' for i in range(len(tasks))]
+        for name, task in zip(names, tasks):
+            _write_json(os.path.join(self.queue_dir, 'pending', name), task)
+
+        results, start = {}, time.monotonic()
+        while len(results) < len(names):
+            for name in names:
+                path = os.path.join(self.queue_dir, 'done', name)
+                if name not in results and os.path.exists(path):
+                    with open(path, encoding='utf-8') as f:
+                        results[name] = json.load(f)
+                    os.remove(path)
+            if len(results) < len(names):
+                if self.timeout is not None and time.monotonic() - start > self.timeout:
+                    raise TimeoutError(f"等待 SON 任务超时：{len(names) - len(results)} 个任务未完成（{self.queue_dir}）")
+                time.sleep(self.poll_interval)
+        return _check([results[name] for name in names])
+
+
+def _write_json(path, obj):
+    # 先写临时文件再改名，读取方不会看到写了一半的文件
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def file_worker(queue_dir, n_workers=1, poll_interval=0.5, max_idle=None):
+    """文件队列的工作进程：循环认领 pending/ 中的任务；空闲超过 max_idle 秒后退出（None 表示一直运行）"""
+    pending, claimed, done = (os.path.join(queue_dir, sub) for sub in ('pending', 'claimed', 'done'))
+    for path in (pending, claimed, done):
+        os.makedirs(path, exist_ok=True)
+    idle_since = time.monotonic()
+    while max_idle is None or time.monotonic() - idle_since <= max_idle:
+        names = sorted(name for name in os.listdir(pending) if name.endswith('.json'))
+        for name in names:
+            try:
+                os.rename(os.path.join(pending, name), os.path.join(claimed, name))
+            except FileNotFoundError:
+                continue  # 已被其他工作进程认领
+            with open(os.path.join(claimed, name), encoding='utf-8') as f:
+                task = json.load(f)
+            try:
+                result = run_task(task, n_workers)
+            except Exception:
+                result = _error_result(task)
+            _write_json(os.path.join(done, name), result)
+            os.remove(os.path.join(claimed, name))
+            idle_since = time.monotonic()
+            break
+        else:
+            time.sleep(poll_interval)
+
+
+def _send(sock, obj):
+    payload = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    sock.sendall(struct.pack('>Q', len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv(sock):
+    size, = struct.unpack('>Q', _recv_exact(sock, 8))
+    return json.loads(_recv_exact(sock, size).decode('utf-8'))
+
+
+class SocketTransport:
+    """通过 TCP 把任务发给常驻的工作进程（见 serve），消息为 8 字节长度 + UTF-8 JSON
+
+    第 i 个分片固定发给第 i % len(addresses) 个工作进程，两个阶段落在同一台机器上，
+    阶段 2 可以读取该机器上阶段 1 留下的检查点。
+    """
+
+    def __init__(self, addresses, timeout=None):
+        self.addresses = [tuple(address) for address in addresses]
+        self.timeout = timeout
+
+    def _run_worker(self, address, assigned, tasks, results):
+        with socket.create_connection(address, timeout=self.timeout) as sock:
+            for i in assigned:
+                _send(sock, tasks[i])
+                results[i] = _recv(sock)
+
+    def map(self, tasks):
+        results = [None] * len(tasks)
+        errors = []
+
+        def target(k, address):
+            try:
+                self._run_worker(address, range(k, len(tasks), len(self.addresses)), tasks, results)
+            except OSError as e:
+                errors.append(f"{address[0]}:{address[1]}: {e}")
+
+        threads = [threading.Thread(target=target, args=(k, address)) for k, address in enumerate(self.addresses)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise ConnectionError("SON 工作进程连接失败: " + '; '.join(errors))
+        return _check(results)
+
+
+class _TaskHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                task = _recv(self.request)
+            except ConnectionError:
+                return
+            try:
+                result = run_task(task, self.server.n_workers)
+            except Exception:
+                result = _error_result(task)
+            _send(self.request, result)
+
+
+class _TaskServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(host='0.0.0.0', port=8765, n_workers=1):
+    """启动 socket 工作进程，直到被中断"""
+    with _TaskServer((host, port), _TaskHandler) as server:
+        server.n_workers = n_workers
+        print(f"🛰️ SON 工作进程监听 {host}:{port}")
+        server.serve_forever()
+
+
+def son_frequent_itemsets(shards, min_support, transport, miner='category', catalog_path='./product_catalog.json',
+                          algorithm='bitset', max_len=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                          checkpoint_dir=None):
+    """SON 分片挖掘，输出与在全部数据上运行 mine_frequent_itemsets(use_colnames=True) 相同
+
+    shards 为 make_shards 的结果；分区路径需在工作进程所在机器上可以访问。
+    """
+    base = {'miner': miner, 'catalog_path': catalog_path, 'memory_budget_mb': memory_budget_mb,
+            'checkpoint_dir': checkpoint_dir}
+    with stage('local'):
+        local = transport.map([dict(base, phase='local', shard=i, partitions=shard, min_support=min_support,
+                                    algorithm=algorithm, max_len=max_len) for i, shard in enumerate(shards)])
+    candidates = sorted({tuple(c) for result in local for c in result['candidates']}, key=lambda c: (len(c), c))
+    count('son.candidates', len(candidates))
+
+    with stage('count'):
+        counted = transport.map([dict(base, phase='count', shard=i, partitions=shard, candidates=candidates)
+                                 for i, shard in enumerate(shards)]) if candidates else []
+    n_rows = sum(result['n'] for result in local)
+    totals = np.sum([result['counts'] for result in counted], axis=0, dtype=np.int64) if counted \
+        else np.zeros(0, dtype=np.int64)
+
+    # 项按名称排序（与 encode_baskets 一致），输出顺序与单机挖掘相同
+    min_count = min_support_count(min_support, n_rows) if n_rows else 1
+    frequent = [(c, int(n)) for c, n in zip(candidates, totals) if n >= min_count]
+    items = sorted({item for c, _ in frequent for item in c})
+    index_of = {item: i for i, item in enumerate(items)}
+    itemset_counts = {tuple(sorted(index_of[item] for item in c)): n for c, n in frequent}
+    print(f"🧩 SON: {len(shards)} 个分片，{n_rows} 笔交易，候选 {len(candidates)} 个，频繁项集 {len(frequent)} 个")
+    return _to_frame(itemset_counts, items, max(n_rows, 1), use_colnames=True)
+
+
+def make_transport(kind, n_workers=None, queue_dir='./son_queue', addresses=(), timeout=None):
+    """按名称创建传输方式：'local'（本机进程池）、'file'（共享目录队列）或 'socket'（TCP 工作进程）"""
+    if kind == 'local':
+        return LocalTransport(n_workers)
+    if kind == 'file':
+        return FileTransport(queue_dir, timeout=timeout)
+    if kind == 'socket':
+        return SocketTransport(addresses, timeout=timeout)
+    raise ValueError(f"未知的 SON 传输方式: {kind}")
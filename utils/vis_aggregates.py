@@ -0,0 +1,211 @@
+import math
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.parallel import list_partitions, map_partitions
+from utils.parquet_reader import (DEFAULT_MEMORY_BUDGET_MB, iter_batches, iter_frames, resolve_sources,
+                                  statistics_range)
+from utils.sketches import KLLSketch
+
+# 仪表盘用到的列
+NUMERIC_COLUMNS = ('age', 'income')
+CATEGORICAL_COLUMNS = ('gender', 'country', 'is_active')
+DATE_COLUMN = 'registration_date'
+
+# 展示用直方图的箱数，以及计算 KDE 的细网格箱数
+HIST_BINS = 30
+KDE_GRID = 1024
+
+
+def _statistics_range(file_path, column):
+    # 从 parquet row group 的 min/max 统计读取取值范围，任一 row group 缺少统计时返回 None
+    bounds = statistics_range(pq.ParquetFile(file_path), column)
+    if bounds is None:
+        return None
+    lo, hi = bounds
+    return (math.inf, -math.inf) if lo is None else (float(lo), float(hi))
+
+
+def numeric_ranges(source, columns=NUMERIC_COLUMNS, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+    """{列名: (最小值, 最大值)}，优先使用 parquet 元数据，缺少统计的列再单独扫描一遍该列"""
+    ranges = {}
+    files = resolve_sources(source)
+    for column in columns:
+        lo, hi = math.inf, -math.inf
+        for file_path in files:
+            bounds = _statistics_range(file_path, column)
+            if bounds is None:
+                for batch in iter_batches(file_path, columns=[column], memory_budget_mb=memory_budget_mb):
+                    values = pc.min_max(batch.column(0))
+                    if values['min'].is_valid:
+                        lo, hi = min(lo, values['min'].as_py()), max(hi, values['max'].as_py())
+            else:
+                lo, hi = min(lo, bounds[0]), max(hi, bounds[1])
+        ranges[column] = (lo, hi) if lo <= hi else (0.0, 1.0)
+    return ranges
+
+
+class NumericSummary:
+    """数值列的可合并聚合：展示用直方图、KDE 细网格计数、均值 / 方差和 KLL 分位数"""
+
+    def __init__(self, value_range, bins=HIST_BINS, grid=KDE_GRID):
+        self.edges = np.histogram_bin_edges(np.zeros(0), bins=bins, range=value_range)
+        self.grid_edges = np.histogram_bin_edges(np.zeros(0), bins=grid, range=value_range)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.grid_counts = np.zeros(grid, dtype=np.int64)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = KLLSketch()
+
+    def _combine_moments(self, n, mean, m2):
+        # Chan 等人的并行方差合并公式
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.n * n / total
+        self.n = total
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.counts += np.histogram(values, bins=self.edges)[0]
+        self.grid_counts += np.histogram(values, bins=self.grid_edges)[0]
+        mean = values.mean()
+        self._combine_moments(len(values), mean, float(np.sum((values - mean) ** 2)))
+        self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+        self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        if other.n:
+            self.counts += other.counts
+            self.grid_counts += other.grid_counts
+            self._combine_moments(other.n, other.mean, other.m2)
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+            self.sketch.merge(other.sketch)
+        return self
+
+    def kde(self):
+        """细网格上的高斯 KDE（Scott 带宽），用 FFT 卷积计算，返回 (网格中心, 计数尺度的密度)
+
+        与 seaborn histplot(kde=True) 一样只在数据范围内求值，并按展示直方图的箱宽换算到计数。
+        """
+        centers = (self.grid_edges[:-1] + self.grid_edges[1:]) / 2
+        if self.n < 2 or self.m2 <= 0:
+            return centers, np.zeros(len(centers))
+        step = self.grid_edges[1] - self.grid_edges[0]
+        bandwidth = math.sqrt(self.m2 / (self.n - 1)) * self.n ** (-1 / 5)
+        offsets = np.arange(-len(centers) + 1, len(centers)) * step
+        kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * math.sqrt(2 * math.pi))
+        # 补零后做线性卷积，避免循环卷积的首尾混叠
+        size = len(self.grid_counts) + len(kernel) - 1
+        fft_size = 1 << (size - 1).bit_length()
+        density = np.fft.irfft(np.fft.rfft(self.grid_counts, fft_size) * np.fft.rfft(kernel, fft_size), fft_size)
+        density = density[len(centers) - 1:2 * len(centers) - 1]
+        return centers, np.clip(density, 0, None) * (self.edges[1] - self.edges[0])
+
+    def box_stats(self, label=''):
+        """matplotlib bxp 所需的箱线图统计：四分位数来自 KLL 草图，须端为 1.5 IQR 内的最远取值"""
+        if not self.n:
+            return {'label': label, 'q1': np.nan, 'med': np.nan, 'q3': np.nan,
+                    'whislo': np.nan, 'whishi': np.nan, 'fliers': np.zeros(0)}
+        q1, med, q3 = self.sketch.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        lo_fence, hi_fence = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+        items = np.unique(np.concatenate(self.sketch.levels))
+        inside = items[(items >= lo_fence) & (items <= hi_fence)]
+        # 最值精确已知：落在须内时直接作为须端，否则取草图中须内的最远元素
+        whislo = self.min if self.min >= lo_fence else (inside.min() if len(inside) else q1)
+        whishi = self.max if self.max <= hi_fence else (inside.max() if len(inside) else q3)
+        # 离群点只展示草图中保留的元素及精确最值
+        fliers = items[(items < lo_fence) | (items > hi_fence)]
+        fliers = np.unique(np.concatenate([fliers, [v for v in (self.min, self.max)
+                                                    if v < lo_fence or v > hi_fence]]))
+        return {'label': label, 'q1': q1, 'med': med, 'q3': q3, 'whislo': whislo, 'whishi': whishi,
+                'fliers': fliers}
+
+
+def _value_counts(values):
+    # 紧凑加载的 Categorical 列：去掉未出现的类别，索引转为普通 Index，与 object 列的结果一致
+    counts = values.value_counts()
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        counts = counts[counts > 0]
+        counts.index = pd.Index(np.asarray(counts.index), name=counts.index.name)
+    return counts
+
+
+def _add_counts(total, counts):
+    return counts if total is None else total.add(counts, fill_value=0).astype('int64')
+
+
+class DashboardAggregates:
+    """可视化仪表盘所需的全部聚合结果，按块 update、按分区 merge"""
+
+    def __init__(self, ranges):
+        self.numeric = {column: NumericSummary(ranges[column]) for column in NUMERIC_COLUMNS}
+        self.categorical = {column: None for column in CATEGORICAL_COLUMNS}
+        self.monthly_registrations = None
+
+    def update(self, df):
+        for column, summary in self.numeric.items():
+            summary.update(df[column].to_numpy(dtype=np.float64, na_value=np.nan))
+        for column in CATEGORICAL_COLUMNS:
+            self.categorical[column] = _add_counts(self.categorical[column], _value_counts(df[column]))
+        months = pd.to_datetime(df[DATE_COLUMN], errors='coerce').dt.to_period('M').value_counts()
+        self.monthly_registrations = _add_counts(self.monthly_registrations, months)
+        return self
+
+    def merge(self, other):
+        for column, summary in self.numeric.items():
+            summary.merge(other.numeric[column])
+        for column in CATEGORICAL_COLUMNS:
+            if other.categorical[column] is not None:
+                self.categorical[column] = _add_counts(self.categorical[column], other.categorical[column])
+        if other.monthly_registrations is not None:
+            self.monthly_registrations = _add_counts(self.monthly_registrations, other.monthly_registrations)
+        return self
+
+    def value_counts(self, column):
+        """与 Series.value_counts() 相同：按计数降序"""
+        counts = self.categorical[column]
+        if counts is None:
+            return pd.Series(dtype='int64')
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def registration_counts(self):
+        if self.monthly_registrations is None:
+            return pd.Series(dtype='int64')
+        return self.monthly_registrations.sort_index()
+
+
+def _aggregate_partition(partition, ranges, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, compact=False):
+    file_path, row_groups = partition
+    columns = list(NUMERIC_COLUMNS) + list(CATEGORICAL_COLUMNS) + [DATE_COLUMN]
+    aggregates = DashboardAggregates(ranges)
+    for df in iter_frames(file_path, columns=columns, memory_budget_mb=memory_budget_mb, row_groups=row_groups,
+                          compact=compact):
+        aggregates.update(df)
+    return aggregates
+
+
+def aggregate_dashboard(source, n_workers=None, partition_by='file', memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                        compact=False):
+    """一次并行分块扫描得到仪表盘的全部聚合；直方图范围取自 parquet 元数据中的 min/max 统计
+
+    compact 时以紧凑类型读取（见 utils.parquet_reader.iter_frames），聚合结果不变。
+    """
+    ranges = numeric_ranges(source, memory_budget_mb=memory_budget_mb)
+    worker = partial(_aggregate_partition, ranges=ranges, memory_budget_mb=memory_budget_mb, compact=compact)
+    total = DashboardAggregates(ranges)
+    for partial_aggregates in map_partitions(worker, list_partitions(source, by=partition_by), n_workers):
+        total.merge(partial_aggregates)
+    return total